@@ -0,0 +1,289 @@
+import asyncio
+import datetime
+import json
+import logging
+import time
+
+import aiohttp
+
+from acdhQos.backend import RecordCreationFailed, RecordDuplicated, RecordError, RecordNotFound, RedmineBase, RedmineRecordBase
+from acdhQos.interface import *
+from acdhQos.metadata_cache import CUSTOM_FIELDS, ENV_TYPES
+
+
+class AsyncResponse:
+    """Fully read aiohttp response exposing the parts of requests.Response the backend relies on."""
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncRedmine(RedmineBase):
+    """asyncio Redmine backend with a pooled aiohttp session and a non-blocking request throttle.
+
+    Use as an async context manager (or call open()/close()); every method doing I/O is a coroutine.
+    """
+
+    def __init__(self, baseUrl, auth=None, api_key=None, logIssueId=None, defTrackerId=7, defProjectId=164, defStatus=1, defPrority=2, inContainerAppCategory=52, updateDatePolicy='always', metadataCache=None, requestInterval=1.0, maxConnections=4, timeout=60):
+        self.baseUrl = baseUrl.rstrip('/')
+        self.api_key = api_key
+        self.username = None
+        self.password = None
+        if auth is not None:
+            self.username, self.password = auth
+
+        self.logIssueId = logIssueId
+        self.defaultTrackerId = defTrackerId
+        self.defaultProjectId = defProjectId
+        self.defaultStatus = defStatus
+        self.defaultPrority = defPrority
+        self.inContainerAppCategory = inContainerAppCategory
+        self._setUpdateDatePolicy(updateDatePolicy)
+        self.metadataCache = metadataCache
+        self.maxConnections = maxConnections
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._min_interval = requestInterval
+        self._last_request_time = 0.0
+        self._throttleLock = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def open(self):
+        """Create the connection pool and load custom fields and environment types."""
+        headers = {"User-Agent": "ACDH-QoS-Redmine/1.0"}
+        auth = None
+        # Authentication priority: API key takes precedence over Basic Auth
+        if self.api_key:
+            headers["X-Redmine-API-Key"] = self.api_key
+        elif self.username is not None:
+            auth = aiohttp.BasicAuth(self.username, self.password or '')
+
+        self._throttleLock = asyncio.Lock()
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.maxConnections),
+            headers=headers,
+            auth=auth,
+            timeout=self._timeout,
+            cookie_jar=aiohttp.CookieJar(unsafe=True),
+        )
+        try:
+            await self._loadMetadata()
+        except Exception:
+            await self.close()
+            raise
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _loadMetadata(self):
+        # custom fields
+        customFields = self._cachedMetadata(CUSTOM_FIELDS)
+        if customFields is None:
+            resp = await self._send('get', self.baseUrl + '/custom_fields.json')
+            if resp is None or resp.status_code != 200:
+                auth_method = 'API key' if self.api_key else 'Basic Auth'
+                raise Exception(f'Failed to load Redmine custom fields (using {auth_method})')
+            customFields = resp.json()
+            self._cacheMetadata(CUSTOM_FIELDS, customFields)
+        self._setCustomFields(customFields)
+
+        # environment types
+        envTypes = self._cachedMetadata(ENV_TYPES)
+        if envTypes is None:
+            envTypes = []
+            offset = 0
+            while offset is not None:
+                resp = await self._send('get', self.baseUrl + '/issues.json', params=self._envTypesPageParams(offset))
+                if resp is None or resp.status_code != 200:
+                    raise Exception('Failed to load Redmine environment types')
+                data = resp.json()
+                envTypes += [{'id': i['id'], 'subject': i['subject']} for i in data['issues']]
+                offset = self._nextOffset(data)
+            self._cacheMetadata(ENV_TYPES, envTypes)
+        self._setEnvTypes(envTypes)
+
+    async def prefetchRecords(self):
+        """Load all issues of the service tracker into an index serving findRecord."""
+        self._issueIndex = {}
+        offset = 0
+        while offset is not None:
+            resp = await self._send('get', self.baseUrl + '/issues.json', params=self._issuesPageParams(offset))
+            if resp is None or resp.status_code != 200:
+                logging.warning('[Redmine] Issue prefetch failed, falling back to per-issue lookups')
+                self._issueIndex = None
+                return
+            offset = self._indexIssuesPage(resp.json())
+        logging.info('[Redmine] Prefetched %d issues', len(self._issueIndex))
+
+    async def _throttle(self):
+        async with self._throttleLock:
+            elapsed = time.monotonic() - self._last_request_time
+            if elapsed < self._min_interval:
+                await asyncio.sleep(self._min_interval - elapsed)
+            self._last_request_time = time.monotonic()
+
+    async def _send(self, method, url, **kwargs):
+        await self._throttle()
+        try:
+            async with self.session.request(method.upper(), url, **kwargs) as resp:
+                response = AsyncResponse(resp.status, await resp.text(errors='replace'))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.error(f'[Redmine] {method.upper()} {url} failed: {e}')
+            return None
+        except Exception as e:
+            logging.error(f'[Redmine] unexpected error for {method.upper()} {url}: {e}')
+            return None
+
+        if response.status_code >= 500:
+            logging.warning(f'[Redmine] {method.upper()} {url} returned {response.status_code}')
+
+        return response
+
+    async def begin(self):
+        await self.setupNotifications(False)
+
+    async def end(self, log, procServers, report=None):
+        await self.setupNotifications(True)
+        if self.logIssueId is not None:
+            if report:
+                await self.saveStructuredReport(report)
+            else:
+                await self.saveLog(log, procServers)
+
+    async def saveLog(self, log, procServers):
+        """Save structured QoS report to Redmine log issue."""
+        if self.logIssueId is None:
+            return
+
+        data = {'issue': {
+            'description': self.formatLog(log),
+            'due_date': str(datetime.date.today())
+        }}
+        url = '%s/issues/%s.json' % (self.baseUrl, str(self.logIssueId))
+        resp = await self._send('put', url, json=data)
+        if resp is None or (resp.status_code != 200 and resp.status_code != 204):
+            logging.error('Log issue update failed: %s', resp.text if resp else 'No response')
+
+    async def saveStructuredReport(self, report):
+        """Save structured QoS report to Redmine log issue."""
+        data = {'issue': {'description': self.formatStructuredReport(report)}}
+        resp = await self._send('put', '%s/issues/%d.json' % (self.baseUrl, self.logIssueId), json=data)
+        if resp is None or resp.status_code not in (200, 204):
+            logging.error('Log issue update failed: %s', '%d %s' % (resp.status_code, resp.text) if resp else 'No response')
+
+    async def createRecord(self, data) -> IRecord:
+        reqData = self._createRecordRequest(data)
+        resp = await self._send('post', self.baseUrl + '/issues.json', json=reqData)
+        if resp is None or resp.status_code != 201:
+            raise RecordCreationFailed(reqData, resp)
+
+        respData = resp.json()['issue']
+        self._indexIssue(respData)
+        url = '%s/issues/%s.json' % (self.baseUrl, str(respData['id']))
+        record = AsyncRedmineRecord(url, self, respData)
+        await record.update(data)
+        return record
+
+    async def findRecord(self, data) -> IRecord:
+        url = '%s/issues/%s.json' % (self.baseUrl, str(data['id']))
+        issue = self._indexedIssue(data['id'])
+        if issue is not None:
+            return AsyncRedmineRecord(url, self, issue)
+        resp = await self._send('get', url, params={'include': 'relations'})
+        if resp is None or resp.status_code == 404:
+            raise RecordNotFound()
+        if resp.status_code != 200:
+            raise RecordNotFound(str(resp.status_code) + ' ' + resp.text + ' (ID ' + str(data['id']) + ')')
+        return AsyncRedmineRecord(url, self, resp.json()['issue'])
+
+    async def setupNotifications(self, on):
+        resp = await self._send('get', self.baseUrl + '/login')
+        if resp is None or resp.status_code != 200:
+            logging.error('[Redmine] Unable to load login page for notification setup')
+            return
+
+        authToken = self._loginAuthToken(resp.text)
+        if not self.username or not self.password:
+            raise Exception(
+                'Redmine username and password are required for notification setup. API key authentication is used for API calls, but login/notification setup still requires username/password.'
+            )
+        # the session cookie returned by Redmine is kept by the session's cookie jar
+        if authToken is not None:
+            resp = await self._send(
+                'post',
+                self.baseUrl + '/login',
+                data={'authenticity_token': authToken, 'username': self.username, 'password': self.password},
+            )
+            if resp is None or resp.status_code != 200:
+                logging.error('[Redmine] Login failed during notification setup')
+                return
+
+        resp = await self._send('get', self.baseUrl + '/settings?tab=notifications')
+        if resp is None or resp.status_code != 200:
+            logging.error('[Redmine] Unable to load notification settings page')
+            return
+
+        resp = await self._send(
+            'post',
+            self.baseUrl + '/settings/edit?tab=notifications',
+            data=self._notificationFormData(resp.text, on),
+            headers={'Content-Type': 'application/x-www-form-urlencoded'},
+        )
+        if resp is None or resp.status_code != 200:
+            logging.error(f'setting up Redmine notifications failed with {resp.status_code if resp else "no response"}')
+
+
+class AsyncRedmineRecord(RedmineRecordBase):
+
+    async def update(self, newData):
+        if self.data is None:
+            resp = await self.redmine._send('get', self.url, params={'include': 'relations'})
+            if resp is None or resp.status_code != 200:
+                raise RecordError('Redmine issue %d could not be read' % int(self.id))
+            self.data = resp.json()['issue']
+        self._checkDuplicated(newData)
+
+        # prepare request data
+        relations = []
+
+        if 'inContainerApps' in newData and newData['inContainerApps'] is not None:
+            try:
+                for inId, inCfg in newData['inContainerApps'].items():
+                    try:
+                        app = await self.redmine.findRecord({'id': inId})
+                        relations.append({'id': inId, 'type': 'relates'})
+                        await app.update({'id': inId, 'Service categories': [self.redmine.inContainerAppCategory]})
+                    except RecordNotFound:
+                        logging.error('[%s] Redmine issue %d inContainerApps refers to a non-existing Redmine issue %s' % (newData['server'], self.id, str(inId)))
+                del newData['inContainerApps']
+            except AttributeError:
+                logging.error('[%s] Incorrect inContainerApps in %s' % (newData['server'], json.dumps(newData)))
+
+        reqData = self._updateRequest(newData)
+        if reqData is not None:
+            resp = await self.redmine._send('put', self.url, json={'issue': reqData})
+            if resp is None or (resp.status_code != 200 and resp.status_code != 204):
+                logging.debug(json.dumps({'issue': reqData}))
+                raise RecordError('Redmine issue %d update failed with code %s and response "%s"' % (int(self.id), resp.status_code if resp else 'none', resp.text if resp else ''))
+            self._applyUpdate(reqData)
+
+        relations += self._envTypeRelations(newData)
+        for i in relations:
+            if self._hasRelation(i):
+                continue
+            resp = await self.redmine._send('post', self._relationsUrl(), json={'relation': {'issue_to_id': i['id'], 'relation_type': i['type']}})
+            if resp is not None and resp.status_code == 201:
+                self._addRelation(i)
+            elif resp is not None and resp.status_code == 422:
+                self._logRelationError(newData, i, resp.json()['errors'])
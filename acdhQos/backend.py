@@ -8,8 +8,13 @@ import requests
 from requests.exceptions import RequestException
 
 from acdhQos.interface import *
+from acdhQos.metadata_cache import CUSTOM_FIELDS, ENV_TYPES
 from acdhQos.redmine_helpers import format_container_description_textile
 
+# "always" refreshes qos_update_date on every run (a date-only PUT for unchanged issues),
+# "on_change" only sets it together with other changes
+UPDATE_DATE_POLICIES = ('always', 'on_change')
+
 
 class RecordNotFound(Exception):
     pass
@@ -35,7 +40,8 @@ class RecordDuplicated(Exception):
 class RecordError(Exception):
     pass
 
-class Redmine(IBackend):
+class RedmineBase(IBackend):
+    """Transport-independent Redmine logic shared by the sync and async backends."""
     customFields = None
     envTypes = None
     logIssueId = None
@@ -47,91 +53,71 @@ class Redmine(IBackend):
     baseUrl = None
     session = None
     api_key = None
+    issuesPageSize = 100
+    updateDatePolicy = 'always'
+    metadataCache = None
+    _issueIndex = None
+    _claims = None
 
-    def __init__(self, baseUrl, auth=None, api_key=None, logIssueId=None, defTrackerId=7, defProjectId=164, defStatus=1, defPrority=2, inContainerAppCategory=52):
-        # Normalize base URL by stripping trailing slash
-        self.baseUrl = baseUrl.rstrip('/')
-        self.api_key = api_key
-        self.session = requests.Session()
-        self.session.headers.update({"User-Agent": "ACDH-QoS-Redmine/1.0"})
-        
-        # Authentication priority: API key takes precedence over Basic Auth
-        self.username = None
-        self.password = None
-        if auth is not None:
-            self.username, self.password = auth
-
-        if api_key:
-            self.session.headers.update({"X-Redmine-API-Key": api_key})
-            self.session.auth = None
-        else:
-            self.session.auth = auth
-
-        self.logIssueId = logIssueId
-        self.defaultTrackerId = defTrackerId
-        self.defaultProjectId = defProjectId
-        self.defaultStatus = defStatus
-        self.defaultPrority = defPrority
-        self.inContainerAppCategory = inContainerAppCategory
-        self._min_interval = 1.0
-        self._last_request_time = 0.0
-
-        # custom fields
+    def _setCustomFields(self, data):
         self.customFields = {}
-        resp = self._send('get', self.baseUrl + '/custom_fields.json')
-        if resp is None or resp.status_code != 200:
-            auth_method = 'API key' if api_key else 'Basic Auth'
-            raise Exception(f'Failed to load Redmine custom fields (using {auth_method})')
-        data = resp.json()
         for i in data['custom_fields']:
             self.customFields[i['name']] = i
 
-        # environment types
+    def _setEnvTypes(self, issues):
         self.envTypes = {}
-        resp = self._send(
-            'get',
-            self.baseUrl + '/issues.json',
-            data={'cf_' + str(self.customFields['tags']['id']): 'environment type', 'status_id': '*', 'limit': 100},
-        )
-        if resp is None or resp.status_code != 200:
-            raise Exception('Failed to load Redmine environment types')
-        data = resp.json()
-        for i in data['issues']:
+        for i in issues:
             self.envTypes[i['subject'].lower().split(' ')[0]] = i['id']
 
-    def _throttle(self):
-        now = time.monotonic()
-        elapsed = now - self._last_request_time
-        if elapsed < self._min_interval:
-            time.sleep(self._min_interval - elapsed)
-        self._last_request_time = time.monotonic()
+    def _setUpdateDatePolicy(self, policy):
+        if policy not in UPDATE_DATE_POLICIES:
+            raise ValueError(f"Unknown update date policy '{policy}', expected one of {', '.join(UPDATE_DATE_POLICIES)}")
+        self.updateDatePolicy = policy
 
-    def _send(self, method, url, **kwargs):
-        self._throttle()
-        try:
-            resp = getattr(self.session, method)(url, **kwargs)
-        except RequestException as e:
-            logging.error(f'[Redmine] {method.upper()} {url} failed: {e}')
-            return None
-        except Exception as e:
-            logging.error(f'[Redmine] unexpected error for {method.upper()} {url}: {e}')
-            return None
+    def _claimRecord(self, id, newData):
+        """Remember which service updated an issue during this run; another service claiming it is a duplicate."""
+        if self._claims is None:
+            self._claims = {}
+        owner = self._claims.setdefault(int(id), (newData['server'], newData['name']))
+        if owner != (newData['server'], newData['name']):
+            raise RecordDuplicated(id, newData, {'server': owner[0], 'name': owner[1]})
 
-        if resp.status_code >= 500:
-            logging.warning(f'[Redmine] {method.upper()} {url} returned {resp.status_code}')
+    def _cachedMetadata(self, key):
+        return self.metadataCache.get(key) if self.metadataCache is not None else None
 
-        return resp
+    def _cacheMetadata(self, key, value):
+        if self.metadataCache is not None:
+            self.metadataCache.set(key, value)
 
-    def begin(self):
-        self.setupNotifications(False)
-        
-    def end(self, log, procServers, report=None):
-        self.setupNotifications(True)
-        if self.logIssueId is not None:
-            if report:
-                self.saveStructuredReport(report)
-            else:
-                self.saveLog(log, procServers)
+    @staticmethod
+    def _nextOffset(data):
+        """Offset of the next issues.json page or None after the last page."""
+        offset = data.get('offset', 0) + len(data['issues'])
+        return offset if len(data['issues']) > 0 and offset < data.get('total_count', 0) else None
+
+    def _envTypesPageParams(self, offset):
+        return {'cf_' + str(self.customFields['tags']['id']): 'environment type', 'status_id': '*', 'limit': self.issuesPageSize, 'offset': offset}
+
+    def _issuesPageParams(self, offset):
+        return {'tracker_id': self.defaultTrackerId, 'status_id': '*', 'limit': self.issuesPageSize, 'offset': offset, 'include': 'relations'}
+
+    def _indexIssuesPage(self, data):
+        """Add one issues.json page to the index; returns the next offset or None after the last page."""
+        for i in data['issues']:
+            self._issueIndex[int(i['id'])] = i
+        return self._nextOffset(data)
+
+    def _indexedIssue(self, id):
+        if self._issueIndex is None:
+            return None
+        try:
+            return self._issueIndex.get(int(id))
+        except (TypeError, ValueError):
+            return None
+
+    def _indexIssue(self, data):
+        if self._issueIndex is not None:
+            self._issueIndex[int(data['id'])] = data
 
     def _sanitize_cell(self, value):
         """Remove characters that break Textile table formatting."""
@@ -166,11 +152,8 @@ class Redmine(IBackend):
         match = re.search(rf'\*?{field_name}:\*?\s*(\S+)', text)
         return match.group(1) if match else None
 
-    def saveLog(self, log, procServers):
-        """Save structured QoS report to Redmine log issue."""
-        if self.logIssueId is None:
-            return
-        
+    def formatLog(self, log):
+        """Render a captured warning log as a categorized Textile description."""
         log = self.parseLog(log)
         
         # Categorize log entries by type
@@ -254,19 +237,10 @@ class Redmine(IBackend):
         
         if not desc:
             desc = 'No issues found.'
-        
-        desc = str(desc)
-        data = {'issue': {
-            'description': desc,
-            'due_date': str(datetime.date.today())
-        }}
-        url = '%s/issues/%s.json' % (self.baseUrl, str(self.logIssueId))
-        resp = self._send('put', url, json=data)
-        if resp is None or (resp.status_code != 200 and resp.status_code != 204):
-            logging.error('Log issue update failed: %s', resp.text if resp else 'No response')
+        return str(desc)
 
-    def saveStructuredReport(self, report):
-        """Save structured QoS report to Redmine log issue."""
+    def formatStructuredReport(self, report):
+        """Render a structured QoS report as a Textile description."""
         desc = ''
 
         # Section 1: Missing Redmine ID
@@ -401,13 +375,7 @@ class Redmine(IBackend):
         if not desc:
             desc = 'No issues found.'
 
-        data = {'issue': {'description': desc}}
-        resp = self.session.put(
-            '%s/issues/%d.json' % (self.baseUrl, self.logIssueId),
-            json=data
-        )
-        if resp.status_code not in (200, 204):
-            logging.error('Log issue update failed: %d %s', resp.status_code, resp.text)
+        return desc
 
     def parseLog(self, log):
         log = log.strip()[1:].split('\n#')
@@ -422,7 +390,7 @@ class Redmine(IBackend):
         desc = [[j.strip() for j in (i.strip()[0:-1]).split('|')] for i in desc]
         return desc
 
-    def createRecord(self, data) -> IRecord:
+    def _createRecordRequest(self, data):
         reqData = {'issue': {
             'subject': 'Automatically created service issue for %s@%s' % (data['name'], data['server']),
             'tracker_id': self.defaultTrackerId,
@@ -433,11 +401,181 @@ class Redmine(IBackend):
                 {'id': self.customFields['server']['id'], 'value': data['server']}
             ]
         }}
+        return reqData
+
+    def _loginAuthToken(self, html):
+        """Return the login form's authenticity token, or None if the page has none."""
+        loginForm = html.replace('\n', '')
+        authToken = re.sub('.*input type="hidden" name="authenticity_token" value="([^"]*)".*', '\\1', loginForm)
+        return authToken if authToken != loginForm else None
+
+    def _notificationFormData(self, html, on):
+        """Build the notification settings form payload with issue update notifications switched on or off."""
+        form = re.sub('</form>.*', '', re.sub('^.*<form action="/settings/edit[?]tab=notifications"[^>]*>', '', html.replace('\n', '')))
+
+        issueUpdateRe = '<input type="checkbox" name="settings\\[notified_events\\]\\[\\]" value="issue_updated"[^/]*checked="checked"[^/]*/>'
+        if not on:
+            form = re.sub(issueUpdateRe, '', form)
+        elif re.search(issueUpdateRe, form) is None:
+            form += '<input type="checkbox" name="settings[notified_events][]" value="issue_updated" checked="checked" />'
+
+        chbs = form.split('<input type="checkbox"')[1:]
+        chbs = ['checked="checked"' in i for i in chbs]
+        form = re.split('<input|<textarea', form)[1:]
+        formFields = [re.sub('^.*name="([^"]*)".*$', '\\1', i) for i in form]
+        formValues = [re.sub('^.*>([^<]*)</textarea>.*$', '\\1', i) if re.search('</textarea>', i) else re.sub('^.*value="([^"]*)".*$', '\\1', i) for i in form]
+
+        data = ''
+        nChb = -1
+        for i in range(len(formValues)):
+            if re.search('type="checkbox"', form[i]):
+                nChb += 1
+                if not chbs[nChb]:
+                    continue
+            data += urllib.parse.quote(formFields[i], safe='') + '=' + urllib.parse.quote(formValues[i], safe='') + '&'
+        return data
+
+class Redmine(RedmineBase):
+    def __init__(self, baseUrl, auth=None, api_key=None, logIssueId=None, defTrackerId=7, defProjectId=164, defStatus=1, defPrority=2, inContainerAppCategory=52, updateDatePolicy='always', metadataCache=None):
+        # Normalize base URL by stripping trailing slash
+        self.baseUrl = baseUrl.rstrip('/')
+        self.api_key = api_key
+        self.session = requests.Session()
+        self.session.headers.update({"User-Agent": "ACDH-QoS-Redmine/1.0"})
+        
+        # Authentication priority: API key takes precedence over Basic Auth
+        self.username = None
+        self.password = None
+        if auth is not None:
+            self.username, self.password = auth
+
+        if api_key:
+            self.session.headers.update({"X-Redmine-API-Key": api_key})
+            self.session.auth = None
+        else:
+            self.session.auth = auth
+
+        self.logIssueId = logIssueId
+        self.defaultTrackerId = defTrackerId
+        self.defaultProjectId = defProjectId
+        self.defaultStatus = defStatus
+        self.defaultPrority = defPrority
+        self.inContainerAppCategory = inContainerAppCategory
+        self._setUpdateDatePolicy(updateDatePolicy)
+        self.metadataCache = metadataCache
+        self._min_interval = 1.0
+        self._last_request_time = 0.0
+        self._loadMetadata()
+
+    def _loadMetadata(self):
+        # custom fields
+        customFields = self._cachedMetadata(CUSTOM_FIELDS)
+        if customFields is None:
+            resp = self._send('get', self.baseUrl + '/custom_fields.json')
+            if resp is None or resp.status_code != 200:
+                auth_method = 'API key' if self.api_key else 'Basic Auth'
+                raise Exception(f'Failed to load Redmine custom fields (using {auth_method})')
+            customFields = resp.json()
+            self._cacheMetadata(CUSTOM_FIELDS, customFields)
+        self._setCustomFields(customFields)
+
+        # environment types
+        envTypes = self._cachedMetadata(ENV_TYPES)
+        if envTypes is None:
+            envTypes = []
+            offset = 0
+            while offset is not None:
+                resp = self._send('get', self.baseUrl + '/issues.json', params=self._envTypesPageParams(offset))
+                if resp is None or resp.status_code != 200:
+                    raise Exception('Failed to load Redmine environment types')
+                data = resp.json()
+                envTypes += [{'id': i['id'], 'subject': i['subject']} for i in data['issues']]
+                offset = self._nextOffset(data)
+            self._cacheMetadata(ENV_TYPES, envTypes)
+        self._setEnvTypes(envTypes)
+
+    def prefetchRecords(self):
+        """Load all issues of the service tracker into an index serving findRecord."""
+        self._issueIndex = {}
+        offset = 0
+        while offset is not None:
+            resp = self._send('get', self.baseUrl + '/issues.json', params=self._issuesPageParams(offset))
+            if resp is None or resp.status_code != 200:
+                logging.warning('[Redmine] Issue prefetch failed, falling back to per-issue lookups')
+                self._issueIndex = None
+                return
+            offset = self._indexIssuesPage(resp.json())
+        logging.info('[Redmine] Prefetched %d issues', len(self._issueIndex))
+
+    def _throttle(self):
+        now = time.monotonic()
+        elapsed = now - self._last_request_time
+        if elapsed < self._min_interval:
+            time.sleep(self._min_interval - elapsed)
+        self._last_request_time = time.monotonic()
+
+    def _send(self, method, url, **kwargs):
+        self._throttle()
+        try:
+            resp = getattr(self.session, method)(url, **kwargs)
+        except RequestException as e:
+            logging.error(f'[Redmine] {method.upper()} {url} failed: {e}')
+            return None
+        except Exception as e:
+            logging.error(f'[Redmine] unexpected error for {method.upper()} {url}: {e}')
+            return None
+
+        if resp.status_code >= 500:
+            logging.warning(f'[Redmine] {method.upper()} {url} returned {resp.status_code}')
+
+        return resp
+
+    def begin(self):
+        self.setupNotifications(False)
+        
+    def end(self, log, procServers, report=None):
+        self.setupNotifications(True)
+        if self.logIssueId is not None:
+            if report:
+                self.saveStructuredReport(report)
+            else:
+                self.saveLog(log, procServers)
+
+    def saveLog(self, log, procServers):
+        """Save structured QoS report to Redmine log issue."""
+        if self.logIssueId is None:
+            return
+
+        desc = self.formatLog(log)
+        data = {'issue': {
+            'description': desc,
+            'due_date': str(datetime.date.today())
+        }}
+        url = '%s/issues/%s.json' % (self.baseUrl, str(self.logIssueId))
+        resp = self._send('put', url, json=data)
+        if resp is None or (resp.status_code != 200 and resp.status_code != 204):
+            logging.error('Log issue update failed: %s', resp.text if resp else 'No response')
+
+    def saveStructuredReport(self, report):
+        """Save structured QoS report to Redmine log issue."""
+        desc = self.formatStructuredReport(report)
+
+        data = {'issue': {'description': desc}}
+        resp = self.session.put(
+            '%s/issues/%d.json' % (self.baseUrl, self.logIssueId),
+            json=data
+        )
+        if resp.status_code not in (200, 204):
+            logging.error('Log issue update failed: %d %s', resp.status_code, resp.text)
+
+    def createRecord(self, data) -> IRecord:
+        reqData = self._createRecordRequest(data)
         resp = self._send('post', self.baseUrl + '/issues.json', json=reqData)
         if resp is None or resp.status_code != 201:
             raise RecordCreationFailed(reqData, resp)
 
         respData = resp.json()['issue']
+        self._indexIssue(respData)
         url = '%s/issues/%s.json' % (self.baseUrl, str(respData['id']))
         record = RedmineRecord(url, self, respData)
         record.update(data)
@@ -446,7 +584,10 @@ class Redmine(IBackend):
 
     def findRecord(self, data) -> IRecord:
         url = '%s/issues/%s.json' % (self.baseUrl, str(data['id']))
-        resp = self._send('get', url)
+        issue = self._indexedIssue(data['id'])
+        if issue is not None:
+            return RedmineRecord(url, self, issue)
+        resp = self._send('get', url, params={'include': 'relations'})
         if resp is None or resp.status_code == 404:
             raise RecordNotFound()
         if resp.status_code != 200:
@@ -459,13 +600,12 @@ class Redmine(IBackend):
             logging.error('[Redmine] Unable to load login page for notification setup')
             return
 
-        loginForm = resp.text.replace('\n', '')
-        authToken = re.sub('.*input type="hidden" name="authenticity_token" value="([^"]*)".*', '\\1', loginForm)
+        authToken = self._loginAuthToken(resp.text)
         if not self.username or not self.password:
             raise Exception(
                 'Redmine username and password are required for notification setup. API key authentication is used for API calls, but login/notification setup still requires username/password.'
             )
-        if authToken != loginForm:
+        if authToken is not None:
             resp = self._send(
                 'post',
                 self.baseUrl + '/login',
@@ -481,28 +621,7 @@ class Redmine(IBackend):
             logging.error('[Redmine] Unable to load notification settings page')
             return
 
-        form = re.sub('</form>.*', '', re.sub('^.*<form action="/settings/edit[?]tab=notifications"[^>]*>', '', resp.text.replace('\n', '')))
-
-        issueUpdateRe = '<input type="checkbox" name="settings\\[notified_events\\]\\[\\]" value="issue_updated"[^/]*checked="checked"[^/]*/>'
-        if not on:
-            form = re.sub(issueUpdateRe, '', form)
-        elif re.search(issueUpdateRe, form) is None:
-            form += '<input type="checkbox" name="settings[notified_events][]" value="issue_updated" checked="checked" />'
-
-        chbs = form.split('<input type="checkbox"')[1:]
-        chbs = ['checked="checked"' in i for i in chbs]
-        form = re.split('<input|<textarea', form)[1:]
-        formFields = [re.sub('^.*name="([^"]*)".*$', '\\1', i) for i in form]
-        formValues = [re.sub('^.*>([^<]*)</textarea>.*$', '\\1', i) if re.search('</textarea>', i) else re.sub('^.*value="([^"]*)".*$', '\\1', i) for i in form]
-
-        data = ''
-        nChb = -1
-        for i in range(len(formValues)):
-            if re.search('type="checkbox"', form[i]):
-                nChb += 1
-                if not chbs[nChb]:
-                    continue
-            data += urllib.parse.quote(formFields[i], safe='') + '=' + urllib.parse.quote(formValues[i], safe='') + '&'
+        data = self._notificationFormData(resp.text, on)
         resp = self._send(
             'post',
             self.baseUrl + '/settings/edit?tab=notifications',
@@ -512,7 +631,8 @@ class Redmine(IBackend):
         if resp is None or resp.status_code != 200:
             logging.error(f'setting up Redmine notifications failed with {resp.status_code if resp else "no response"}')
 
-class RedmineRecord(IRecord):
+class RedmineRecordBase(IRecord):
+    """Transport-independent part of a Redmine service issue shared by the sync and async records."""
 
     expectedTrackerName = 'Service'
     mapping = {
@@ -534,26 +654,128 @@ class RedmineRecord(IRecord):
         self.redmine = redmine
         self.data = data
         
-        if data is not None and 'tracker' in data and data['tracker']['name'] != RedmineRecord.expectedTrackerName:
+        if data is not None and 'tracker' in data and data['tracker']['name'] != self.expectedTrackerName:
             raise RecordError('Redmine issue %d has a wrong tracker %s' % (self.id, data['tracker']['name']))
 
-    def update(self, newData):
+    def _checkDuplicated(self, newData):
         # same Redmine issue can't be updated with different services within the same day
         #   (as this indicates many services might use same Redmine issue)
-        if self.data is None:
-            resp = self.redmine.session.get(self.url)
-            self.data = resp.json()['issue']
         lastUpdate = [i['value'] for i in self.data['custom_fields'] if i['name'] == 'qos_update_date']
         if len(lastUpdate) > 0 and lastUpdate[0] == str(datetime.date.today()) and 'server' in newData and 'name' in newData:
             curServer = self.getCustomField(self.data, 'server') or ''
             curName = self.getCustomField(self.data, 'name') or ''
             if curServer + '@' + curName != newData['server'] + '@' + newData['name']:
                 raise RecordDuplicated(self.id, newData, {'name': curName, 'server': curServer})
+        if 'server' in newData and 'name' in newData:
+            self.redmine._claimRecord(self.id, newData)
+
+    @staticmethod
+    def _normalizeValue(value):
+        if value is None:
+            return ''
+        if isinstance(value, (list, tuple, set)):
+            return sorted(RedmineRecordBase._normalizeValue(i) for i in value)
+        if isinstance(value, dict):
+            value = value.get('id', value)
+        if isinstance(value, bool):
+            value = int(value)
+        return str(value).replace('\r\n', '\n').strip()
+
+    def _isUnchanged(self, key, value):
+        if key in self.redmine.customFields:
+            current = self.getCustomField(self.data, key)
+        elif key in self.data:
+            current = self.data[key]
+        else:
+            return False
+        return self._normalizeValue(value) == self._normalizeValue(current)
+
+    def _requestData(self, newData):
+        reqData = {'custom_fields': []}
+        for name, value in newData.items():
+            if value is not None:
+                key = self.mapping[name] if name in self.mapping else name
+                if self._isUnchanged(key, value):
+                    continue
+                if key in self.redmine.customFields:
+                    reqData['custom_fields'].append({'id': self.redmine.customFields[key]['id'], 'value': value})
+                else:
+                    reqData[key] = value
+        return reqData
+
+    def _updateRequest(self, newData):
+        """PUT body holding only the values that differ from the issue, or None if nothing has to be written."""
+        reqData = self._requestData(newData)
+        # keys that are neither custom fields nor issue attributes are ignored by Redmine and can't make a write necessary
+        changed = len(reqData['custom_fields']) > 0 or any(key in self.data for key in reqData if key != 'custom_fields')
+        if not changed:
+            if self.redmine.updateDatePolicy != 'always':
+                return None
+            # lightweight date-only update
+            reqData = {'custom_fields': []}
+        reqData['custom_fields'] += self._requestData({'qos_update_date': str(datetime.date.today())})['custom_fields']
+        if not changed and len(reqData['custom_fields']) == 0:
+            return None
+        return reqData
+
+    def _hasRelation(self, relation):
+        # issues read without include=relations have no 'relations' key, so every relation is (re)posted
+        try:
+            ids = {self.id, int(relation['id'])}
+        except ValueError:
+            return False
+        for i in self.data.get('relations', []):
+            if i['relation_type'] == relation['type'] and {int(i['issue_id']), int(i['issue_to_id'])} == ids:
+                return True
+        return False
+
+    def _addRelation(self, relation):
+        if 'relations' in self.data:
+            self.data['relations'].append({'issue_id': self.id, 'issue_to_id': int(relation['id']), 'relation_type': relation['type']})
+
+    def _applyUpdate(self, reqData):
+        # keep self.data (shared with the backend's issue index) in line with what was saved,
+        #   so later lookups within the same run see this update
+        names = {i['id']: name for name, i in self.redmine.customFields.items()}
+        fields = {i['id']: i for i in self.data.setdefault('custom_fields', [])}
+        for i in reqData['custom_fields']:
+            if i['id'] in fields:
+                fields[i['id']]['value'] = i['value']
+            else:
+                self.data['custom_fields'].append({'id': i['id'], 'name': names.get(i['id']), 'value': i['value']})
+
+    def _envTypeRelations(self, newData):
+        if 'envType' not in newData:
+            return []
+        envType = newData['envType'].lower()
+        if envType in self.redmine.envTypes:
+            return [{'id': self.redmine.envTypes[envType], 'type': 'relates'}]
+        logging.error('[%s] Redmine issue %d has unknown environment type %s' % (newData['server'], self.id, envType))
+        return []
+
+    def _relationsUrl(self):
+        return self.url.replace('.json', '/relations.json')
+
+    def _logRelationError(self, newData, relation, errors):
+        if 'Related issue has already been taken' != errors[0]:
+            logging.error('[%s] Redmine issue %d->%d relation creation failed with message "%s"' % (newData['server'], int(self.id), int(relation['id']), errors[0]))
+
+    def getCustomField(self, data, field):
+        if field in self.mapping:
+           field = self.mapping[field]
+        value = [i['value'] for i in data['custom_fields'] if i['name'] == field]
+        return value[0] if len(value) > 0 else None
+
+class RedmineRecord(RedmineRecordBase):
+
+    def update(self, newData):
+        if self.data is None:
+            resp = self.redmine.session.get(self.url, params={'include': 'relations'})
+            self.data = resp.json()['issue']
+        self._checkDuplicated(newData)
         
         # prepare request data
         relations = []
-        reqData = {'custom_fields': []}
-        newData['qos_update_date'] = str(datetime.date.today())
         
         if 'inContainerApps' in newData and newData['inContainerApps'] is not None:
             try: 
@@ -568,34 +790,20 @@ class RedmineRecord(IRecord):
             except AttributeError:
                 logging.error('[%s] Incorrect inContainerApps in %s' % (newData['server'], json.dumps(newData)))
         
-        for name, value in newData.items():
-            if value is not None:
-                key = RedmineRecord.mapping[name] if name in RedmineRecord.mapping else name
-                if key in self.redmine.customFields:
-                    reqData['custom_fields'].append({'id': self.redmine.customFields[key]['id'], 'value': value})
-                else:
-                    reqData[key] = value
- 
-        resp = self.redmine.session.put(self.url, json={'issue': reqData})
-        if resp.status_code != 200 and resp.status_code != 204:
-            logging.debug(json.dumps({'issue': reqData}))
-            raise RecordError('Redmine issue %d update failed with code %d and response "%s"' % (int(self.id), resp.status_code, resp.text))
+        reqData = self._updateRequest(newData)
+        if reqData is not None:
+            resp = self.redmine.session.put(self.url, json={'issue': reqData})
+            if resp.status_code != 200 and resp.status_code != 204:
+                logging.debug(json.dumps({'issue': reqData}))
+                raise RecordError('Redmine issue %d update failed with code %d and response "%s"' % (int(self.id), resp.status_code, resp.text))
+            self._applyUpdate(reqData)
         
-        if 'envType' in newData:
-            envType = newData['envType'].lower()
-            if envType in self.redmine.envTypes:
-                relations.append({'id': self.redmine.envTypes[envType], 'type': 'relates'})
-            else:
-                logging.error('[%s] Redmine issue %d has unknown environment type %s' % (newData['server'], self.id, envType))
-
+        relations += self._envTypeRelations(newData)
         for i in relations:
-            resp = self.redmine.session.post(self.url.replace('.json', '/relations.json'), json={'relation': {'issue_to_id': i['id'], 'relation_type': i['type']}})
-            if resp.status_code == 422 and 'Related issue has already been taken' != resp.json()['errors'][0]:
-                logging.error('[%s] Redmine issue %d->%d relation creation failed with message "%s"' % (newData['server'], int(self.id), int(i['id']), resp.json()['errors'][0]))
-
-    def getCustomField(self, data, field):
-        if field in RedmineRecord.mapping:
-           field = RedmineRecord.mapping[field]
-        value = [i['value'] for i in data['custom_fields'] if i['name'] == field]
-        return value[0] if len(value) > 0 else None
-
+            if self._hasRelation(i):
+                continue
+            resp = self.redmine.session.post(self._relationsUrl(), json={'relation': {'issue_to_id': i['id'], 'relation_type': i['type']}})
+            if resp.status_code == 201:
+                self._addRelation(i)
+            elif resp.status_code == 422:
+                self._logRelationError(newData, i, resp.json()['errors'])
@@ -4,11 +4,118 @@ import logging
 import os
 import re
 import requests
+import threading
+import time
 import traceback
 import yaml
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from acdhQos.interface import *
 
+INTERNAL_DOMAIN = 'acdh-cluster-2.arz.oeaw.ac.at'
+
+
+def buildEndpoint(name, hosts):
+    """Newline-separated public URLs of a workload from (protocol, hostname) pairs.
+
+    Internal, Let's Encrypt helper and default/main hostnames are left out; returns None (and logs
+    why) when no public URL remains.
+    """
+    endpoint = []
+    endpoint_domains = []
+    for protocol, hostname in hosts:
+        cleaned_hostname = hostname.split(':')[0].strip().lower()
+        endpoint_domains.append(cleaned_hostname)
+        if cleaned_hostname.startswith('le-'):
+            continue
+        if cleaned_hostname.endswith(INTERNAL_DOMAIN):
+            continue
+        if '-main' in cleaned_hostname or '-default' in cleaned_hostname:
+            continue
+        endpoint.append(protocol.lower() + '://' + cleaned_hostname)
+
+    endpoint = '\n'.join(sorted(set(endpoint)))
+
+    if not endpoint:
+        if endpoint_domains and all(domain.endswith(INTERNAL_DOMAIN) for domain in endpoint_domains):
+            logging.info(f"Skipping workload {name} because all ingress domains are internal cluster domains")
+            return None
+        logging.info(f"Skipping workload {name} because it has no ingress/endpoint")
+        return None
+    return endpoint
+
+
+class IngressIndex:
+    """Answers `name in ingress['name']` over a project's ingresses without scanning all of them.
+
+    Ingress names are indexed by all their 1 to 3 character substrings; candidates found through
+    the index are always verified with a plain substring test, so results equal a linear scan.
+    """
+
+    gramSize = 3
+    # stop intersecting posting lists once this few candidates are left and verify them directly
+    verifyBelow = 8
+
+    def __init__(self, ingresses, label=None):
+        self.ingresses = list(ingresses)
+        self.names = [i.get('name', '') or '' for i in self.ingresses]
+        self.grams = {}
+        for pos, name in enumerate(self.names):
+            grams = set()
+            for i in range(len(name)):
+                for size in range(1, self.gramSize + 1):
+                    if i + size <= len(name):
+                        grams.add(name[i:i + size])
+            for gram in grams:
+                self.grams.setdefault(gram, set()).add(pos)
+
+        # position => label value of the labelled ingresses
+        self.labels = {}
+        if label is not None:
+            for pos, ingress in enumerate(self.ingresses):
+                value = label(ingress)
+                if value:
+                    self.labels[pos] = value
+
+    def __len__(self):
+        return len(self.ingresses)
+
+    def _candidates(self, name):
+        if name == '':
+            return range(len(self.names))
+        if len(name) <= self.gramSize:
+            return self.grams.get(name, ())
+        postings = []
+        for i in range(len(name) - self.gramSize + 1):
+            posting = self.grams.get(name[i:i + self.gramSize])
+            if posting is None:
+                return ()
+            postings.append(posting)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            if len(candidates) <= self.verifyBelow:
+                break
+            candidates &= posting
+        return candidates
+
+    def find(self, name):
+        """Positions of the ingresses whose name contains `name`, in ingress order."""
+        return sorted(pos for pos in self._candidates(name) if name in self.names[pos])
+
+    def hasMatch(self, name):
+        return any(name in self.names[pos] for pos in self._candidates(name))
+
+    def firstLabel(self, name):
+        """Label of the first labelled ingress (in ingress order) whose name contains `name`."""
+        if len(self.labels) < len(self.names):
+            positions = [pos for pos in self._candidates(name) if pos in self.labels]
+        else:
+            positions = self._candidates(name)
+        positions = [pos for pos in positions if name in self.names[pos]]
+        return self.labels[min(positions)] if positions else None
+
+
 class Rancher(ICluster):
 
     apiBase = None
@@ -18,8 +125,16 @@ class Rancher(ICluster):
     skipTypes = None
     session = None
     clusters = None
+    maxConcurrent = 1
+    requestInterval = 0.0
+    _throttleLock = None
+    _lastRequestTime = 0.0
+    # project id => Future of (users, users_short); only set while harvest() runs
+    _projectUsers = None
+    _projectUsersLock = None
+    _projectUsersSaved = 0
 
-    def __init__(self, apiBase, token, project=None, skipProjects=None, skipClusters=None, skipTypes=None):
+    def __init__(self, apiBase, token, project=None, skipProjects=None, skipClusters=None, skipTypes=None, maxConcurrent=8, requestsPerSecond=10.0):
         self.base_url = apiBase.rstrip('/')
         self.apiBase = self.base_url
         self.project = project
@@ -35,6 +150,13 @@ class Rancher(ICluster):
             'Accept': 'application/json',
             'User-Agent': 'ACDH-QoS-Rancher/1.0',
         })
+        # harvest() issues up to maxConcurrent requests at a time, at most requestsPerSecond overall
+        self.maxConcurrent = max(1, int(maxConcurrent))
+        self.requestInterval = 1.0 / requestsPerSecond if requestsPerSecond > 0 else 0.0
+        self._throttleLock = threading.Lock()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.maxConcurrent)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
 
         try:
             resp = self.session.get(f'{self.base_url}/clusters', timeout=30)
@@ -58,56 +180,87 @@ class Rancher(ICluster):
     def getClusters(self):
         return self.clusters.values()
 
+    def _throttle(self):
+        if self._throttleLock is None:
+            return
+        with self._throttleLock:
+            wait = self._lastRequestTime + self.requestInterval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._lastRequestTime = time.monotonic()
+
+    def _getData(self, url):
+        self._throttle()
+        resp = self.session.get(url, timeout=30)
+        resp.raise_for_status()
+        return resp.json().get('data', [])
+
     def harvest(self):
         data = []
+        self._projectUsers = {}
+        self._projectUsersLock = threading.Lock()
+        self._projectUsersSaved = 0
         try:
-            resp = self.session.get(f'{self.base_url}/projects', timeout=30)
-            resp.raise_for_status()
-            projects = resp.json().get('data', [])
+            projects = self._getData(f'{self.base_url}/projects')
             logging.info(f"Found {len(projects)} projects")
 
+            selected = []
             for project in projects:
                 logging.info(f"Checking project {project['name']}")
                 if (self.project is not None and project['name'] != self.project) or project['name'] in self.skipProjects:
                     logging.info(f"Skipping project {project['name']} due to project filter")
                     continue
-                try:
-                    logging.info(f"Processing project {project['name']}")
-                    resp = self.session.get(f'{self.base_url}/project/{project["id"]}/workloads', timeout=30)
-                    resp.raise_for_status()
-                    workloads = resp.json().get('data', [])
-                    logging.info(f"Found {len(workloads)} workloads in project {project['name']}")
-                    logging.debug("Workloads: %s", workloads)
-
-                    # Fetch ingresses for the project
-                    ingresses_resp = self.session.get(f'{self.base_url}/project/{project["id"]}/ingresses', timeout=30)
-                    ingresses_resp.raise_for_status()
-                    ingresses = ingresses_resp.json().get('data', [])
-                    logging.info(f"Found {len(ingresses)} ingresses in project {project['name']}")
-                    logging.debug("Ingresses: %s", ingresses)
-
-                    for workload in workloads:
-                        if workload['type'] in self.skipTypes:
-                            logging.info(f"Skipping workload {workload['name']} due to type filter")
-                            continue
-
-                        # Check if the workload has an associated ingress
-                        has_ingress = any(
-                            workload['name'] in ingress['name'] for ingress in ingresses
-                        )
-                        logging.debug("Workload %s has ingress: %s", workload['name'], has_ingress)
-
-                        if has_ingress:
-                            logging.info(f"Processing workload {workload['name']}")
-                            data.append(self.processWorkload(workload, project, ingresses))
-                        else:
-                            logging.info(f"Skipping workload {workload['name']} (no ingress)")
-                except Exception as e:
-                    logging.error(f"Error processing project {project['name']}: {traceback.format_exc()}")
+                selected.append(project)
+
+            # projects are coordinated by one pool while all Rancher requests run in another one,
+            #   so project tasks never wait for requests queued behind them in their own pool
+            with ThreadPoolExecutor(self.maxConcurrent) as projectPool, ThreadPoolExecutor(self.maxConcurrent) as requestPool:
+                for projectData in projectPool.map(lambda project: self.harvestProject(project, requestPool), selected):
+                    data += projectData
         except Exception as e:
             logging.error(f"Failed to fetch projects: {traceback.format_exc()}")
+        finally:
+            logging.info(f"Role bindings fetched for {len(self._projectUsers)} projects, {self._projectUsersSaved} projectRoleTemplateBindings calls saved")
+            self._projectUsers = None
         return data if data else []
 
+    def harvestProject(self, project, pool):
+        """Workloads of a single project in Rancher order; requests are executed in `pool`."""
+        data = []
+        try:
+            logging.info(f"Processing project {project['name']}")
+            workloads = pool.submit(self._getData, f'{self.base_url}/project/{project["id"]}/workloads')
+            ingresses = pool.submit(self._getData, f'{self.base_url}/project/{project["id"]}/ingresses')
+            workloads = workloads.result()
+            logging.info(f"Found {len(workloads)} workloads in project {project['name']}")
+            logging.debug("Workloads: %s", workloads)
+            ingresses = ingresses.result()
+            logging.info(f"Found {len(ingresses)} ingresses in project {project['name']}")
+            logging.debug("Ingresses: %s", ingresses)
+            ingresses = self.indexIngresses(ingresses)
+
+            selected = []
+            for workload in workloads:
+                if workload['type'] in self.skipTypes:
+                    logging.info(f"Skipping workload {workload['name']} due to type filter")
+                    continue
+
+                # Check if the workload has an associated ingress
+                has_ingress = ingresses.hasMatch(workload['name'])
+                logging.debug("Workload %s has ingress: %s", workload['name'], has_ingress)
+
+                if has_ingress:
+                    logging.info(f"Processing workload {workload['name']}")
+                    selected.append(workload)
+                else:
+                    logging.info(f"Skipping workload {workload['name']} (no ingress)")
+
+            for result in pool.map(lambda workload: self.processWorkload(workload, project, ingresses), selected):
+                data.append(result)
+        except Exception as e:
+            logging.error(f"Error processing project {project['name']}: {traceback.format_exc()}")
+        return data
+
     def processWorkload(self, cfg, pcfg, ingresses=None):
         name = cfg['name']
         type = cfg['type']
@@ -120,17 +273,14 @@ class Rancher(ICluster):
 
         redmineId = self.getLabel(cfg, 'ID')
         if not redmineId and ingresses:
-            for ingress in ingresses:
-                if name in ingress.get('name', ''):
-                    redmineId = self.getLabel(ingress, 'ID')
-                    if redmineId:
-                        break
+            if not isinstance(ingresses, IngressIndex):
+                ingresses = self.indexIngresses(ingresses)
+            redmineId = ingresses.firstLabel(name)
 
         images = [i['image'] for i in cfg['containers']]
         images = '\n'.join(set(images))
 
-        endpoint = []
-        endpoint_domains = []
+        hosts = []
         for i in cfg['publicEndpoints'] if 'publicEndpoints' in cfg and cfg['publicEndpoints'] is not None else []:
             if 'addresses' not in i and 'hostname' not in i:
                 continue
@@ -141,30 +291,10 @@ class Rancher(ICluster):
             elif 'addresses' in i:
                 hostnames = i['addresses']
 
-            if not hostnames:
-                continue
-
-            for hostname in hostnames:
-                cleaned_hostname = hostname.split(':')[0].strip().lower()
-                if cleaned_hostname.startswith('le-'):
-                    endpoint_domains.append(cleaned_hostname)
-                    continue
-                if cleaned_hostname.endswith('acdh-cluster-2.arz.oeaw.ac.at'):
-                    endpoint_domains.append(cleaned_hostname)
-                    continue
-                if '-main' in cleaned_hostname or '-default' in cleaned_hostname:
-                    endpoint_domains.append(cleaned_hostname)
-                    continue
-                endpoint.append(i['protocol'].lower() + '://' + cleaned_hostname)
-                endpoint_domains.append(cleaned_hostname)
-
-        endpoint = '\n'.join(set(endpoint))
+            hosts += [(i['protocol'], hostname) for hostname in hostnames]
 
-        if not endpoint:
-            if endpoint_domains and all(domain.endswith('acdh-cluster-2.arz.oeaw.ac.at') for domain in endpoint_domains):
-                logging.info(f"Skipping workload {name} because all ingress domains are internal cluster domains")
-                return None
-            logging.info(f"Skipping workload {name} because it has no ingress/endpoint")
+        endpoint = buildEndpoint(name, hosts)
+        if endpoint is None:
             return None
 
         techStack = '\n'.join([i['image'] for i in cfg['containers']])
@@ -173,11 +303,35 @@ class Rancher(ICluster):
 
         backendConnection = self.getAnnotation(cfg, 'BackendConnection')
 
+        users, users_short = self.getProjectUsers(pcfg)
+
+        return {'name': name, 'id': redmineId, 'endpoint': endpoint, 'techStack': techStack, 'inContainerApps': inContainerApps, 'backendConnection': backendConnection, 'users': users, 'users_short': users_short, 'server': server, 'project': pcfg['name'], 'type': type, 'namespace': namespace}
+
+    def indexIngresses(self, ingresses):
+        return IngressIndex(ingresses, lambda ingress: self.getLabel(ingress, 'ID'))
+
+    def getProjectUsers(self, pcfg):
+        """(users, users_short) of a project; during harvest() loaded once per project and shared by its workloads."""
+        if self._projectUsers is None:
+            return self.loadProjectUsers(pcfg)
+        with self._projectUsersLock:
+            future = self._projectUsers.get(pcfg['id'])
+            owner = future is None
+            if owner:
+                future = self._projectUsers[pcfg['id']] = Future()
+            else:
+                self._projectUsersSaved += 1
+        if owner:
+            try:
+                future.set_result(self.loadProjectUsers(pcfg))
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    def loadProjectUsers(self, pcfg):
         users_detailed = []
         users_names = []
-        resp = self.session.get(f'{self.base_url}/project/{pcfg["id"]}/projectRoleTemplateBindings', timeout=30)
-        resp.raise_for_status()
-        for user in resp.json()['data']:
+        for user in self._getData(f'{self.base_url}/project/{pcfg["id"]}/projectRoleTemplateBindings'):
             user_principal_id = user.get('userPrincipalId')
             if not user_principal_id or str(user_principal_id).startswith('local://'):
                 continue
@@ -190,8 +344,7 @@ class Rancher(ICluster):
             users_names.append(username)
         users = '\n'.join(sorted(set(users_detailed)))
         users_short = ', '.join(sorted(set(users_names)))
-
-        return {'name': name, 'id': redmineId, 'endpoint': endpoint, 'techStack': techStack, 'inContainerApps': inContainerApps, 'backendConnection': backendConnection, 'users': users, 'users_short': users_short, 'server': server, 'project': pcfg['name'], 'type': type, 'namespace': namespace}
+        return users, users_short
 
     def getLabel(self, cfg, name):
         if 'labels' not in cfg or name not in cfg['labels']:
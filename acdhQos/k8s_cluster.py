@@ -0,0 +1,156 @@
+import asyncio
+import logging
+
+from acdhQos.cluster import buildEndpoint
+from acdhQos.interface import *
+
+
+def _labels(obj):
+    return getattr(obj.metadata, 'labels', None) or {}
+
+
+def _annotations(obj):
+    return getattr(obj.metadata, 'annotations', None) or {}
+
+
+def ingressBackends(ingress):
+    """(host, service name) pairs an ingress routes to; rules without paths go to the default backend."""
+    spec = ingress.spec
+    default = spec.default_backend.service.name if spec.default_backend is not None and spec.default_backend.service is not None else None
+    for rule in spec.rules or []:
+        if not rule.host:
+            continue
+        paths = rule.http.paths if rule.http is not None else []
+        services = [p.backend.service.name for p in paths or [] if p.backend is not None and p.backend.service is not None]
+        if not services and default:
+            services = [default]
+        for service in dict.fromkeys(services):
+            yield rule.host, service
+
+
+class WorkloadIndex:
+    """Workloads indexed by (namespace, pod template label, value), answering service selectors by set intersection."""
+
+    def __init__(self, workloads):
+        self.workloads = list(workloads)
+        self.byLabel = {}
+        for pos, (type, workload) in enumerate(self.workloads):
+            namespace = workload.metadata.namespace
+            for key, value in _labels(workload.spec.template).items():
+                self.byLabel.setdefault((namespace, key, value), set()).add(pos)
+
+    def select(self, namespace, selector):
+        """Positions of the workloads in `namespace` whose pods a service with `selector` targets."""
+        if not selector:
+            # services without a selector have manually managed endpoints
+            return set()
+        postings = sorted((self.byLabel.get((namespace, key, value), set()) for key, value in selector.items()), key=len)
+        return postings[0].intersection(*postings[1:])
+
+
+class Kubernetes(ICluster):
+    """Harvests workloads straight from the Kubernetes API.
+
+    Ingresses, services and workloads are each listed once and joined in memory
+    (ingress backend -> service selector -> workload pod labels) into records shaped like
+    Rancher.processWorkload() output. Rancher-only data (project name, project users) is left
+    empty, so it is not overwritten in the backend. harvest() is a coroutine.
+    """
+
+    workloadTypes = {
+        'deployment': 'list_deployments',
+        'statefulSet': 'list_stateful_sets',
+        'daemonSet': 'list_daemon_sets',
+    }
+
+    def __init__(self, k8s, server=None, skipTypes=None):
+        self.k8s = k8s
+        self.server = server or k8s.cluster_name
+        if not self.server:
+            raise Exception('Kubernetes harvest needs a server name (kubeconfig context or --kubernetesServer)')
+        self.skipTypes = skipTypes or []
+
+    def getClusters(self):
+        return [self.server]
+
+    async def harvest(self):
+        types = [t for t in self.workloadTypes if t not in self.skipTypes]
+
+        async def collect(stream):
+            return [i async for i in stream]
+
+        lists = await asyncio.gather(
+            collect(self.k8s.list_ingresses()),
+            collect(self.k8s.list_services()),
+            *(collect(getattr(self.k8s, self.workloadTypes[t])()) for t in types),
+        )
+        ingresses, services = lists[0], lists[1]
+        workloads = [(t, w) for t, items in zip(types, lists[2:]) for w in items]
+        logging.info(f"[{self.server}] Found {len(ingresses)} ingresses, {len(services)} services and {len(workloads)} workloads")
+        return self.join(ingresses, services, workloads)
+
+    def join(self, ingresses, services, workloads):
+        index = WorkloadIndex(workloads)
+        selectors = {(s.metadata.namespace, s.metadata.name): s.spec.selector for s in services}
+
+        # workload position => (protocol, host) pairs and the ID label of the first labelled ingress
+        hosts = {}
+        ingressIds = {}
+        for ingress in ingresses:
+            namespace = ingress.metadata.namespace
+            tls = {h for t in ingress.spec.tls or [] for h in t.hosts or []}
+            redmineId = _labels(ingress).get('ID')
+            for host, service in ingressBackends(ingress):
+                selector = selectors.get((namespace, service))
+                if selector is None:
+                    logging.debug(f"Ingress {namespace}/{ingress.metadata.name} refers to unknown service {service}")
+                    continue
+                for pos in index.select(namespace, selector):
+                    hosts.setdefault(pos, []).append(('https' if host in tls else 'http', host))
+                    if redmineId:
+                        ingressIds.setdefault(pos, redmineId)
+
+        data = []
+        for pos, (type, workload) in enumerate(index.workloads):
+            if pos not in hosts:
+                logging.info(f"Skipping workload {workload.metadata.name} (no ingress)")
+                continue
+            record = self.processWorkload(type, workload, hosts[pos], ingressIds.get(pos))
+            if record is not None:
+                data.append(record)
+        data.sort(key=lambda i: (i['namespace'], i['name']))
+        return data
+
+    def processWorkload(self, type, workload, hosts, ingressId=None):
+        name = workload.metadata.name
+        namespace = workload.metadata.namespace
+        if name.lower() == 'service':
+            logging.info(f"Skipping workload {name} because it is a helper/service deployment")
+            return None
+
+        endpoint = buildEndpoint(name, hosts)
+        if endpoint is None:
+            return None
+
+        template = workload.spec.template
+        return {
+            'name': name,
+            'id': self.getLabel(workload, 'ID') or ingressId,
+            'endpoint': endpoint,
+            'techStack': '\n'.join([c.image for c in template.spec.containers]),
+            'inContainerApps': self.getAnnotation(workload, 'InContainerApps'),
+            'backendConnection': self.getAnnotation(workload, 'BackendConnection'),
+            'users': None,
+            'users_short': '',
+            'server': self.server,
+            'project': None,
+            'type': type,
+            'namespace': namespace,
+        }
+
+    def getLabel(self, workload, name):
+        """Pod template label, falling back to the workload's own label (like Rancher's labels/workloadLabels)."""
+        return _labels(workload.spec.template).get(name) or _labels(workload).get(name)
+
+    def getAnnotation(self, workload, name):
+        return _annotations(workload.spec.template).get(name) or _annotations(workload).get(name)
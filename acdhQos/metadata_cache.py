@@ -0,0 +1,64 @@
+import json
+import logging
+import os
+import tempfile
+import time
+
+CUSTOM_FIELDS = 'custom_fields'
+ENV_TYPES = 'env_types'
+
+
+class MetadataCache:
+    """JSON file caching Redmine metadata (custom fields, environment types) per Redmine URL for `ttl` seconds.
+
+    A ttl of 0 disables the cache.
+    """
+
+    def __init__(self, path, baseUrl, ttl=3600):
+        self.path = path or os.path.join(tempfile.gettempdir(), 'qos-redmine-metadata.json')
+        self.baseUrl = baseUrl.rstrip('/')
+        self.ttl = ttl
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f'[Redmine] Ignoring unreadable metadata cache {self.path}: {e}')
+            return {}
+
+    def _save(self, data):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmpPath = tempfile.mkstemp(dir=directory, prefix='.qos-metadata-')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmpPath, self.path)
+        except OSError as e:
+            logging.warning(f'[Redmine] Unable to write metadata cache {self.path}: {e}')
+
+    def get(self, key):
+        """Cached value of `key` or None if it is missing or older than the TTL."""
+        if self.ttl <= 0:
+            return None
+        entry = self._load().get(self.baseUrl, {}).get(key)
+        if entry is None or time.time() - entry.get('time', 0) > self.ttl:
+            return None
+        return entry.get('value')
+
+    def set(self, key, value):
+        if self.ttl <= 0:
+            return
+        data = self._load()
+        data.setdefault(self.baseUrl, {})[key] = {'time': time.time(), 'value': value}
+        self._save(data)
+
+    def invalidate(self):
+        """Drop everything cached for this Redmine URL."""
+        data = self._load()
+        if data.pop(self.baseUrl, None) is not None:
+            self._save(data)
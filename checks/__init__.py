@@ -2,3 +2,4 @@ from .logo_check import check_acdh_logo
 from .helpdesk_check import check_helpdesk_email
 from .accessibility_check import check_accessibility
 from .imprint_check import check_imprint_page
+from .page import ParsedPage, parse_page
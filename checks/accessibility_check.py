@@ -1,40 +1,37 @@
-from bs4 import BeautifulSoup
+from .page import ParsedPage
 
 
-def check_accessibility(html: str, url: str = "") -> dict:
+def check_accessibility(html: str, url: str = "", page: ParsedPage = None) -> dict:
     """Basic accessibility checks on the service page HTML."""
     result = {"check": "Accessibility", "status": "PASS", "details": "", "issues": []}
     try:
-        soup = BeautifulSoup(html, "html.parser")
+        if page is None:
+            page = ParsedPage.from_html(html)
         issues = []
 
-        html_tag = soup.find("html")
+        html_tag = page.html_tag
         if not html_tag or not html_tag.get("lang"):
             issues.append("Missing 'lang' attribute on <html> tag")
 
-        images = soup.find_all("img")
-        imgs_without_alt = [img.get("src", "unknown") for img in images if not img.get("alt")]
+        imgs_without_alt = [img.get("src", "unknown") for img in page.images if not img.get("alt")]
         if imgs_without_alt:
             issues.append(f"{len(imgs_without_alt)} image(s) missing 'alt' attribute")
 
-        if not soup.find("title") or not soup.find("title").get_text().strip():
+        if not page.title or not page.title.get_text().strip():
             issues.append("Missing or empty <title> tag")
 
-        h1_tags = soup.find_all("h1")
-        if not h1_tags:
+        if not page.h1_tags:
             issues.append("No <h1> tag found")
 
-        viewport = soup.find("meta", attrs={"name": "viewport"})
-        if not viewport:
+        if not page.find_meta("viewport"):
             issues.append("Missing viewport meta tag")
 
-        inputs = soup.find_all("input")
-        for inp in inputs:
+        for inp in page.inputs:
             inp_type = inp.get("type", "text")
             if inp_type in ("hidden", "submit", "button"):
                 continue
             inp_id = inp.get("id")
-            if not inp_id or not soup.find("label", attrs={"for": inp_id}):
+            if not inp_id or inp_id not in page.label_for:
                 if not inp.get("aria-label") and not inp.get("aria-labelledby"):
                     issues.append(f"Input '{inp_id or inp.get('name', 'unknown')}' missing associated label")
 
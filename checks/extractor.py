@@ -0,0 +1,164 @@
+import re
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Set
+
+# Tree-building rules of BeautifulSoup's "html.parser" builder that affect
+# what the checks see; mirrored here so both engines give identical results.
+VOID_ELEMENTS = {
+    "area", "base", "basefont", "bgsound", "br", "col", "command", "embed",
+    "frame", "hr", "image", "img", "input", "isindex", "keygen", "link",
+    "menuitem", "meta", "nextid", "param", "source", "spacer", "track", "wbr",
+}
+STRING_CONTAINERS = {"rt", "rp", "style", "script", "template"}
+PRESERVE_WHITESPACE = {"pre", "textarea"}
+ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+LIST_ATTRIBUTES = {"class"}
+
+_nonwhitespace_re = re.compile(r"\S+")
+
+
+class Element:
+    """Attributes and text of a single tag, with the Tag accessors the checks use."""
+    __slots__ = ("name", "attrs", "_text")
+
+    def __init__(self, name: str, attrs: Dict[str, object]):
+        self.name = name
+        self.attrs = attrs
+        self._text: List[str] = []
+
+    def get(self, key: str, default=None):
+        return self.attrs.get(key, default)
+
+    def get_text(self) -> str:
+        return "".join(self._text)
+
+
+class PageFeatureExtractor(HTMLParser):
+    """Collects everything the checks need in a single pass without building a DOM."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.html_tag: Optional[Element] = None
+        self.title: Optional[Element] = None
+        self.h1_tags: List[Element] = []
+        self.images: List[Element] = []
+        self.links: List[Element] = []
+        self.inputs: List[Element] = []
+        self.label_for: Set[str] = set()
+        self.metas: List[Element] = []
+
+        self._stack: List[str] = []
+        self._open_counts: Dict[str, int] = {}
+        self._captures: List[tuple] = []
+        self._data: List[str] = []
+        self._already_closed: Dict[str, int] = {}
+
+    def _attrs(self, attrs) -> Dict[str, object]:
+        result: Dict[str, object] = {}
+        for key, value in attrs:
+            if value is None:
+                value = ""
+            if key in LIST_ATTRIBUTES:
+                value = _nonwhitespace_re.findall(value)
+            result[key] = value
+        return result
+
+    def _flush(self, cdata: bool = False):
+        if not self._data:
+            return
+        data = "".join(self._data)
+        self._data = []
+        if not self._captures:
+            return
+        if not cdata and self._is_open(STRING_CONTAINERS):
+            return
+        if not self._is_open(PRESERVE_WHITESPACE):
+            if all(c in ASCII_SPACES for c in data):
+                data = "\n" if "\n" in data else " "
+        for _depth, element in self._captures:
+            element._text.append(data)
+
+    def _is_open(self, names: Set[str]) -> bool:
+        return any(self._open_counts.get(name) for name in names)
+
+    def _push(self, name: str):
+        self._stack.append(name)
+        self._open_counts[name] = self._open_counts.get(name, 0) + 1
+
+    def _pop_to(self, name: str):
+        if not self._open_counts.get(name):
+            return
+        while self._stack:
+            popped = self._stack.pop()
+            self._open_counts[popped] -= 1
+            while self._captures and self._captures[-1][0] > len(self._stack):
+                self._captures.pop()
+            if popped == name:
+                break
+
+    def _collect(self, tag: str, attrs: Dict[str, object]):
+        if tag == "img":
+            self.images.append(Element(tag, attrs))
+        elif tag == "a" and "href" in attrs:
+            element = Element(tag, attrs)
+            self.links.append(element)
+            self._captures.append((len(self._stack), element))
+        elif tag == "input":
+            self.inputs.append(Element(tag, attrs))
+        elif tag == "meta":
+            self.metas.append(Element(tag, attrs))
+        elif tag == "label" and "for" in attrs:
+            self.label_for.add(attrs["for"])
+        elif tag == "h1":
+            self.h1_tags.append(Element(tag, attrs))
+        elif tag == "html" and self.html_tag is None:
+            self.html_tag = Element(tag, attrs)
+        elif tag == "title" and self.title is None:
+            self.title = Element(tag, attrs)
+            self._captures.append((len(self._stack), self.title))
+
+    def _start(self, tag: str, attrs, self_closing: bool):
+        self._flush()
+        self._push(tag)
+        self._collect(tag, self._attrs(attrs))
+        if self_closing:
+            self._pop_to(tag)
+        elif tag in VOID_ELEMENTS:
+            self._pop_to(tag)
+            self._already_closed[tag] = self._already_closed.get(tag, 0) + 1
+
+    def handle_starttag(self, tag, attrs):
+        self._start(tag, attrs, self_closing=False)
+
+    def handle_startendtag(self, tag, attrs):
+        self._start(tag, attrs, self_closing=True)
+
+    def handle_endtag(self, tag):
+        if self._already_closed.get(tag):
+            # redundant end tag of a void element, e.g. <img></img>
+            self._already_closed[tag] -= 1
+        else:
+            self._flush()
+            self._pop_to(tag)
+
+    def handle_data(self, data):
+        self._data.append(data)
+
+    def handle_comment(self, data):
+        self._flush()
+
+    def handle_decl(self, decl):
+        self._flush()
+
+    def handle_pi(self, data):
+        self._flush()
+
+    def unknown_decl(self, data):
+        self._flush()
+        if data.upper().startswith("CDATA["):
+            self._data.append(data[len("CDATA["):])
+            self._flush(cdata=True)
+
+    def close(self):
+        super().close()
+        self._flush()
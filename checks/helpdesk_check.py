@@ -1,9 +1,8 @@
-from bs4 import BeautifulSoup
-
 from config import config
+from .page import ParsedPage
 
 
-def check_helpdesk_email(html: str, expected_email: str = None) -> dict:
+def check_helpdesk_email(html: str, expected_email: str = None, page: ParsedPage = None) -> dict:
     """Check if the page HTML contains the helpdesk email address."""
     if expected_email is None:
         expected_email = config.get("checks", {}).get("helpdesk_email")
@@ -15,15 +14,17 @@ def check_helpdesk_email(html: str, expected_email: str = None) -> dict:
             result["details"] = "Helpdesk email not configured"
             return result
 
-        normalized_html = html.lower()
+        normalized_html = page.text_lower if page is not None else html.lower()
         normalized_email = expected_email.lower()
         if normalized_email in normalized_html:
             result["status"] = "PASS"
             result["details"] = f"Found {expected_email}"
             return result
 
-        soup = BeautifulSoup(html, "html.parser")
-        mailto_links = soup.find_all("a", href=lambda h: h and "mailto:" in h)
+        if page is None:
+            page = ParsedPage.from_html(html)
+
+        mailto_links = [link for link in page.links if "mailto:" in link.get("href", "")]
         for link in mailto_links:
             if normalized_email in link.get("href", "").lower():
                 result["status"] = "PASS"
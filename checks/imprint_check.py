@@ -1,21 +1,22 @@
 import asyncio
-from bs4 import BeautifulSoup
 from typing import Any, Dict
 from urllib.parse import urljoin
 
 from config import config
+from .page import ParsedPage
 
 
-async def check_imprint_page(html: str, url: str = "", http_client: Any = None) -> Dict[str, Any]:
+async def check_imprint_page(html: str, url: str = "", http_client: Any = None, page: ParsedPage = None) -> Dict[str, Any]:
     """Check for imprint page. Optionally verify the link is reachable."""
     result = {"check": "Imprint Page", "status": "FAIL", "details": ""}
     try:
-        soup = BeautifulSoup(html, "html.parser")
+        if page is None:
+            page = ParsedPage.from_html(html)
         keywords = config.get("checks", {}).get(
             "imprint_keywords", ["imprint", "impressum", "legal-notice"]
         )
 
-        for link in soup.find_all("a", href=True):
+        for link in page.links:
             href = link.get("href", "").lower()
             text = link.get_text().lower().strip()
             for kw in keywords:
@@ -25,7 +26,8 @@ async def check_imprint_page(html: str, url: str = "", http_client: Any = None)
                     result["details"] = f"Found: {full_url}"
 
                     if http_client and full_url:
-                        resp = await http_client.get(full_url)
+                        # only the status matters, so the body is not downloaded past the first chunk
+                        resp = await http_client.get(full_url, until=lambda _: True)
                         if resp["status"] != 200:
                             result["status"] = "WARN"
                             result["details"] = f"Link found but status {resp['status']}: {full_url}"
@@ -1,16 +1,16 @@
-from bs4 import BeautifulSoup
-
 from config import config
+from .page import ParsedPage
 
 
-def check_acdh_logo(html: str, url: str = "") -> dict:
+def check_acdh_logo(html: str, url: str = "", page: ParsedPage = None) -> dict:
     """Check for ACDH logo in already-fetched HTML."""
     result = {"check": "ACDH Logo", "status": "FAIL", "details": ""}
     try:
-        soup = BeautifulSoup(html, "html.parser")
+        if page is None:
+            page = ParsedPage.from_html(html)
         logo_patterns = config.get("checks", {}).get("logo_patterns", [])
 
-        for img in soup.find_all("img"):
+        for img in page.images:
             src = (img.get("src") or "").lower()
             alt = (img.get("alt") or "").lower()
             cls = " ".join(img.get("class") or []).lower()
@@ -20,9 +20,8 @@ def check_acdh_logo(html: str, url: str = "") -> dict:
                     result["details"] = f"Found logo pattern '{pattern}' in image"
                     return result
 
-        page_text = html.lower()
         for pattern in logo_patterns:
-            if pattern in page_text:
+            if pattern in page.text_lower:
                 result["status"] = "PASS"
                 result["details"] = f"Pattern '{pattern}' found in page source"
                 return result
@@ -0,0 +1,93 @@
+import logging
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Set
+
+from bs4 import BeautifulSoup
+
+from config import config
+from .extractor import PageFeatureExtractor
+
+ENGINES = ("soup", "stream")
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ParsedPage:
+    """Service page parsed once and shared by all checks."""
+    html: str
+    text_lower: str
+    soup: Any = None
+    html_tag: Any = None
+    title: Any = None
+    h1_tags: List[Any] = field(default_factory=list)
+    images: List[Any] = field(default_factory=list)
+    links: List[Any] = field(default_factory=list)
+    inputs: List[Any] = field(default_factory=list)
+    label_for: Set[str] = field(default_factory=set)
+    metas: List[Any] = field(default_factory=list)
+
+    @classmethod
+    def from_html(cls, html: str, engine: str = None) -> "ParsedPage":
+        """Parse with the configured engine: a BeautifulSoup tree or a single streaming pass."""
+        if engine is None:
+            engine = config.get("checks", {}).get("engine", "soup")
+        if engine == "stream":
+            return cls.from_stream(html)
+        if engine != "soup":
+            raise ValueError(f"Unknown check engine '{engine}', expected one of {', '.join(ENGINES)}")
+        return cls.from_soup(html)
+
+    @classmethod
+    def from_soup(cls, html: str) -> "ParsedPage":
+        soup = BeautifulSoup(html, "html.parser")
+        return cls(
+            html=html,
+            text_lower=html.lower(),
+            soup=soup,
+            html_tag=soup.find("html"),
+            title=soup.find("title"),
+            h1_tags=soup.find_all("h1"),
+            images=soup.find_all("img"),
+            links=soup.find_all("a", href=True),
+            inputs=soup.find_all("input"),
+            label_for={label.get("for") for label in soup.find_all("label") if label.get("for") is not None},
+            metas=soup.find_all("meta"),
+        )
+
+    @classmethod
+    def from_stream(cls, html: str) -> "ParsedPage":
+        extractor = PageFeatureExtractor()
+        extractor.feed(html)
+        extractor.close()
+        return cls.from_extractor(html, extractor)
+
+    @classmethod
+    def from_extractor(cls, html: str, extractor: PageFeatureExtractor) -> "ParsedPage":
+        return cls(
+            html=html,
+            text_lower=html.lower(),
+            html_tag=extractor.html_tag,
+            title=extractor.title,
+            h1_tags=extractor.h1_tags,
+            images=extractor.images,
+            links=extractor.links,
+            inputs=extractor.inputs,
+            label_for=extractor.label_for,
+            metas=extractor.metas,
+        )
+
+    def find_meta(self, name: str) -> Optional[Any]:
+        for meta in self.metas:
+            if meta.get("name") == name:
+                return meta
+        return None
+
+
+def parse_page(html: str, url: str = "") -> Optional[ParsedPage]:
+    """Parse a page for all checks; on failure each check re-parses and reports its own error."""
+    try:
+        return ParsedPage.from_html(html)
+    except Exception as e:
+        logger.warning("Failed to parse %s: %s", url or "page", e)
+        return None
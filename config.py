@@ -22,25 +22,50 @@ DEFAULTS = {
             "legal-notice",
             "legal_notice",
         ],
+        "engine": "soup",
     },
     "http": {
         "requests_per_second": 2.0,
         "max_concurrent": 5,
         "timeout_seconds": 15,
         "max_retries": 2,
+        "per_host_max_concurrent": 2,
+        "per_host_requests_per_second": 1.0,
+        "max_body_bytes": 2097152,
+        "cache_path": "",
+        "cache_max_age_seconds": 604800,
+        "cache_max_bytes": 104857600,
     },
     "k8s": {
         "requests_per_second": 5.0,
+        "watch_timeout_seconds": 300,
+        "cache_ttl_seconds": 300,
+        "snapshot_path": "",
+        "page_size": 100,
+        "include_namespaces": [],
+        "exclude_namespaces": [],
+        "label_selector": "",
+        "opt_out_annotation": "qos.acdh.oeaw.ac.at/skip",
+        "clusters": [],
+    },
+    "rancher": {
+        "max_concurrent": 8,
+        "requests_per_second": 10.0,
     },
     "runner": {
-        "batch_size": 10,
-        "batch_delay": 2.0,
+        "workers": 10,
+        "report_interval_seconds": 30.0,
         "max_services": 0,
         "dry_run": False,
+        "watch": False,
     },
     "redmine": {
         "url": "http://redmine-prod.redmine.svc.cluster.local:3000",
         "request_interval_seconds": 1.0,
+        "max_connections": 4,
+        "update_date_policy": "always",
+        "metadata_cache_path": "",
+        "metadata_cache_ttl_seconds": 3600,
     },
 }
 
@@ -124,6 +149,10 @@ def _apply_env_overrides(config):
     if imprint_keywords:
         config["checks"]["imprint_keywords"] = _parse_list(imprint_keywords)
 
+    config["checks"]["engine"] = os.getenv(
+        "QOS_CHECK_ENGINE", config["checks"]["engine"]
+    )
+
     config["http"]["requests_per_second"] = _float_env(
         "QOS_HTTP_REQUESTS_PER_SECOND", config["http"]["requests_per_second"]
     )
@@ -136,16 +165,67 @@ def _apply_env_overrides(config):
     config["http"]["max_retries"] = _int_env(
         "QOS_HTTP_MAX_RETRIES", config["http"]["max_retries"]
     )
+    config["http"]["per_host_max_concurrent"] = _int_env(
+        "QOS_HTTP_PER_HOST_MAX_CONCURRENT", config["http"]["per_host_max_concurrent"]
+    )
+    config["http"]["per_host_requests_per_second"] = _float_env(
+        "QOS_HTTP_PER_HOST_REQUESTS_PER_SECOND", config["http"]["per_host_requests_per_second"]
+    )
+    config["http"]["max_body_bytes"] = _int_env(
+        "QOS_HTTP_MAX_BODY_BYTES", config["http"]["max_body_bytes"]
+    )
+    config["http"]["cache_path"] = os.getenv(
+        "QOS_HTTP_CACHE_PATH", config["http"]["cache_path"]
+    )
+    config["http"]["cache_max_age_seconds"] = _int_env(
+        "QOS_HTTP_CACHE_MAX_AGE_SECONDS", config["http"]["cache_max_age_seconds"]
+    )
+    config["http"]["cache_max_bytes"] = _int_env(
+        "QOS_HTTP_CACHE_MAX_BYTES", config["http"]["cache_max_bytes"]
+    )
 
     config["k8s"]["requests_per_second"] = _float_env(
         "QOS_K8S_REQUESTS_PER_SECOND", config["k8s"]["requests_per_second"]
     )
+    config["k8s"]["watch_timeout_seconds"] = _int_env(
+        "QOS_K8S_WATCH_TIMEOUT_SECONDS", config["k8s"]["watch_timeout_seconds"]
+    )
+    config["k8s"]["cache_ttl_seconds"] = _float_env(
+        "QOS_K8S_CACHE_TTL_SECONDS", config["k8s"]["cache_ttl_seconds"]
+    )
+    config["k8s"]["snapshot_path"] = os.getenv(
+        "QOS_K8S_SNAPSHOT_PATH", config["k8s"]["snapshot_path"]
+    )
+    config["k8s"]["page_size"] = _int_env(
+        "QOS_K8S_PAGE_SIZE", config["k8s"]["page_size"]
+    )
+    include_namespaces = os.getenv("QOS_K8S_INCLUDE_NAMESPACES")
+    if include_namespaces is not None:
+        config["k8s"]["include_namespaces"] = _parse_list(include_namespaces)
+    exclude_namespaces = os.getenv("QOS_K8S_EXCLUDE_NAMESPACES")
+    if exclude_namespaces is not None:
+        config["k8s"]["exclude_namespaces"] = _parse_list(exclude_namespaces)
+    config["k8s"]["label_selector"] = os.getenv(
+        "QOS_K8S_LABEL_SELECTOR", config["k8s"]["label_selector"]
+    )
+    config["k8s"]["opt_out_annotation"] = os.getenv(
+        "QOS_K8S_OPT_OUT_ANNOTATION", config["k8s"]["opt_out_annotation"]
+    )
+    contexts = os.getenv("QOS_K8S_CONTEXTS")
+    if contexts is not None:
+        config["k8s"]["clusters"] = _parse_list(contexts)
+    config["rancher"]["max_concurrent"] = _int_env(
+        "QOS_RANCHER_MAX_CONCURRENT", config["rancher"]["max_concurrent"]
+    )
+    config["rancher"]["requests_per_second"] = _float_env(
+        "QOS_RANCHER_REQUESTS_PER_SECOND", config["rancher"]["requests_per_second"]
+    )
 
-    config["runner"]["batch_size"] = _int_env(
-        "QOS_BATCH_SIZE", config["runner"]["batch_size"]
+    config["runner"]["workers"] = _int_env(
+        "QOS_RUNNER_WORKERS", config["runner"]["workers"]
     )
-    config["runner"]["batch_delay"] = _float_env(
-        "QOS_BATCH_DELAY", config["runner"]["batch_delay"]
+    config["runner"]["report_interval_seconds"] = _float_env(
+        "QOS_RUNNER_REPORT_INTERVAL_SECONDS", config["runner"]["report_interval_seconds"]
     )
     config["runner"]["max_services"] = _int_env(
         "QOS_MAX_SERVICES", config["runner"]["max_services"]
@@ -153,11 +233,28 @@ def _apply_env_overrides(config):
     config["runner"]["dry_run"] = _bool_env(
         "QOS_DRY_RUN", config["runner"]["dry_run"]
     )
+    config["runner"]["watch"] = _bool_env(
+        "QOS_RUNNER_WATCH", config["runner"]["watch"]
+    )
 
     config["redmine"]["request_interval_seconds"] = _float_env(
         "QOS_REDMINE_REQUEST_INTERVAL_SECONDS",
         config["redmine"]["request_interval_seconds"],
     )
+    config["redmine"]["max_connections"] = _int_env(
+        "QOS_REDMINE_MAX_CONNECTIONS",
+        config["redmine"]["max_connections"],
+    )
+    config["redmine"]["update_date_policy"] = os.getenv(
+        "QOS_REDMINE_UPDATE_DATE_POLICY", config["redmine"]["update_date_policy"]
+    )
+    config["redmine"]["metadata_cache_path"] = os.getenv(
+        "QOS_REDMINE_METADATA_CACHE_PATH", config["redmine"]["metadata_cache_path"]
+    )
+    config["redmine"]["metadata_cache_ttl_seconds"] = _int_env(
+        "QOS_REDMINE_METADATA_CACHE_TTL_SECONDS",
+        config["redmine"]["metadata_cache_ttl_seconds"],
+    )
 
     return config
 
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Decode cost of service pages sent without a charset: statistical detection versus the explicit path.
+
+"detect" is what resp.text() does when the Content-Type has no charset and the session
+resolves it by detection (aiohttp before 3.9 ran chardet/charset-normalizer on the body).
+"explicit" is ResilientHttpClient's path: header charset, <meta> charset, else UTF-8.
+
+    python3 dev/bench_charset.py [--size-kb 512] [--repeat 5]
+"""
+import argparse
+import codecs
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from utils.http_client import CHUNK_SIZE, body_encoding
+
+try:
+    from charset_normalizer import detect
+except ImportError:
+    detect = None
+
+ROW = '<div class="row"><a href="/p/{0}">Eintrag {0} – Grüße aus Wien</a><img src="/i/{0}.png" alt=""></div>\n'
+
+
+def page(size: int, encoding: str, meta: bool) -> bytes:
+    head = f'<html lang="de"><head><meta charset="{encoding}">' if meta else '<html lang="de"><head>'
+    parts = [head, "<title>Service</title></head><body>"]
+    length = 0
+    i = 0
+    while length < size:
+        row = ROW.format(i)
+        parts.append(row)
+        length += len(row)
+        i += 1
+    parts.append("</body></html>")
+    return "".join(parts).encode(encoding)
+
+
+def decode_detect(body: bytes):
+    encoding = detect(body)["encoding"] or "utf-8"
+    return body.decode(encoding, errors="replace"), encoding
+
+
+def decode_explicit(body: bytes):
+    encoding = body_encoding(None, body)
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    parts = [decoder.decode(body[i:i + CHUNK_SIZE]) for i in range(0, len(body), CHUNK_SIZE)]
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts), encoding
+
+
+def timed(func, body: bytes, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text, encoding = func(body)
+        best = min(best, time.perf_counter() - start)
+    return best, encoding, "Grüße" in text
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-kb", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if detect is None:
+        sys.exit("charset-normalizer is not installed")
+
+    cases = [
+        ("utf-8, no meta", page(args.size_kb * 1024, "utf-8", meta=False)),
+        ("utf-8, meta", page(args.size_kb * 1024, "utf-8", meta=True)),
+        ("windows-1252, meta", page(args.size_kb * 1024, "windows-1252", meta=True)),
+        # undeclared legacy encoding: the explicit path replaces the non-ASCII bytes
+        ("windows-1252, none", page(args.size_kb * 1024, "windows-1252", meta=False)),
+    ]
+    for name, body in cases:
+        for label, func in (("detect", decode_detect), ("explicit", decode_explicit)):
+            elapsed, encoding, readable = timed(func, body, args.repeat)
+            print(
+                f"{name:20} {label:9} {elapsed * 1000:9.2f} ms  {encoding:14} "
+                f"{'text ok' if readable else 'mojibake'}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Compare kubernetes model deserialization with the raw-JSON slim path on a synthetic ingress list.
+
+    python3 dev/bench_k8s_list.py [--items 20000] [--repeat 3]
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from types import SimpleNamespace
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from kubernetes.client import ApiClient
+
+from utils.k8s_client import SlimIngress, _RawPage
+
+
+def synthetic_list(count: int) -> bytes:
+    items = []
+    for i in range(count):
+        items.append({
+            "metadata": {
+                "name": f"ingress-{i}",
+                "namespace": f"ns-{i % 200}",
+                "uid": f"00000000-0000-0000-0000-{i:012d}",
+                "resourceVersion": str(100000 + i),
+                "creationTimestamp": "2024-01-01T00:00:00Z",
+                "labels": {"app": f"app-{i}", "team": "acdh"},
+                "annotations": {
+                    "kubectl.kubernetes.io/last-applied-configuration": "{" + "x" * 400 + "}",
+                    "cert-manager.io/cluster-issuer": "letsencrypt",
+                },
+                "managedFields": [{"manager": "kubectl", "operation": "Update", "apiVersion": "networking.k8s.io/v1"}],
+            },
+            "spec": {
+                "ingressClassName": "nginx",
+                "tls": [{"hosts": [f"app-{i}.example.org"], "secretName": f"tls-{i}"}],
+                "rules": [{
+                    "host": f"app-{i}.example.org",
+                    "http": {"paths": [{
+                        "path": "/",
+                        "pathType": "Prefix",
+                        "backend": {"service": {"name": f"svc-{i}", "port": {"number": 80}}},
+                    }]},
+                }],
+            },
+            "status": {"loadBalancer": {"ingress": [{"ip": "10.0.0.1"}]}},
+        })
+    return json.dumps({"apiVersion": "networking.k8s.io/v1", "kind": "IngressList", "metadata": {"resourceVersion": "1"}, "items": items}).encode()
+
+
+def model_path(body: bytes):
+    api_client = ApiClient()
+    text = body.decode("utf-8")
+    try:
+        return api_client.deserialize(text, "V1IngressList", "application/json")
+    except TypeError:
+        # older kubernetes clients take (response, response_type) only
+        return api_client.deserialize(SimpleNamespace(data=text), "V1IngressList")
+
+
+def slim_path(body: bytes):
+    return _RawPage(json.loads(body), SlimIngress)
+
+
+def measure(func, body: bytes, repeat: int):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(body)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    result = func(body)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, current, peak, len(result.items)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    body = synthetic_list(args.items)
+    print(f"{args.items} ingresses, {len(body) / 1e6:.1f} MB JSON")
+    for name, func in (("model", model_path), ("slim", slim_path)):
+        best, retained, peak, count = measure(func, body, args.repeat)
+        print(f"{name:6} {best * 1000:9.1f} ms  retained {retained / 1e6:7.1f} MB  peak {peak / 1e6:7.1f} MB  ({count} items)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Wakeups per granted token of the queue-based RateLimiter versus the former polling loop.
+
+    python3 dev/bench_rate_limiter.py [--waiters 2000] [--rate 4000]
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from utils.rate_limiter import RateLimiter
+
+
+class PollingRateLimiter:
+    """The previous implementation: every waiter sleeps for the computed wait and retries."""
+
+    def __init__(self, requests_per_second: float, burst: int):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self.wakeups = 0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            elapsed = now - self._last_refill
+            self._tokens = min(self.burst, self._tokens + elapsed * self.requests_per_second)
+            self._last_refill = now
+
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return
+
+            wait = (1.0 - self._tokens) / self.requests_per_second
+            await asyncio.sleep(wait)
+            self.wakeups += 1
+
+
+async def run(limiter, waiters: int):
+    order = []
+
+    async def take(i):
+        await limiter.acquire()
+        order.append(i)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(take(i) for i in range(waiters)))
+    elapsed = time.perf_counter() - start
+    in_order = sum(1 for a, b in zip(order, order[1:]) if a < b) / max(1, len(order) - 1)
+    return elapsed, in_order
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--waiters", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=4000.0)
+    args = parser.parse_args()
+
+    polling = PollingRateLimiter(args.rate, burst=1)
+    elapsed, in_order = asyncio.run(run(polling, args.waiters))
+    # each waiter resumes once per sleep
+    print(f"polling  {elapsed:6.2f}s  {polling.wakeups / args.waiters:8.2f} wakeups/token  {in_order:6.1%} FIFO")
+
+    queued = RateLimiter(args.rate, burst=1)
+    elapsed, in_order = asyncio.run(run(queued, args.waiters))
+    # each waiter resumes exactly once when granted, plus the refill timer
+    wakeups = queued.stats.waited + queued.stats.timer_wakeups
+    print(
+        f"queued   {elapsed:6.2f}s  {wakeups / args.waiters:8.2f} wakeups/token  {in_order:6.1%} FIFO"
+        f"  (avg wait {queued.stats.average_wait * 1000:.1f} ms, max {queued.stats.max_wait * 1000:.1f} ms)"
+    )
+
+
+if __name__ == "__main__":
+    main()
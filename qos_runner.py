@@ -1,13 +1,18 @@
 import asyncio
 import logging
+import os
 import traceback
 from dataclasses import dataclass
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
-from checks import check_acdh_logo, check_helpdesk_email, check_accessibility, check_imprint_page
+from checks import check_acdh_logo, check_helpdesk_email, check_accessibility, check_imprint_page, parse_page
 from config import config as app_config
+from utils.endpoints import SharedChecks, normalize_url
 from utils.http_client import ResilientHttpClient
-from utils.k8s_client import ThrottledK8sClient
+from utils.k8s_client import DiscoveryFilter, ThrottledK8sClient
+from utils.k8s_clusters import ClusterSpec, merge_streams, parse_clusters
+from utils.k8s_inventory import REMOVED, IngressInventory, ingress_hosts
+from utils.scheduler import BoundedScheduler
 
 logger = logging.getLogger(__name__)
 
@@ -18,11 +23,27 @@ class QoSConfig:
     max_concurrent_http: int
     http_timeout: int
     max_retries: int
+    per_host_max_concurrent: int
+    per_host_requests_per_second: float
+    max_body_bytes: int
+    http_cache_path: str
+    http_cache_max_age: float
+    http_cache_max_bytes: int
     k8s_requests_per_second: float
-    batch_size: int
-    batch_delay: float
+    k8s_watch_timeout: int
+    k8s_cache_ttl: float
+    k8s_snapshot_path: str
+    k8s_page_size: int
+    k8s_include_namespaces: List[str]
+    k8s_exclude_namespaces: List[str]
+    k8s_label_selector: str
+    k8s_opt_out_annotation: str
+    k8s_clusters: List[ClusterSpec]
+    workers: int
+    report_interval: float
     max_services: int
     dry_run: bool
+    watch: bool
 
     @classmethod
     def from_config(cls, cfg: Dict[str, Any]):
@@ -31,11 +52,27 @@ class QoSConfig:
             max_concurrent_http=cfg["http"]["max_concurrent"],
             http_timeout=cfg["http"]["timeout_seconds"],
             max_retries=cfg["http"]["max_retries"],
+            per_host_max_concurrent=cfg["http"]["per_host_max_concurrent"],
+            per_host_requests_per_second=cfg["http"]["per_host_requests_per_second"],
+            max_body_bytes=cfg["http"]["max_body_bytes"],
+            http_cache_path=cfg["http"]["cache_path"],
+            http_cache_max_age=cfg["http"]["cache_max_age_seconds"],
+            http_cache_max_bytes=cfg["http"]["cache_max_bytes"],
             k8s_requests_per_second=cfg["k8s"]["requests_per_second"],
-            batch_size=cfg["runner"]["batch_size"],
-            batch_delay=cfg["runner"]["batch_delay"],
+            k8s_watch_timeout=cfg["k8s"]["watch_timeout_seconds"],
+            k8s_cache_ttl=cfg["k8s"]["cache_ttl_seconds"],
+            k8s_snapshot_path=cfg["k8s"]["snapshot_path"],
+            k8s_page_size=cfg["k8s"]["page_size"],
+            k8s_include_namespaces=cfg["k8s"]["include_namespaces"],
+            k8s_exclude_namespaces=cfg["k8s"]["exclude_namespaces"],
+            k8s_label_selector=cfg["k8s"]["label_selector"],
+            k8s_opt_out_annotation=cfg["k8s"]["opt_out_annotation"],
+            k8s_clusters=parse_clusters(cfg["k8s"]["clusters"]),
+            workers=cfg["runner"]["workers"],
+            report_interval=cfg["runner"]["report_interval_seconds"],
             max_services=cfg["runner"]["max_services"],
             dry_run=cfg["runner"]["dry_run"],
+            watch=cfg["runner"]["watch"],
         )
 
 
@@ -55,6 +92,43 @@ def format_checks_for_redmine(checks: List[Dict[str, Any]]) -> str:
     return "\n".join(lines)
 
 
+def result_title(result: Dict[str, Any]) -> str:
+    if result.get("cluster"):
+        return f"[{result['cluster']}] {result['service']}"
+    return result["service"]
+
+
+def ingress_services(ingress: Any, hosts=None, cluster: str = "") -> List[Dict[str, Any]]:
+    """Services (one per host rule) of an ingress, optionally limited to the given hosts."""
+    annotations = getattr(ingress.metadata, "annotations", {}) or {}
+    services = []
+    for rule in getattr(ingress.spec, "rules", []) or []:
+        if getattr(rule, "host", None) and (hosts is None or rule.host in hosts):
+            services.append({
+                "name": f"{ingress.metadata.namespace}/{ingress.metadata.name}",
+                "namespace": ingress.metadata.namespace,
+                "cluster": cluster,
+                "url": f"https://{rule.host}",
+                "annotations": annotations,
+            })
+    return services
+
+
+def build_failure_result(service: Dict[str, Any], error: Exception) -> Dict[str, Any]:
+    return {
+        "service": service.get("name", "unknown"),
+        "cluster": service.get("cluster", ""),
+        "url": service.get("url", ""),
+        "checks": [
+            {
+                "check": "Service Execution",
+                "status": "ERROR",
+                "details": f"{type(error).__name__}: {error}",
+            }
+        ],
+    }
+
+
 async def fetch_service_page(
     http_client: ResilientHttpClient,
     url: str,
@@ -68,135 +142,208 @@ async def fetch_service_page(
             "text": "<html><head><title>Dry run</title></head><body>Dry run content</body></html>",
             "error": None,
             "skipped": False,
+            "truncated": False,
+            "encoding": "utf-8",
+            "cached": False,
+            "not_modified": False,
         }
     return await http_client.get(url)
 
 
-async def run_checks_for_service(
-    http_client: ResilientHttpClient,
-    url: str,
-    service_name: str,
-    dry_run: bool,
-) -> Dict[str, Any]:
-    result = {"service": service_name, "url": url, "checks": []}
+async def check_url(http_client: ResilientHttpClient, url: str, dry_run: bool) -> List[Dict[str, Any]]:
     response = await fetch_service_page(http_client, url, dry_run)
 
     if response["skipped"]:
-        result["checks"].append({
+        return [{
             "check": "All",
             "status": "SKIP",
             "details": f"Skipped: {response['error']}",
-        })
-        return result
+        }]
 
     if response["error"] or response["status"] >= 400:
         error_detail = response["error"] or f"HTTP {response['status']}"
-        result["checks"].append({
+        return [{
             "check": "Reachability",
             "status": "FAIL",
             "details": error_detail,
-        })
-        return result
+        }]
 
     html = response["text"]
+    page = parse_page(html, url)
 
-    result["checks"] = [
-        check_acdh_logo(html=html, url=url),
-        check_helpdesk_email(html=html),
-        await check_imprint_page(html=html, url=url, http_client=http_client),
-        check_accessibility(html=html, url=url),
+    return [
+        check_acdh_logo(html=html, url=url, page=page),
+        check_helpdesk_email(html=html, page=page),
+        await check_imprint_page(html=html, url=url, http_client=http_client, page=page),
+        check_accessibility(html=html, url=url, page=page),
     ]
-    return result
+
+
+async def run_checks_for_service(
+    http_client: ResilientHttpClient,
+    url: str,
+    service_name: str,
+    dry_run: bool,
+    cluster: str = "",
+    shared: Optional[SharedChecks] = None,
+) -> Dict[str, Any]:
+    """Check a service's URL; with `shared`, services pointing at the same URL share one check."""
+    url = normalize_url(url)
+    if shared is None:
+        checks = await check_url(http_client, url, dry_run)
+    else:
+        checks = await shared.run(url, lambda u: check_url(http_client, u, dry_run))
+    return {"service": service_name, "cluster": cluster, "url": url, "checks": checks}
+
+
+def create_k8s_clients(config: QoSConfig) -> List[ThrottledK8sClient]:
+    """One client, with its own API client and rate budget, per configured cluster."""
+    discovery_filter = DiscoveryFilter(
+        include_namespaces=config.k8s_include_namespaces,
+        exclude_namespaces=config.k8s_exclude_namespaces,
+        label_selector=config.k8s_label_selector,
+        opt_out_annotation=config.k8s_opt_out_annotation,
+    )
+    clusters = config.k8s_clusters or [ClusterSpec(name="")]
+    clients = []
+    for cluster in clusters:
+        snapshot_path = config.k8s_snapshot_path or None
+        if snapshot_path and len(clusters) > 1:
+            root, ext = os.path.splitext(snapshot_path)
+            snapshot_path = f"{root}.{cluster.name}{ext}"
+        clients.append(ThrottledK8sClient(
+            requests_per_second=config.k8s_requests_per_second,
+            cache_ttl_seconds=config.k8s_cache_ttl,
+            snapshot_path=snapshot_path,
+            page_size=config.k8s_page_size,
+            discovery_filter=discovery_filter,
+            context=cluster.context,
+            kubeconfig=cluster.kubeconfig,
+            cluster_name=cluster.name,
+        ))
+    return clients
+
+
+async def cluster_ingresses(clients: List[ThrottledK8sClient]):
+    """Yield (cluster name, ingress) pairs, discovering all clusters concurrently."""
+    if len(clients) == 1:
+        async for ingress in clients[0].list_ingresses(slim=True):
+            yield clients[0].cluster_name, ingress
+        return
+    async for item in merge_streams({k8s.cluster_name: k8s.list_ingresses(slim=True) for k8s in clients}):
+        yield item
+
+
+async def watch_services(clients: List[ThrottledK8sClient], http_client: ResilientHttpClient, config: QoSConfig):
+    """Check the hosts of new and changed ingresses as the watched inventories report them."""
+    inventories = {
+        k8s.cluster_name: IngressInventory(k8s, watch_timeout_seconds=config.k8s_watch_timeout)
+        for k8s in clients
+    }
+    # hosts reported by several ingresses at once are checked once; later changes are checked again
+    shared = SharedChecks(keep_results=False)
+
+    async def changed_services():
+        async for cluster, event in merge_streams({name: inv.events() for name, inv in inventories.items()}):
+            if event.type == REMOVED:
+                logger.info("Ingress %s removed", event.key)
+                continue
+            hosts = ingress_hosts(event.ingress) - ingress_hosts(event.previous)
+            if not hosts:
+                logger.debug("Ingress %s %s without new hosts", event.key, event.type)
+                continue
+            logger.info("Ingress %s %s, checking %s", event.key, event.type, ", ".join(sorted(hosts)))
+            for service in ingress_services(event.ingress, hosts, cluster):
+                yield service
+
+    logger.info("Watching ingresses")
+    async for result in check_services(http_client, changed_services(), config, shared):
+        logger.info("%s\n%s", result_title(result), format_checks_for_redmine(result["checks"]))
+
+
+async def check_services(http_client: ResilientHttpClient, services, config: QoSConfig, shared: SharedChecks):
+    """Yield a result per service as soon as it is ready, with up to `config.workers` services checked at a time."""
+    scheduler = BoundedScheduler(config.workers, report_interval=config.report_interval)
+
+    async def check(service: Dict[str, Any]) -> Dict[str, Any]:
+        return await run_checks_for_service(
+            http_client,
+            service["url"],
+            service["name"],
+            config.dry_run,
+            service["cluster"],
+            shared,
+        )
+
+    async for service, result in scheduler.map(check, services, ordered=False):
+        if isinstance(result, Exception):
+            logger.error("Service task failed: %s", traceback.format_exception_only(type(result), result)[0].strip())
+            result = build_failure_result(service, result)
+        yield result
 
 
 async def main():
     config = QoSConfig.from_config(app_config)
     logger.info(
-        "Starting QoS run: http_rps=%s max_http=%s timeout=%ss batch_size=%s batch_delay=%ss k8s_rps=%s",
+        "Starting QoS run: http_rps=%s max_http=%s timeout=%ss workers=%s k8s_rps=%s",
         config.http_requests_per_second,
         config.max_concurrent_http,
         config.http_timeout,
-        config.batch_size,
-        config.batch_delay,
+        config.workers,
         config.k8s_requests_per_second,
     )
-    k8s = ThrottledK8sClient(requests_per_second=config.k8s_requests_per_second)
-    logger.info("Starting service discovery")
+    clients = create_k8s_clients(config)
+    logger.info("Starting service discovery in %s cluster(s)", len(clients))
     service_count = 0
+    # (cluster, service name) => ingress, to drop results of ingresses deleted since the snapshot
+    sources: Dict[Tuple[str, str], Any] = {}
 
-    async def iter_service_batches():
+    async def discovered_services():
         nonlocal service_count
-        batch: List[Dict[str, Any]] = []
-        async for ingress in k8s.list_ingresses():
-            annotations = getattr(ingress.metadata, "annotations", {}) or {}
-            for rule in getattr(ingress.spec, "rules", []) or []:
-                if getattr(rule, "host", None):
-                    service_count += 1
-                    batch.append({
-                        "name": f"{ingress.metadata.namespace}/{ingress.metadata.name}",
-                        "namespace": ingress.metadata.namespace,
-                        "url": f"https://{rule.host}",
-                        "annotations": annotations,
-                    })
-                    if len(batch) >= config.batch_size:
-                        yield batch
-                        batch = []
-                    if config.max_services > 0 and service_count >= config.max_services:
-                        if batch:
-                            yield batch
-                        return
-        if batch:
-            yield batch
-
-    def _build_failure_result(service: Dict[str, Any], error: Exception) -> Dict[str, Any]:
-        return {
-            "service": service.get("name", "unknown"),
-            "url": service.get("url", ""),
-            "checks": [
-                {
-                    "check": "Service Execution",
-                    "status": "ERROR",
-                    "details": f"{type(error).__name__}: {error}",
-                }
-            ],
-        }
+        async for cluster, ingress in cluster_ingresses(clients):
+            for service in ingress_services(ingress, cluster=cluster):
+                service_count += 1
+                sources[(cluster, service["name"])] = ingress
+                yield service
+                if config.max_services > 0 and service_count >= config.max_services:
+                    return
 
     async with ResilientHttpClient(
         requests_per_second=config.http_requests_per_second,
         max_concurrent=config.max_concurrent_http,
         timeout_seconds=config.http_timeout,
         max_retries=config.max_retries,
+        per_host_max_concurrent=config.per_host_max_concurrent,
+        per_host_requests_per_second=config.per_host_requests_per_second,
+        max_body_bytes=config.max_body_bytes,
+        cache_path=config.http_cache_path or None,
+        cache_max_age_seconds=config.http_cache_max_age,
+        cache_max_bytes=config.http_cache_max_bytes,
     ) as http_client:
-        all_results = []
-        batch_num = 0
-        async for batch in iter_service_batches():
-            batch_num += 1
-            logger.info("Processing batch %s", batch_num)
-            tasks = [
-                run_checks_for_service(
-                    http_client,
-                    svc["url"],
-                    svc["name"],
-                    config.dry_run,
-                )
-                for svc in batch
-            ]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-
-            for service, result in zip(batch, results):
-                if isinstance(result, Exception):
-                    logger.error("Service task failed: %s", traceback.format_exception_only(type(result), result)[0].strip())
-                    all_results.append(_build_failure_result(service, result))
-                else:
-                    all_results.append(result)
-
-            logger.info("Batch delay: %ss", config.batch_delay)
-            await asyncio.sleep(config.batch_delay)
+        if config.watch:
+            await watch_services(clients, http_client, config)
+            return
+
+        shared = SharedChecks()
+        # services are checked while discovery is still streaming; pacing comes from the HTTP rate limiter
+        all_results = [result async for result in check_services(http_client, discovered_services(), config, shared)]
+
+    clients_by_cluster = {k8s.cluster_name: k8s for k8s in clients}
+    current_results = [
+        result for result in all_results
+        if not clients_by_cluster[result["cluster"]].is_removed(sources[(result["cluster"], result["service"])])
+    ]
+    if len(current_results) < len(all_results):
+        logger.info("Dropping results of %s services whose ingress no longer exists", len(all_results) - len(current_results))
+        all_results = current_results
 
     logger.info("Discovered %s services", service_count)
+    logger.info("Checked %s unique URLs, %s duplicate fetches avoided", shared.started, shared.saved)
+    if http_client.cache:
+        logger.info("%s pages unchanged since an earlier run were served from the HTTP cache", http_client.cache.hits)
     logger.info("QoS check run finished")
     for result in all_results:
-        logger.info("%s\n%s", result["service"], format_checks_for_redmine(result["checks"]))
+        logger.info("%s\n%s", result_title(result), format_checks_for_redmine(result["checks"]))
 
 
 if __name__ == "__main__":
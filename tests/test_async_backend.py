@@ -0,0 +1,217 @@
+import asyncio
+import datetime
+import json
+import unittest
+
+from acdhQos.async_backend import AsyncRedmine, AsyncRedmineRecord, AsyncResponse
+from acdhQos.backend import RecordDuplicated, RecordError
+
+
+class DummyAsyncRedmine(AsyncRedmine):
+    def __init__(self, responses=None, updateDatePolicy='always'):
+        super().__init__('https://redmine.example.invalid', requestInterval=0, updateDatePolicy=updateDatePolicy)
+        self.customFields = {
+            'container_name': {'id': 1},
+            'server': {'id': 2},
+            'qos_update_date': {'id': 3},
+        }
+        self.envTypes = {'production': 99}
+        self.logIssueId = 42
+        self.responses = responses or {}
+        self.calls = []
+
+    async def _send(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        return self.responses.get(method, AsyncResponse(200, '{}'))
+
+
+def issue(name='app', server='cluster', updated='2000-01-01'):
+    return {
+        'tracker': {'name': 'Service'},
+        'custom_fields': [
+            {'id': 1, 'name': 'container_name', 'value': name},
+            {'id': 2, 'name': 'server', 'value': server},
+            {'id': 3, 'name': 'qos_update_date', 'value': updated},
+        ],
+    }
+
+
+class AsyncRedmineRecordTests(unittest.TestCase):
+    def test_update_sends_custom_fields_and_env_type_relation(self):
+        redmine = DummyAsyncRedmine()
+        record = AsyncRedmineRecord(redmine.baseUrl + '/issues/7.json', redmine, issue())
+
+        asyncio.run(record.update({'name': 'app', 'server': 'cluster', 'envType': 'Production'}))
+
+        method, url, kwargs = redmine.calls[0]
+        self.assertEqual(('put', redmine.baseUrl + '/issues/7.json'), (method, url))
+        self.assertIn({'id': 3, 'value': str(datetime.date.today())}, kwargs['json']['issue']['custom_fields'])
+        method, url, kwargs = redmine.calls[1]
+        self.assertEqual(('post', redmine.baseUrl + '/issues/7/relations.json'), (method, url))
+        self.assertEqual(99, kwargs['json']['relation']['issue_to_id'])
+
+    def test_update_detects_same_day_duplicate(self):
+        redmine = DummyAsyncRedmine()
+        record = AsyncRedmineRecord(redmine.baseUrl + '/issues/7.json', redmine, issue(updated=str(datetime.date.today())))
+
+        with self.assertRaises(RecordDuplicated):
+            asyncio.run(record.update({'name': 'other', 'server': 'cluster'}))
+        self.assertEqual([], redmine.calls)
+
+    def test_failed_update_raises_record_error(self):
+        redmine = DummyAsyncRedmine({'put': AsyncResponse(422, 'invalid')})
+        record = AsyncRedmineRecord(redmine.baseUrl + '/issues/7.json', redmine, issue())
+
+        with self.assertRaises(RecordError):
+            asyncio.run(record.update({'name': 'app', 'server': 'cluster'}))
+
+    def test_save_structured_report_puts_description(self):
+        redmine = DummyAsyncRedmine()
+
+        asyncio.run(redmine.saveStructuredReport({'qos': [], 'duplicates': []}))
+
+        method, url, kwargs = redmine.calls[0]
+        self.assertEqual(('put', redmine.baseUrl + '/issues/42.json'), (method, url))
+        self.assertIn('description', kwargs['json']['issue'])
+
+
+class ChangeDetectionTests(unittest.TestCase):
+    def record(self, redmine, **kwargs):
+        data = issue(**kwargs)
+        data['relations'] = [{'issue_id': 99, 'issue_to_id': 7, 'relation_type': 'relates'}]
+        return AsyncRedmineRecord(redmine.baseUrl + '/issues/7.json', redmine, data)
+
+    def test_only_changed_fields_are_sent(self):
+        redmine = DummyAsyncRedmine()
+        asyncio.run(self.record(redmine).update({'name': 'renamed', 'server': 'cluster'}))
+
+        self.assertEqual(1, len(redmine.calls))
+        fields = redmine.calls[0][2]['json']['issue']['custom_fields']
+        self.assertEqual([1, 3], [i['id'] for i in fields])
+
+    def test_unchanged_issue_gets_date_only_update_by_default(self):
+        redmine = DummyAsyncRedmine()
+        asyncio.run(self.record(redmine).update({'name': 'app', 'server': 'cluster', 'envType': 'production'}))
+
+        self.assertEqual(1, len(redmine.calls))
+        self.assertEqual({'custom_fields': [{'id': 3, 'value': str(datetime.date.today())}]}, redmine.calls[0][2]['json']['issue'])
+
+    def test_unchanged_issue_is_not_written_with_on_change_policy(self):
+        redmine = DummyAsyncRedmine(updateDatePolicy='on_change')
+        asyncio.run(self.record(redmine).update({'name': 'app', 'server': 'cluster', 'envType': 'production'}))
+
+        self.assertEqual([], redmine.calls)
+
+    def test_issue_updated_today_is_not_written_again(self):
+        redmine = DummyAsyncRedmine()
+        asyncio.run(self.record(redmine, updated=str(datetime.date.today())).update({'name': 'app', 'server': 'cluster'}))
+
+        self.assertEqual([], redmine.calls)
+
+    def test_second_service_claiming_issue_in_same_run_is_duplicate(self):
+        redmine = DummyAsyncRedmine(updateDatePolicy='on_change')
+        asyncio.run(self.record(redmine).update({'name': 'app', 'server': 'cluster'}))
+
+        with self.assertRaises(RecordDuplicated):
+            asyncio.run(self.record(redmine).update({'name': 'other', 'server': 'cluster'}))
+
+    def test_unknown_update_date_policy_is_rejected(self):
+        with self.assertRaises(ValueError):
+            AsyncRedmine('https://redmine.example.invalid', updateDatePolicy='never')
+
+
+class PagedAsyncRedmine(DummyAsyncRedmine):
+    def __init__(self, issues):
+        super().__init__()
+        self.issues = issues
+        self.issuesPageSize = 2
+
+    async def _send(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        if url.endswith('/issues.json'):
+            offset = kwargs['params']['offset']
+            page = self.issues[offset:offset + self.issuesPageSize]
+            return AsyncResponse(200, json.dumps({'issues': page, 'offset': offset, 'total_count': len(self.issues)}))
+        return self.responses.get(method, AsyncResponse(200, '{}'))
+
+
+class IssueIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.issues = [dict(issue(name='app%d' % i), id=i) for i in range(1, 6)]
+        self.redmine = PagedAsyncRedmine(self.issues)
+        asyncio.run(self.redmine.prefetchRecords())
+
+    def test_prefetch_pages_through_all_issues(self):
+        offsets = [kwargs['params']['offset'] for _, _, kwargs in self.redmine.calls]
+        self.assertEqual([0, 2, 4], offsets)
+        self.assertEqual({1, 2, 3, 4, 5}, set(self.redmine._issueIndex))
+
+    def test_find_record_is_served_from_index(self):
+        self.redmine.calls = []
+        record = asyncio.run(self.redmine.findRecord({'id': '3'}))
+        self.assertEqual(3, record.id)
+        self.assertEqual([], self.redmine.calls)
+
+    def test_index_reflects_updates_for_duplicate_detection(self):
+        async def run():
+            record = await self.redmine.findRecord({'id': 3})
+            await record.update({'name': 'app3', 'server': 'cluster'})
+            record = await self.redmine.findRecord({'id': 3})
+            await record.update({'name': 'other', 'server': 'cluster'})
+
+        with self.assertRaises(RecordDuplicated):
+            asyncio.run(run())
+
+    def test_failed_prefetch_falls_back_to_network(self):
+        redmine = DummyAsyncRedmine({'get': AsyncResponse(500, '')})
+        asyncio.run(redmine.prefetchRecords())
+        self.assertIsNone(redmine._issueIndex)
+
+
+class MetadataTests(unittest.TestCase):
+    def test_environment_types_are_paged_and_cached(self):
+        issues = [{'id': 10 + i, 'subject': 'Env%d type' % i} for i in range(3)]
+        cache = DictCache()
+        redmine = PagedAsyncRedmine(issues)
+        redmine.customFields = None
+        redmine.metadataCache = cache
+        redmine.responses = {'get': AsyncResponse(200, json.dumps({'custom_fields': [{'id': 5, 'name': 'tags'}]}))}
+
+        asyncio.run(redmine._loadMetadata())
+
+        self.assertEqual({'env0': 10, 'env1': 11, 'env2': 12}, redmine.envTypes)
+        self.assertEqual(3, len(redmine.calls))
+
+        redmine.calls = []
+        asyncio.run(redmine._loadMetadata())
+        self.assertEqual([], redmine.calls)
+        self.assertEqual(5, redmine.customFields['tags']['id'])
+
+
+class DictCache:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value):
+        self.values[key] = value
+
+
+class AsyncThrottleTests(unittest.TestCase):
+    def test_throttle_spaces_concurrent_requests(self):
+        redmine = AsyncRedmine('https://redmine.example.invalid', requestInterval=0.05)
+
+        async def run():
+            redmine._throttleLock = asyncio.Lock()
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            await asyncio.gather(*(redmine._throttle() for _ in range(3)))
+            return loop.time() - start
+
+        self.assertGreaterEqual(asyncio.run(run()), 0.09)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
+import random
+import time
 import unittest
 
-from acdhQos.cluster import Rancher
+from acdhQos.cluster import IngressIndex, Rancher
 
 
 class DummyResponse:
@@ -19,6 +21,112 @@ class DummySession:
         return DummyResponse({'data': []})
 
 
+def label_id(ingress):
+    return Rancher.getLabel(None, ingress, 'ID')
+
+
+class IngressIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.ingresses = [
+            {'name': 'shop-frontend'},
+            {'name': 'shop-frontend-v2', 'labels': {'ID': '11'}},
+            {'name': 'api', 'workloadLabels': {'ID': '12'}},
+            {'name': 'shop', 'labels': {'ID': '13'}},
+            {'labels': {'ID': '14'}},
+        ]
+        self.index = IngressIndex(self.ingresses, label_id)
+
+    def test_matches_substrings_of_ingress_names(self):
+        self.assertEqual([0, 1, 3], self.index.find('shop'))
+        self.assertEqual([0, 1], self.index.find('frontend'))
+        self.assertEqual([0, 1], self.index.find('p-f'))
+        self.assertEqual([], self.index.find('frontend-v3'))
+
+    def test_short_names_match_through_short_grams(self):
+        self.assertEqual([2], self.index.find('ap'))
+        self.assertEqual([2], self.index.find('i'))
+        self.assertTrue(self.index.hasMatch('v2'))
+        self.assertFalse(self.index.hasMatch('x'))
+
+    def test_empty_name_matches_every_ingress(self):
+        self.assertTrue(self.index.hasMatch(''))
+        self.assertEqual('11', self.index.firstLabel(''))
+        self.assertFalse(IngressIndex([]).hasMatch(''))
+
+    def test_first_labelled_match_in_ingress_order(self):
+        # shop-frontend matches first but has no ID label
+        self.assertEqual('11', self.index.firstLabel('shop'))
+        self.assertEqual('12', self.index.firstLabel('api'))
+        self.assertIsNone(self.index.firstLabel('frontend-v3'))
+        self.assertIsNone(IngressIndex(self.ingresses).firstLabel('shop'))
+
+    def test_agrees_with_linear_scan(self):
+        rnd = random.Random(3)
+        ingresses = [{'name': ''.join(rnd.choice('abc-') for _ in range(rnd.randint(0, 12))), 'labels': {'ID': str(i)} if rnd.random() < 0.3 else {}} for i in range(200)]
+        index = IngressIndex(ingresses, label_id)
+
+        for _ in range(500):
+            name = ''.join(rnd.choice('abc-') for _ in range(rnd.randint(0, 7)))
+            expected = [pos for pos, ingress in enumerate(ingresses) if name in ingress['name']]
+            labelled = [ingress['labels']['ID'] for ingress in ingresses if name in ingress['name'] and ingress['labels']]
+            self.assertEqual(expected, index.find(name))
+            self.assertEqual(bool(expected), index.hasMatch(name))
+            self.assertEqual(labelled[0] if labelled else None, index.firstLabel(name))
+
+
+class RancherApiSession:
+    """Fake Rancher API answering with a random delay to shuffle completion order."""
+
+    def __init__(self, projects):
+        self.projects = projects
+        self.paths = []
+
+    def get(self, url, **kwargs):
+        time.sleep(random.random() / 100)
+        path = url.replace('https://example.invalid', '')
+        self.paths.append(path)
+        if path == '/projects':
+            return DummyResponse({'data': [{'id': p, 'name': p, 'clusterId': 'cluster-id'} for p in self.projects]})
+        project = path.split('/')[2]
+        if path.endswith('/workloads'):
+            return DummyResponse({'data': [
+                {'name': '%s-app%d' % (project, i), 'type': 'deployment', 'containers': [{'image': 'nginx'}],
+                 'publicEndpoints': [{'protocol': 'https', 'hostname': '%s-app%d.example.org' % (project, i)}]}
+                for i in range(5)
+            ]})
+        if path.endswith('/ingresses'):
+            return DummyResponse({'data': [{'name': '%s-app%d-ingress' % (project, i)} for i in range(5)]})
+        if path.endswith('/projectRoleTemplateBindings'):
+            return DummyResponse({'data': [{'userPrincipalId': 'ldap://CN=%s-user,OU=x' % project, 'userId': 'u1', 'roleTemplateId': 'owner'}]})
+        return DummyResponse({'data': []})
+
+
+class HarvestTests(unittest.TestCase):
+    def setUp(self):
+        self.rancher = Rancher.__new__(Rancher)
+        self.rancher.base_url = 'https://example.invalid'
+        self.rancher.clusters = {'cluster-id': 'test-cluster'}
+        self.rancher.project = None
+        self.rancher.skipProjects = ['p3']
+        self.rancher.skipTypes = []
+        self.rancher.maxConcurrent = 4
+        self.rancher.session = RancherApiSession(['p%d' % i for i in range(6)])
+
+    def test_parallel_harvest_keeps_rancher_order(self):
+        names = [i['name'] for i in self.rancher.harvest()]
+
+        self.assertEqual(['p%d-app%d' % (p, i) for p in (0, 1, 2, 4, 5) for i in range(5)], names)
+
+    def test_role_bindings_are_fetched_once_per_project(self):
+        data = self.rancher.harvest()
+
+        calls = [i for i in self.rancher.session.paths if i.endswith('/projectRoleTemplateBindings')]
+        self.assertEqual(5, len(calls))
+        self.assertEqual(20, self.rancher._projectUsersSaved)
+        self.assertEqual(['p0-user'] * 5, [i['users_short'] for i in data[:5]])
+        self.assertIsNone(self.rancher._projectUsers)
+
+
 class ProcessWorkloadTests(unittest.TestCase):
     def setUp(self):
         self.rancher = Rancher.__new__(Rancher)
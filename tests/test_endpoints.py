@@ -0,0 +1,78 @@
+import asyncio
+import unittest
+
+from utils.endpoints import SharedChecks, normalize_url, split_endpoints
+
+
+class NormalizeUrlTests(unittest.TestCase):
+    def test_equivalent_spellings_normalise_to_one_url(self):
+        for url in ('https://Shop.Example.org', 'https://shop.example.org:443/', 'shop.example.org', 'https://user@shop.example.org./#top'):
+            with self.subTest(url=url):
+                self.assertEqual('https://shop.example.org/', normalize_url(url))
+
+    def test_path_query_and_custom_port_are_kept(self):
+        self.assertEqual('http://a.example.org:8080/x/?q=1', normalize_url('HTTP://A.example.org:8080/x/?q=1'))
+
+    def test_url_without_host_is_rejected(self):
+        with self.assertRaises(ValueError):
+            normalize_url('https:///path')
+
+
+class SplitEndpointsTests(unittest.TestCase):
+    def test_multi_endpoint_values_are_split_and_deduplicated(self):
+        value = 'https://b.example.org\nhttps://a.example.org, https://B.example.org/\n\n'
+        self.assertEqual(['https://b.example.org/', 'https://a.example.org/'], split_endpoints(value))
+
+    def test_empty_value(self):
+        self.assertEqual([], split_endpoints(None))
+
+
+class SharedChecksTests(unittest.TestCase):
+    def test_each_url_is_checked_once_and_fanned_out(self):
+        calls = []
+
+        async def check(url):
+            calls.append(url)
+            await asyncio.sleep(0.01)
+            return url.upper()
+
+        async def run():
+            shared = SharedChecks()
+            results = await asyncio.gather(*(shared.run(url, check) for url in ('a', 'b', 'a', 'a')))
+            results.append(await shared.run('b', check))
+            return shared, results
+
+        shared, results = asyncio.run(run())
+        self.assertEqual(['A', 'B', 'A', 'A', 'B'], results)
+        self.assertEqual(['a', 'b'], calls)
+        self.assertEqual(3, shared.saved)
+
+    def test_without_keep_results_only_running_checks_are_shared(self):
+        calls = []
+
+        async def check(url):
+            calls.append(url)
+            await asyncio.sleep(0)
+            return url
+
+        async def run():
+            shared = SharedChecks(keep_results=False)
+            await asyncio.gather(shared.run('a', check), shared.run('a', check))
+            await shared.run('a', check)
+
+        asyncio.run(run())
+        self.assertEqual(['a', 'a'], calls)
+
+    def test_failure_reaches_every_caller(self):
+        async def check(url):
+            raise RuntimeError(url)
+
+        async def run():
+            shared = SharedChecks()
+            return await asyncio.gather(shared.run('a', check), shared.run('a', check), return_exceptions=True)
+
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in asyncio.run(run())))
+
+
+if __name__ == '__main__':
+    unittest.main()
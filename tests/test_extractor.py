@@ -0,0 +1,85 @@
+import asyncio
+import pathlib
+import random
+import unittest
+
+from checks import check_accessibility, check_acdh_logo, check_helpdesk_email, check_imprint_page, ParsedPage
+
+GOLDEN_DIR = pathlib.Path(__file__).resolve().parent / 'golden'
+
+
+def run_checks(html, engine):
+    page = ParsedPage.from_html(html, engine=engine)
+    return [
+        check_acdh_logo(html, url='https://demo.example.invalid', page=page),
+        check_helpdesk_email(html, page=page),
+        asyncio.run(check_imprint_page(html, url='https://demo.example.invalid', page=page)),
+        check_accessibility(html, url='https://demo.example.invalid', page=page),
+    ]
+
+
+def features(page):
+    def attrs(element):
+        return None if element is None else dict(element.attrs)
+
+    return {
+        'html_tag': attrs(page.html_tag),
+        'title': None if page.title is None else page.title.get_text(),
+        'h1_tags': len(page.h1_tags),
+        'images': [attrs(i) for i in page.images],
+        'links': [(attrs(a), a.get_text()) for a in page.links],
+        'inputs': [attrs(i) for i in page.inputs],
+        'label_for': page.label_for,
+        'metas': [attrs(m) for m in page.metas],
+    }
+
+
+class StreamEngineGoldenCorpusTests(unittest.TestCase):
+    def test_corpus_is_present(self):
+        self.assertGreater(len(list(GOLDEN_DIR.glob('*.html'))), 0)
+
+    def test_check_results_match_soup_engine(self):
+        for path in sorted(GOLDEN_DIR.glob('*.html')):
+            html = path.read_text(encoding='utf-8')
+            with self.subTest(page=path.name):
+                self.assertEqual(run_checks(html, 'stream'), run_checks(html, 'soup'))
+
+    def test_extracted_features_match_soup_engine(self):
+        for path in sorted(GOLDEN_DIR.glob('*.html')):
+            html = path.read_text(encoding='utf-8')
+            with self.subTest(page=path.name):
+                self.assertEqual(
+                    features(ParsedPage.from_html(html, engine='stream')),
+                    features(ParsedPage.from_html(html, engine='soup')),
+                )
+
+    def test_features_match_on_generated_markup(self):
+        fragments = [
+            '<a href="/imprint">', '<a>', '</a>', '<div>', '</div>', '<p>', '<span>', '</span>',
+            '<img src="a.png" class=" x  y ">', '</img>', '<br/>', '<title>', '</title>', '<h1>',
+            '<html lang="de">', '<script>', '</script>', '<template>', '</template>', '<pre>', '</pre>',
+            '<!-- c -->', '<![CDATA[ imprint ]]>', '<input id="i">', '<label for="i">', '</label>',
+            '<meta name="viewport">', 'Impressum', ' ', '  \n ', '&amp;', 'text',
+        ]
+        rng = random.Random(0)
+        for _ in range(300):
+            html = ''.join(rng.choice(fragments) for _ in range(rng.randint(1, 30)))
+            self.assertEqual(
+                features(ParsedPage.from_html(html, engine='stream')),
+                features(ParsedPage.from_html(html, engine='soup')),
+                html,
+            )
+
+    def test_stream_engine_does_not_build_a_tree(self):
+        page = ParsedPage.from_html('<html><body><h1>x</h1></body></html>', engine='stream')
+
+        self.assertIsNone(page.soup)
+        self.assertEqual(len(page.h1_tags), 1)
+
+    def test_rejects_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            ParsedPage.from_html('<html></html>', engine='lxml')
+
+
+if __name__ == '__main__':
+    unittest.main()
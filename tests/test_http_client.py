@@ -0,0 +1,269 @@
+import asyncio
+import email.utils
+import os
+import tempfile
+import time
+import unittest
+
+from utils.http_client import HostSlots, ResilientHttpClient, backoff_seconds, body_encoding, retry_after_seconds
+
+
+class FakeContent:
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.read = 0
+
+    async def iter_chunked(self, size):
+        while self.chunks:
+            self.read += 1
+            yield self.chunks.pop(0)
+
+    def at_eof(self):
+        return not self.chunks
+
+
+class FakeResponse:
+    def __init__(self, status, headers=None, chunks=(b'body',), charset=None, delay=0):
+        self.status = status
+        self.headers = headers or {}
+        self.url = 'http://fake.example/'
+        self.charset = charset
+        self.content = FakeContent(chunks)
+        self.delay = delay
+        self.sent = None
+
+    async def __aenter__(self):
+        self.sent = asyncio.get_running_loop().time()
+        await asyncio.sleep(self.delay)
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+
+class FakeSession:
+    """Answers each URL with the next of its queued responses."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = []
+        self.headers = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.calls.append(url)
+        self.headers.append(headers)
+        return self.responses[url].pop(0)
+
+    async def close(self):
+        pass
+
+
+class HostSlotsTests(unittest.TestCase):
+    def test_per_host_and_global_caps(self):
+        state = {'active': 0, 'peak': 0, 'host_peak': {}}
+
+        async def request(slots, host):
+            async with slots.slot(host):
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+                state['host_peak'][host] = max(state['host_peak'].get(host, 0), slots.host_active[host])
+                await asyncio.sleep(0.01)
+                state['active'] -= 1
+
+        async def run():
+            slots = HostSlots(max_concurrent=3, per_host=2)
+            await asyncio.gather(*(request(slots, host) for host in ['a'] * 6 + ['b'] * 3))
+            return slots
+
+        slots = asyncio.run(run())
+        self.assertEqual(3, state['peak'])
+        self.assertEqual(2, state['host_peak']['a'])
+        self.assertLessEqual(state['host_peak']['b'], 2)
+        self.assertEqual((0, {}), (slots.active, slots.host_active))
+
+    def test_free_slots_go_round_robin_between_hosts(self):
+        order = []
+
+        async def request(slots, host):
+            async with slots.slot(host):
+                order.append(host)
+                await asyncio.sleep(0.01)
+
+        async def run():
+            slots = HostSlots(max_concurrent=1, per_host=1)
+            # a burst for host a is queued before b and c ask for a slot
+            await asyncio.gather(*(request(slots, host) for host in ['a', 'a', 'a', 'a', 'b', 'c']))
+
+        asyncio.run(run())
+        self.assertEqual(['a', 'a', 'b', 'c', 'a', 'a'], order)
+
+    def test_cancelled_waiter_does_not_leak_a_slot(self):
+        async def run():
+            slots = HostSlots(max_concurrent=1, per_host=1)
+            await slots.acquire('a')
+            waiter = asyncio.create_task(slots.acquire('b'))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+            slots.release('a')
+            await asyncio.wait_for(slots.acquire('c'), 1)
+            return slots.host_active
+
+        self.assertEqual({'c': 1}, asyncio.run(run()))
+
+
+class RetryTests(unittest.TestCase):
+    def test_retry_after_accepts_seconds_and_http_dates(self):
+        self.assertEqual(3.0, retry_after_seconds('3', 1))
+        date = email.utils.formatdate(time.time() + 30, usegmt=True)
+        self.assertAlmostEqual(30, retry_after_seconds(date, 1), delta=2)
+        self.assertEqual(0.0, retry_after_seconds('Wed, 21 Oct 2015 07:28:00 GMT', 1))
+        self.assertEqual(1, retry_after_seconds('soon', 1))
+        self.assertEqual(120.0, retry_after_seconds('86400', 1))
+
+    def test_backoff_is_jittered_within_bounds(self):
+        delays = {backoff_seconds(2) for _ in range(50)}
+        self.assertTrue(all(2 <= d <= 4 for d in delays))
+        self.assertGreater(len(delays), 1)
+
+    def test_slot_is_released_while_backing_off(self):
+        session = FakeSession({
+            'http://slow.example/': [FakeResponse(503, {'Retry-After': '0.2'}), FakeResponse(200)],
+            'http://fast.example/': [FakeResponse(200)],
+        })
+
+        async def run():
+            client = ResilientHttpClient(requests_per_second=0, max_concurrent=1, max_retries=1, per_host_requests_per_second=0)
+            client._session = session
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            slow = asyncio.create_task(client.get('http://slow.example/'))
+            await asyncio.sleep(0.01)
+            fast = await client.get('http://fast.example/')
+            fast_time = loop.time() - start
+            return (await slow)['status'], fast['status'], fast_time
+
+        slow_status, fast_status, fast_time = asyncio.run(run())
+        self.assertEqual((200, 200), (slow_status, fast_status))
+        self.assertLess(fast_time, 0.15)
+
+    def test_requests_waiting_for_a_slot_keep_the_host_rate(self):
+        responses = [FakeResponse(200) for _ in range(3)]
+        session = FakeSession({
+            'http://busy.example/': [FakeResponse(200, delay=0.3)],
+            'http://a.example/': list(responses),
+        })
+
+        async def run():
+            client = ResilientHttpClient(
+                requests_per_second=0, max_concurrent=1, per_host_max_concurrent=1, per_host_requests_per_second=10,
+            )
+            client._session = session
+            blocker = asyncio.create_task(client.get('http://busy.example/'))
+            await asyncio.sleep(0.01)
+            # these wait for the only slot longer than three host tokens take to refill
+            await asyncio.gather(*(client.get('http://a.example/') for _ in range(3)))
+            await blocker
+
+        asyncio.run(run())
+        sent = [response.sent for response in responses]
+        gaps = [b - a for a, b in zip(sent, sent[1:])]
+        self.assertTrue(all(gap >= 0.09 for gap in gaps), gaps)
+
+
+class BodyTests(unittest.TestCase):
+    def fetch(self, response, until=None, **kwargs):
+        async def run():
+            client = ResilientHttpClient(requests_per_second=0, per_host_requests_per_second=0, **kwargs)
+            client._session = FakeSession({'http://a.example/': [response]})
+            return await client.get('http://a.example/', until=until)
+
+        return asyncio.run(run())
+
+    def test_body_is_cut_at_the_byte_cap(self):
+        response = FakeResponse(200, chunks=[b'a' * 4, b'b' * 4, b'c' * 4])
+        result = self.fetch(response, max_body_bytes=6)
+        self.assertEqual(('aaaabb', True), (result['text'], result['truncated']))
+        self.assertEqual(1, len(response.content.chunks))
+
+    def test_until_stops_the_download(self):
+        head = b'<head>' + b' ' * 2048
+        response = FakeResponse(200, chunks=[head, b'</head>' + b' ' * 2048, b'<body>'])
+        result = self.fetch(response, until=lambda text: '</head>' in text)
+        self.assertTrue(result['truncated'])
+        self.assertTrue(result['text'].rstrip().endswith('</head>'))
+        self.assertEqual(2, response.content.read)
+
+    def test_complete_body_is_not_truncated(self):
+        result = self.fetch(FakeResponse(200, chunks=[b'<p>', b'</p>']), until=lambda text: text == '</p>')
+        self.assertEqual(('<p></p>', False), (result['text'], result['truncated']))
+
+    def test_characters_split_between_chunks_are_decoded(self):
+        data = 'Grüße'.encode('utf-8')
+        result = self.fetch(FakeResponse(200, chunks=[data[:3], data[3:]]))
+        self.assertEqual('Grüße', result['text'])
+        latin = self.fetch(FakeResponse(200, chunks=['Grüße'.encode('latin-1')], charset='latin-1'))
+        self.assertEqual(('Grüße', 'iso8859-1'), (latin['text'], latin['encoding']))
+
+    def test_meta_charset_is_used_without_a_header_charset(self):
+        page = '<html><head><meta charset="windows-1252"></head><body>Grüße</body></html>'.encode('cp1252')
+        # split so the declaration and the non-ASCII text arrive in different chunks
+        result = self.fetch(FakeResponse(200, chunks=[page[:20], page[20:]]))
+        self.assertEqual(('cp1252', True), (result['encoding'], 'Grüße' in result['text']))
+
+
+class BodyEncodingTests(unittest.TestCase):
+    def test_header_then_meta_then_utf8(self):
+        meta = b'<meta http-equiv="Content-Type" content="text/html; charset=ISO-8859-2">'
+        self.assertEqual('utf-8', body_encoding('UTF-8', meta))
+        self.assertEqual('iso8859-2', body_encoding(None, meta))
+        self.assertEqual('iso8859-2', body_encoding('no-such-charset', meta))
+        self.assertEqual('utf-8', body_encoding(None, b'<html><body>'))
+
+    def test_meta_outside_the_prescan_or_bogus_is_ignored(self):
+        self.assertEqual('utf-8', body_encoding(None, b' ' * 1024 + b'<meta charset="latin-1">'))
+        self.assertEqual('utf-8', body_encoding(None, b'<meta charset="utf-16">'))
+        self.assertEqual('utf-8', body_encoding(None, b'<meta charset="x-unknown">'))
+
+
+class ConditionalRequestTests(unittest.TestCase):
+    def test_not_modified_reuses_the_cached_body(self):
+        url = 'http://a.example/'
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache.sqlite')
+
+            async def run(response):
+                client = ResilientHttpClient(requests_per_second=0, per_host_requests_per_second=0, cache_path=path)
+                session = client._session = FakeSession({url: [response]})
+                result = await client.get(url)
+                await client.__aexit__(None, None, None)
+                return result, session.headers[0]
+
+            first, sent = asyncio.run(run(FakeResponse(200, {'ETag': '"v1"'}, chunks=[b'<html>v1</html>'])))
+            self.assertIsNone(sent)
+            self.assertFalse(first['cached'])
+
+            second, sent = asyncio.run(run(FakeResponse(304, chunks=[])))
+            self.assertEqual({'If-None-Match': '"v1"'}, sent)
+            self.assertEqual(
+                (200, '<html>v1</html>', True, True),
+                (second['status'], second['text'], second['cached'], second['not_modified']),
+            )
+            self.assertFalse(first['not_modified'])
+
+    def test_truncated_bodies_are_not_cached(self):
+        with tempfile.TemporaryDirectory() as directory:
+            async def run():
+                client = ResilientHttpClient(
+                    requests_per_second=0, per_host_requests_per_second=0, max_body_bytes=4,
+                    cache_path=os.path.join(directory, 'cache.sqlite'),
+                )
+                client._session = FakeSession({'http://a.example/': [FakeResponse(200, {'ETag': '"v1"'}, chunks=[b'0123456789'])]})
+                await client.get('http://a.example/')
+                return client.cache.lookup('http://a.example/')
+
+            self.assertIsNone(asyncio.run(run()))
+
+
+if __name__ == '__main__':
+    unittest.main()
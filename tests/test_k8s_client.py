@@ -0,0 +1,366 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+from kubernetes.client import V1Ingress, V1ObjectMeta
+from kubernetes.client.rest import ApiException
+
+from utils.k8s_client import DiscoveryFilter, SlimIngress, ThrottledK8sClient
+from utils.rate_limiter import RateLimiter
+
+
+def ingress(name, version):
+    return V1Ingress(metadata=V1ObjectMeta(namespace='ns', name=name, resource_version=version))
+
+
+class FakeListCall:
+    """Paged list API call returning the current `items` two at a time."""
+    __name__ = 'list_ingress_for_all_namespaces'
+
+    def __init__(self, items, delay=0):
+        self.items = items
+        self.calls = 0
+        self.delay = delay
+
+    def __call__(self, limit=100, _continue=None, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay)
+        start = int(_continue or 0)
+        end = start + limit
+        return SimpleNamespace(
+            items=self.items[start:end],
+            metadata=SimpleNamespace(_continue=str(end) if end < len(self.items) else None, resource_version='1'),
+        )
+
+
+class BlockingWatchResponse:
+    """Watch response that sends one event and then blocks like an idle connection until closed."""
+    status = 200
+
+    def __init__(self):
+        self.closed = threading.Event()
+        self.finished = threading.Event()
+
+    def stream(self, amt=None, decode_content=False):
+        try:
+            yield b'{"type": "ADDED", "object": {"metadata": {"name": "a"}}}\n'
+            self.closed.wait(30)
+        finally:
+            self.finished.set()
+
+    def close(self):
+        self.closed.set()
+
+    def release_conn(self):
+        pass
+
+
+def make_client(ttl=300, snapshot_path=None, discovery_filter=None):
+    k8s = ThrottledK8sClient.__new__(ThrottledK8sClient)
+    k8s._cache = {}
+    k8s._cache_ttl = ttl
+    k8s._snapshot_path = snapshot_path
+    k8s._rate_limiter = RateLimiter(requests_per_second=1000, burst=1000)
+    k8s._page_size = 2
+    k8s._filter = discovery_filter or DiscoveryFilter()
+    k8s._removed = set()
+    return k8s
+
+
+def names(k8s, api_call):
+    async def run():
+        return [item.metadata.name async for item in k8s._stream_resources(api_call)]
+    return asyncio.run(run())
+
+
+class PaginationTests(unittest.TestCase):
+    def test_next_page_is_requested_while_consumer_works(self):
+        k8s = make_client(ttl=0)
+        api_call = FakeListCall([ingress(str(i), '1') for i in range(6)], delay=0.01)
+
+        async def run():
+            calls_seen = []
+            async for resp in k8s._list_pages(api_call):
+                await asyncio.sleep(0.05)
+                calls_seen.append(api_call.calls)
+            return calls_seen
+
+        self.assertEqual([2, 3, 3], asyncio.run(run()))
+
+    def test_stopping_early_cancels_the_prefetch(self):
+        k8s = make_client(ttl=0)
+        api_call = FakeListCall([ingress(str(i), '1') for i in range(6)])
+
+        async def run():
+            async for item in k8s._stream_resources(api_call):
+                return item.metadata.name
+
+        self.assertEqual('0', asyncio.run(run()))
+
+
+class ListCacheTests(unittest.TestCase):
+    def test_fresh_list_is_served_from_cache(self):
+        k8s = make_client()
+        api_call = FakeListCall([ingress('a', '1'), ingress('b', '1'), ingress('c', '1')])
+
+        self.assertEqual(['a', 'b', 'c'], names(k8s, api_call))
+        self.assertEqual(['a', 'b', 'c'], names(k8s, api_call))
+        self.assertEqual(2, api_call.calls)
+
+    def test_expired_list_yields_cached_items_then_delta(self):
+        k8s = make_client(ttl=60)
+        api_call = FakeListCall([ingress('a', '1'), ingress('b', '1')])
+        names(k8s, api_call)
+        key = next(iter(k8s._cache))
+        k8s._cache[key] = (time.time() - 120, k8s._cache[key][1])
+        api_call.items = [ingress('a', '1'), ingress('b', '2'), ingress('c', '1')]
+
+        self.assertEqual(['a', 'b', 'b', 'c'], names(k8s, api_call))
+        self.assertEqual(['a', 'b', 'c'], [i.metadata.name for i in k8s._cache[key][1]])
+
+    def test_snapshot_ingress_deleted_since_is_reported(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'snapshot.json')
+            api_call = FakeListCall([ingress('a', '1'), ingress('gone', '1')])
+            names(make_client(snapshot_path=path), api_call)
+            api_call.items = [ingress('a', '1')]
+
+            restored = make_client(ttl=60, snapshot_path=path)
+            restored.load_snapshot()
+            key = next(iter(restored._cache))
+            restored._cache[key] = (time.time() - 120, restored._cache[key][1])
+
+            async def run():
+                seen = [item async for item in restored._stream_resources(api_call)]
+                return [(item.metadata.name, restored.is_removed(item)) for item in seen]
+
+            # the consumer takes the cached items before the refresh is in
+            self.assertEqual([('a', False), ('gone', True)], asyncio.run(run()))
+            self.assertEqual(['a'], [i.metadata.name for i in restored._cache[key][1]])
+
+    def test_cached_items_missing_from_a_finished_refresh_are_skipped(self):
+        k8s = make_client(ttl=60)
+        api_call = FakeListCall([ingress('a', '1'), ingress('gone', '1'), ingress('b', '1')])
+        names(k8s, api_call)
+        key = next(iter(k8s._cache))
+        k8s._cache[key] = (time.time() - 120, k8s._cache[key][1])
+        api_call.items = [ingress('a', '1'), ingress('b', '1')]
+
+        async def run():
+            seen = []
+            async for item in k8s._stream_resources(api_call):
+                seen.append(item.metadata.name)
+                # a slow consumer: the refresh finishes while cached items are still pending
+                await asyncio.sleep(0.05)
+            return seen
+
+        self.assertEqual(['a', 'b'], asyncio.run(run()))
+
+    def test_disabled_cache_always_lists(self):
+        k8s = make_client(ttl=0)
+        api_call = FakeListCall([ingress('a', '1')])
+
+        names(k8s, api_call)
+        names(k8s, api_call)
+        self.assertEqual(2, api_call.calls)
+        self.assertEqual({}, k8s._cache)
+
+    def test_snapshot_restores_model_objects(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'snapshot.json')
+            api_call = FakeListCall([ingress('a', '1'), ingress('b', '1')])
+            names(make_client(snapshot_path=path), api_call)
+
+            restored = make_client(snapshot_path=path)
+            restored.load_snapshot()
+            self.assertEqual(['a', 'b'], names(restored, api_call))
+            self.assertEqual(1, api_call.calls)
+            item = next(iter(restored._cache.values()))[1][0]
+            self.assertIsInstance(item, V1Ingress)
+            self.assertEqual('ns', item.metadata.namespace)
+
+
+def raw_ingress(name, host, version='1'):
+    return {
+        'metadata': {'namespace': 'ns', 'name': name, 'resourceVersion': version, 'annotations': {'a': 'b'}, 'labels': {'x': 'y'}},
+        'spec': {'ingressClassName': 'nginx', 'rules': [{'host': host, 'http': {'paths': []}}]},
+        'status': {},
+    }
+
+
+class FakeRawResponse:
+    def __init__(self, data, status=200):
+        self.status = status
+        self.reason = 'OK' if status == 200 else 'Too Many Requests'
+        self.headers = {'Retry-After': '0'}
+        self.data = json.dumps(data).encode()
+        self.released = False
+
+    def release_conn(self):
+        self.released = True
+
+
+class FakeRawListCall:
+    """List API call that only answers unparsed responses, like `_preload_content=False`."""
+    __name__ = 'list_ingress_for_all_namespaces'
+
+    def __init__(self, items, statuses=()):
+        self.items = items
+        self.statuses = list(statuses)
+        self.responses = []
+
+    def __call__(self, limit=100, _continue=None, _preload_content=True, **kwargs):
+        assert _preload_content is False
+        start = int(_continue or 0)
+        end = start + limit
+        data = {
+            'metadata': {'continue': str(end) if end < len(self.items) else None, 'resourceVersion': '7'},
+            'items': self.items[start:end],
+        }
+        resp = FakeRawResponse(data, self.statuses.pop(0) if self.statuses else 200)
+        self.responses.append(resp)
+        return resp
+
+
+class SlimListTests(unittest.TestCase):
+    def test_raw_pages_yield_slim_ingresses(self):
+        k8s = make_client(ttl=0)
+        api_call = FakeRawListCall([raw_ingress('a', 'a.example.org'), raw_ingress('b', 'b.example.org'), raw_ingress('c', None)])
+
+        async def run():
+            return [item async for item in k8s._stream_resources(api_call, SlimIngress)]
+
+        items = asyncio.run(run())
+        self.assertEqual(['a', 'b', 'c'], [i.metadata.name for i in items])
+        self.assertIsInstance(items[0], SlimIngress)
+        self.assertEqual({'a': 'b'}, items[0].metadata.annotations)
+        self.assertEqual('a.example.org', items[0].spec.rules[0].host)
+        self.assertTrue(all(resp.released for resp in api_call.responses))
+
+    def test_raw_error_status_is_retried(self):
+        k8s = make_client(ttl=0)
+        api_call = FakeRawListCall([raw_ingress('a', 'a.example.org')], statuses=[429])
+
+        async def run():
+            return [item.metadata.name async for item in k8s._stream_resources(api_call, SlimIngress)]
+
+        self.assertEqual(['a'], asyncio.run(run()))
+        self.assertEqual(2, len(api_call.responses))
+
+    def test_raw_error_status_raises_api_exception(self):
+        k8s = make_client(ttl=0)
+        api_call = FakeRawListCall([raw_ingress('a', 'a.example.org')], statuses=[403])
+
+        async def run():
+            return [item async for item in k8s._stream_resources(api_call, SlimIngress)]
+
+        with self.assertRaises(ApiException) as ctx:
+            asyncio.run(run())
+        self.assertEqual(403, ctx.exception.status)
+
+    def test_snapshot_restores_slim_records(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'snapshot.json')
+            api_call = FakeRawListCall([raw_ingress('a', 'a.example.org', '3')])
+
+            async def run(k8s):
+                return [item async for item in k8s._stream_resources(api_call, SlimIngress)]
+
+            asyncio.run(run(make_client(snapshot_path=path)))
+            restored = make_client(snapshot_path=path)
+            restored.load_snapshot()
+            items = asyncio.run(run(restored))
+            self.assertEqual(1, len(api_call.responses))
+            self.assertIsInstance(items[0], SlimIngress)
+            self.assertEqual(('a.example.org', '3'), (items[0].spec.rules[0].host, items[0].metadata.resource_version))
+
+
+class RecordingListCall(FakeListCall):
+    def __init__(self, name, items):
+        super().__init__(items)
+        self.__name__ = name
+        self.kwargs = []
+
+    def __call__(self, limit=100, _continue=None, **kwargs):
+        self.kwargs.append(kwargs)
+        return super().__call__(limit, _continue)
+
+
+def annotated(namespace, name, annotations=None):
+    return V1Ingress(metadata=V1ObjectMeta(namespace=namespace, name=name, resource_version='1', annotations=annotations))
+
+
+class DiscoveryFilterTests(unittest.TestCase):
+    def discover(self, discovery_filter, items):
+        k8s = make_client(ttl=0, discovery_filter=discovery_filter)
+        list_all = RecordingListCall('list_all', items)
+        list_namespaced = RecordingListCall('list_namespaced', items)
+
+        async def run():
+            return [f'{i.metadata.namespace}/{i.metadata.name}' async for i in k8s._discover(list_all, list_namespaced)]
+
+        return asyncio.run(run()), list_all.kwargs, list_namespaced.kwargs
+
+    def test_excluded_namespaces_and_labels_are_server_side_selectors(self):
+        flt = DiscoveryFilter(exclude_namespaces=['kube-system', 'dev'], label_selector='team=acdh')
+        _, all_kwargs, namespaced_kwargs = self.discover(flt, [])
+
+        self.assertEqual([{
+            'label_selector': 'team=acdh',
+            'field_selector': 'metadata.namespace!=kube-system,metadata.namespace!=dev',
+        }], all_kwargs)
+        self.assertEqual([], namespaced_kwargs)
+
+    def test_several_included_namespaces_are_listed_one_by_one(self):
+        flt = DiscoveryFilter(include_namespaces=['a', 'b', 'c'], exclude_namespaces=['b'])
+        _, all_kwargs, namespaced_kwargs = self.discover(flt, [])
+
+        self.assertEqual([], all_kwargs)
+        self.assertEqual([{'namespace': 'a'}, {'namespace': 'c'}], namespaced_kwargs)
+
+    def test_single_included_namespace_is_a_field_selector(self):
+        _, all_kwargs, _ = self.discover(DiscoveryFilter(include_namespaces=['a']), [])
+        self.assertEqual([{'field_selector': 'metadata.namespace=a'}], all_kwargs)
+
+    def test_opted_out_and_foreign_items_are_dropped_while_streaming(self):
+        flt = DiscoveryFilter(exclude_namespaces=['dev'], opt_out_annotation='qos/skip')
+        items = [
+            annotated('web', 'a'),
+            annotated('web', 'b', {'qos/skip': 'true'}),
+            annotated('dev', 'c'),
+            annotated('web', 'd', {'qos/skip': 'false'}),
+        ]
+        found, _, _ = self.discover(flt, items)
+        self.assertEqual(['web/a', 'web/d'], found)
+
+
+class WatchTests(unittest.TestCase):
+    def test_leaving_the_watch_unblocks_its_thread(self):
+        k8s = make_client()
+        response = BlockingWatchResponse()
+        calls = []
+
+        def list_ingress_for_all_namespaces(**kwargs):
+            calls.append(kwargs)
+            return response
+
+        k8s.networking_v1 = SimpleNamespace(list_ingress_for_all_namespaces=list_ingress_for_all_namespaces)
+
+        async def run():
+            async for event_type, _ in k8s.watch_ingresses('1', timeout_seconds=60):
+                return event_type
+
+        start = time.monotonic()
+        self.assertEqual('ADDED', asyncio.run(run()))
+        self.assertTrue(response.finished.wait(5))
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual((10, 90), calls[0]['_request_timeout'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import asyncio
+import unittest
+
+from kubernetes.client import (
+    V1Container, V1Deployment, V1DeploymentSpec, V1HTTPIngressPath, V1HTTPIngressRuleValue, V1Ingress,
+    V1IngressBackend, V1IngressRule, V1IngressServiceBackend, V1IngressSpec, V1IngressTLS, V1LabelSelector,
+    V1ObjectMeta, V1PodSpec, V1PodTemplateSpec, V1Service, V1ServiceSpec,
+)
+
+from acdhQos.k8s_cluster import Kubernetes, WorkloadIndex
+
+
+def ingress(name, routes, tls=(), labels=None, namespace='web'):
+    rules = [
+        V1IngressRule(host=host, http=V1HTTPIngressRuleValue(paths=[V1HTTPIngressPath(
+            path='/', path_type='Prefix',
+            backend=V1IngressBackend(service=V1IngressServiceBackend(name=service)),
+        )]))
+        for host, service in routes
+    ]
+    return V1Ingress(
+        metadata=V1ObjectMeta(namespace=namespace, name=name, labels=labels),
+        spec=V1IngressSpec(rules=rules, tls=[V1IngressTLS(hosts=list(tls))]),
+    )
+
+
+def service(name, selector, namespace='web'):
+    return V1Service(metadata=V1ObjectMeta(namespace=namespace, name=name), spec=V1ServiceSpec(selector=selector))
+
+
+def deployment(name, labels, image='nginx', namespace='web', annotations=None):
+    return V1Deployment(
+        metadata=V1ObjectMeta(namespace=namespace, name=name, annotations=annotations),
+        spec=V1DeploymentSpec(
+            selector=V1LabelSelector(match_labels=labels),
+            template=V1PodTemplateSpec(
+                metadata=V1ObjectMeta(labels=labels),
+                spec=V1PodSpec(containers=[V1Container(name=name, image=image)]),
+            ),
+        ),
+    )
+
+
+class FakeK8s:
+    cluster_name = 'prod'
+
+    def __init__(self, ingresses, services, deployments):
+        self.lists = {'ingresses': ingresses, 'services': services, 'deployments': deployments}
+        self.calls = []
+
+    async def _stream(self, kind):
+        self.calls.append(kind)
+        for item in self.lists.get(kind, []):
+            yield item
+
+    def list_ingresses(self):
+        return self._stream('ingresses')
+
+    def list_services(self):
+        return self._stream('services')
+
+    def list_deployments(self):
+        return self._stream('deployments')
+
+    def list_stateful_sets(self):
+        return self._stream('stateful_sets')
+
+    def list_daemon_sets(self):
+        return self._stream('daemon_sets')
+
+
+class KubernetesHarvestTests(unittest.TestCase):
+    def harvest(self, ingresses, services, deployments):
+        k8s = FakeK8s(ingresses, services, deployments)
+        return asyncio.run(Kubernetes(k8s, skipTypes=['cronJob', 'job']).harvest()), k8s
+
+    def test_ingress_service_deployment_join(self):
+        data, k8s = self.harvest(
+            [ingress('shop', [('shop.acdh.oeaw.ac.at', 'shop-svc'), ('shop.acdh-cluster-2.arz.oeaw.ac.at', 'shop-svc')], tls=['shop.acdh.oeaw.ac.at'], labels={'ID': '42'})],
+            [service('shop-svc', {'app': 'shop'})],
+            [
+                deployment('shop', {'app': 'shop', 'tier': 'web'}, image='shop:1', annotations={'BackendConnection': 'db'}),
+                deployment('worker', {'app': 'worker'}),
+            ],
+        )
+
+        self.assertEqual([{
+            'name': 'shop',
+            'id': '42',
+            'endpoint': 'https://shop.acdh.oeaw.ac.at',
+            'techStack': 'shop:1',
+            'inContainerApps': None,
+            'backendConnection': 'db',
+            'users': None,
+            'users_short': '',
+            'server': 'prod',
+            'project': None,
+            'type': 'deployment',
+            'namespace': 'web',
+        }], data)
+        self.assertEqual(['ingresses', 'services', 'deployments', 'stateful_sets', 'daemon_sets'], k8s.calls)
+
+    def test_services_only_match_workloads_of_their_namespace(self):
+        data, _ = self.harvest(
+            [ingress('a', [('a.example.org', 'svc')], namespace='one')],
+            [service('svc', {'app': 'a'}, namespace='one')],
+            [deployment('a', {'app': 'a'}, namespace='two'), deployment('b', {'app': 'a'}, namespace='one')],
+        )
+        self.assertEqual([('one', 'b', 'http://a.example.org')], [(i['namespace'], i['name'], i['endpoint']) for i in data])
+
+    def test_workload_label_id_wins_over_ingress_label(self):
+        shop = deployment('shop', {'app': 'shop', 'ID': '7'})
+        data, _ = self.harvest(
+            [ingress('shop', [('shop.example.org', 'svc')], labels={'ID': '42'})],
+            [service('svc', {'app': 'shop'})],
+            [shop],
+        )
+        self.assertEqual('7', data[0]['id'])
+
+
+class WorkloadIndexTests(unittest.TestCase):
+    def test_selector_needs_all_labels(self):
+        index = WorkloadIndex([
+            ('deployment', deployment('a', {'app': 'x', 'tier': 'web'})),
+            ('deployment', deployment('b', {'app': 'x'})),
+        ])
+        self.assertEqual({0, 1}, index.select('web', {'app': 'x'}))
+        self.assertEqual({0}, index.select('web', {'app': 'x', 'tier': 'web'}))
+        self.assertEqual(set(), index.select('web', {}))
+
+
+if __name__ == '__main__':
+    unittest.main()
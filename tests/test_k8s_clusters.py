@@ -0,0 +1,49 @@
+import asyncio
+import unittest
+
+from utils.k8s_clusters import ClusterSpec, merge_streams, parse_clusters
+
+
+async def stream(items, delay=0, fail=False):
+    for item in items:
+        await asyncio.sleep(delay)
+        yield item
+    if fail:
+        raise RuntimeError('connection lost')
+
+
+class ParseClustersTests(unittest.TestCase):
+    def test_context_names_and_mappings(self):
+        clusters = parse_clusters(['prod', {'kubeconfig': '/etc/kube/dev.yaml'}, {'name': 'test', 'context': 'acdh-test'}])
+        self.assertEqual([
+            ClusterSpec('prod', 'prod'),
+            ClusterSpec('dev.yaml', None, '/etc/kube/dev.yaml'),
+            ClusterSpec('test', 'acdh-test'),
+        ], clusters)
+
+    def test_duplicate_names_are_rejected(self):
+        with self.assertRaises(ValueError):
+            parse_clusters(['prod', {'name': 'prod', 'kubeconfig': '/tmp/other'}])
+
+
+class MergeStreamsTests(unittest.TestCase):
+    def test_streams_are_consumed_concurrently(self):
+        async def run():
+            merged = merge_streams({'a': stream([1, 2, 3], 0.03), 'b': stream([4, 5, 6], 0.01)})
+            return [item async for item in merged]
+
+        items = asyncio.run(run())
+        self.assertEqual({('a', 1), ('a', 2), ('a', 3), ('b', 4), ('b', 5), ('b', 6)}, set(items))
+        self.assertEqual(('b', 4), items[0])
+
+    def test_failing_stream_does_not_stop_the_others(self):
+        async def run():
+            merged = merge_streams({'a': stream([1], fail=True), 'b': stream([2, 3], 0.01)})
+            return [item async for item in merged]
+
+        with self.assertLogs('utils.k8s_clusters', 'ERROR'):
+            self.assertEqual([('a', 1), ('b', 2), ('b', 3)], sorted(asyncio.run(run())))
+
+
+if __name__ == '__main__':
+    unittest.main()
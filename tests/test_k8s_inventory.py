@@ -0,0 +1,87 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from kubernetes.client.rest import ApiException
+
+from utils.k8s_inventory import ADDED, MODIFIED, REMOVED, IngressInventory, ingress_hosts
+
+
+def ingress(name, version, *hosts):
+    return SimpleNamespace(
+        metadata=SimpleNamespace(namespace='ns', name=name, resource_version=version, annotations={}),
+        spec=SimpleNamespace(rules=[SimpleNamespace(host=host) for host in hosts]),
+    )
+
+
+class FakeK8s:
+    """Serves list snapshots and watch streams from prepared lists; a watch item that is an exception is raised."""
+
+    def __init__(self, snapshots, watches):
+        self.snapshots = list(snapshots)
+        self.watches = list(watches)
+        self.watched_from = []
+
+    async def snapshot_ingresses(self, slim=False):
+        return self.snapshots.pop(0)
+
+    async def watch_ingresses(self, resource_version, timeout_seconds=300):
+        self.watched_from.append(resource_version)
+        if not self.watches:
+            await asyncio.sleep(3600)
+        for item in self.watches.pop(0):
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+async def collect(inventory, count):
+    events = []
+    async for event in inventory.events():
+        events.append(event)
+        if len(events) == count:
+            return events
+
+
+class IngressInventoryTests(unittest.TestCase):
+    def test_list_then_watch_events(self):
+        k8s = FakeK8s(
+            [([ingress('a', '1', 'a.example.org')], '10')],
+            [[
+                ('ADDED', ingress('b', '11', 'b.example.org')),
+                ('BOOKMARK', SimpleNamespace(metadata=SimpleNamespace(resource_version='12'))),
+                ('MODIFIED', ingress('a', '13', 'a.example.org', 'www.a.example.org')),
+                ('DELETED', ingress('b', '14', 'b.example.org')),
+            ]],
+        )
+        inventory = IngressInventory(k8s)
+
+        events = asyncio.run(collect(inventory, 4))
+
+        self.assertEqual([(ADDED, 'ns/a'), (ADDED, 'ns/b'), (MODIFIED, 'ns/a'), (REMOVED, 'ns/b')], [(e.type, e.key) for e in events])
+        self.assertEqual({'www.a.example.org'}, ingress_hosts(events[2].ingress) - ingress_hosts(events[2].previous))
+        self.assertEqual(['10'], k8s.watched_from)
+        self.assertEqual('14', inventory.resource_version)
+        self.assertEqual(['ns/a'], list(inventory.items))
+
+    def test_expired_watch_relists_and_emits_differences(self):
+        k8s = FakeK8s(
+            [
+                ([ingress('a', '1', 'a.example.org'), ingress('b', '2', 'b.example.org')], '10'),
+                ([ingress('a', '5', 'a.example.org'), ingress('c', '6', 'c.example.org')], '20'),
+            ],
+            [[ApiException(status=410)], [('ADDED', ingress('d', '21', 'd.example.org'))]],
+        )
+        inventory = IngressInventory(k8s)
+
+        events = asyncio.run(collect(inventory, 6))
+
+        self.assertEqual(
+            [(ADDED, 'ns/a'), (ADDED, 'ns/b'), (MODIFIED, 'ns/a'), (ADDED, 'ns/c'), (REMOVED, 'ns/b'), (ADDED, 'ns/d')],
+            [(e.type, e.key) for e in events],
+        )
+        self.assertEqual(['10', '20'], k8s.watched_from)
+
+
+if __name__ == '__main__':
+    unittest.main()
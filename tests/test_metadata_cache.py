@@ -0,0 +1,56 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from acdhQos.metadata_cache import CUSTOM_FIELDS, ENV_TYPES, MetadataCache
+
+
+class MetadataCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'metadata.json')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_value_is_reused_until_ttl_expires(self):
+        MetadataCache(self.path, 'https://redmine.example.invalid/', ttl=60).set(CUSTOM_FIELDS, {'custom_fields': []})
+
+        cache = MetadataCache(self.path, 'https://redmine.example.invalid', ttl=60)
+        self.assertEqual({'custom_fields': []}, cache.get(CUSTOM_FIELDS))
+        with mock.patch('acdhQos.metadata_cache.time.time', return_value=time.time() + 61):
+            self.assertIsNone(cache.get(CUSTOM_FIELDS))
+
+    def test_entries_are_kept_per_redmine_url(self):
+        MetadataCache(self.path, 'https://one.example.invalid').set(ENV_TYPES, [{'id': 1, 'subject': 'Production'}])
+
+        self.assertIsNone(MetadataCache(self.path, 'https://two.example.invalid').get(ENV_TYPES))
+
+    def test_invalidate_drops_cached_metadata(self):
+        cache = MetadataCache(self.path, 'https://redmine.example.invalid')
+        cache.set(CUSTOM_FIELDS, {'custom_fields': []})
+        cache.invalidate()
+
+        self.assertIsNone(cache.get(CUSTOM_FIELDS))
+
+    def test_zero_ttl_disables_cache(self):
+        cache = MetadataCache(self.path, 'https://redmine.example.invalid', ttl=0)
+        cache.set(CUSTOM_FIELDS, {'custom_fields': []})
+
+        self.assertIsNone(cache.get(CUSTOM_FIELDS))
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_unreadable_file_is_ignored(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write('{not json')
+
+        cache = MetadataCache(self.path, 'https://redmine.example.invalid')
+        self.assertIsNone(cache.get(CUSTOM_FIELDS))
+        cache.set(CUSTOM_FIELDS, {'custom_fields': []})
+        self.assertEqual({'custom_fields': []}, cache.get(CUSTOM_FIELDS))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+from checks import check_accessibility, check_acdh_logo, check_helpdesk_email, ParsedPage
+
+
+PAGE = """
+<html lang="en">
+  <head><title>Demo</title><meta name="viewport" content="width=device-width"></head>
+  <body>
+    <h1>Demo</h1>
+    <img src="/assets/acdh-logo.svg" alt="ACDH logo">
+    <label for="q">Search</label><input id="q" name="q">
+    <input id="other" name="other">
+    <a href="mailto:ACDH-Helpdesk@oeaw.ac.at">Contact</a>
+  </body>
+</html>
+"""
+
+
+class ParsedPageTests(unittest.TestCase):
+    def test_collects_shared_tag_collections(self):
+        page = ParsedPage.from_html(PAGE)
+
+        self.assertEqual(page.text_lower, PAGE.lower())
+        self.assertEqual(len(page.images), 1)
+        self.assertEqual(len(page.links), 1)
+        self.assertEqual(len(page.inputs), 2)
+        self.assertEqual(page.label_for, {'q'})
+        self.assertIsNotNone(page.find_meta('viewport'))
+        self.assertIsNone(page.find_meta('description'))
+
+    def test_checks_give_same_results_with_shared_page(self):
+        page = ParsedPage.from_html(PAGE)
+
+        self.assertEqual(check_acdh_logo(PAGE, page=page), check_acdh_logo(PAGE))
+        self.assertEqual(check_helpdesk_email(PAGE, page=page), check_helpdesk_email(PAGE))
+        self.assertEqual(check_accessibility(PAGE, page=page), check_accessibility(PAGE))
+        self.assertIn("Input 'other' missing associated label", check_accessibility(PAGE, page=page)['details'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import asyncio
+import unittest
+
+from utils.rate_limiter import RateLimiter
+
+
+class RateLimiterTests(unittest.TestCase):
+    def test_waiters_are_served_in_arrival_order(self):
+        async def run():
+            limiter = RateLimiter(requests_per_second=200, burst=1)
+            order = []
+
+            async def take(i):
+                await limiter.acquire()
+                order.append(i)
+
+            await asyncio.gather(*(take(i) for i in range(10)))
+            return limiter, order
+
+        limiter, order = asyncio.run(run())
+        self.assertEqual(list(range(10)), order)
+        self.assertEqual(10, limiter.stats.granted)
+        self.assertEqual(9, limiter.stats.waited)
+        self.assertEqual(0, limiter.queue_length)
+
+    def test_lower_priority_value_is_served_first(self):
+        async def run():
+            limiter = RateLimiter(requests_per_second=100, burst=1)
+            await limiter.acquire()
+            order = []
+
+            async def take(name, priority):
+                await limiter.acquire(priority=priority)
+                order.append(name)
+
+            await asyncio.gather(take('late', 5), take('normal', 0), take('urgent', -1))
+            return order
+
+        self.assertEqual(['urgent', 'normal', 'late'], asyncio.run(run()))
+
+    def test_acquire_n_takes_several_tokens(self):
+        async def run():
+            limiter = RateLimiter(requests_per_second=50, burst=4)
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            await limiter.acquire(4)
+            await limiter.acquire(2)
+            return loop.time() - start
+
+        # the bucket is empty after the first call, two tokens take 2 / 50 s
+        self.assertGreaterEqual(asyncio.run(run()), 0.035)
+
+    def test_acquire_more_than_burst_is_rejected(self):
+        with self.assertRaises(ValueError):
+            asyncio.run(RateLimiter(requests_per_second=1, burst=2).acquire(3))
+
+    def test_tokens_accrued_for_a_queued_multi_token_waiter_are_kept(self):
+        async def run():
+            limiter = RateLimiter(requests_per_second=10, burst=3)
+            await limiter.acquire(3)
+            big = asyncio.create_task(limiter.acquire(3))
+            await asyncio.sleep(0)
+            # a late timer: a whole second's worth of tokens accrued while `big` was queued
+            limiter._timer.cancel()
+            limiter._last_refill -= 1.0
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            await limiter.acquire()
+            await big
+            return loop.time() - start
+
+        self.assertLess(asyncio.run(run()), 0.05)
+
+    def test_cancelled_waiter_is_skipped(self):
+        async def run():
+            limiter = RateLimiter(requests_per_second=100, burst=1)
+            await limiter.acquire()
+            cancelled = asyncio.create_task(limiter.acquire())
+            served = asyncio.create_task(limiter.acquire())
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            await asyncio.wait_for(served, 1)
+            return limiter.stats.granted
+
+        self.assertEqual(2, asyncio.run(run()))
+
+    def test_zero_rate_is_unlimited(self):
+        async def run():
+            limiter = RateLimiter(requests_per_second=0, burst=1)
+            await asyncio.wait_for(asyncio.gather(*(limiter.acquire() for _ in range(100))), 1)
+
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
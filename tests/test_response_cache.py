@@ -0,0 +1,79 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from utils.response_cache import ResponseCache, body_hash
+
+
+class ResponseCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'http-cache.sqlite')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_entries_survive_reopening(self):
+        cache = ResponseCache(self.path)
+        cache.store('https://a.example/', '"v1"', 'Wed, 21 Oct 2015 07:28:00 GMT', '<html>a</html>', 'utf-8')
+        cache.close()
+
+        entry = ResponseCache(self.path).lookup('https://a.example/')
+        self.assertEqual(('<html>a</html>', 'utf-8', body_hash('<html>a</html>')), (entry.text, entry.encoding, entry.body_hash))
+        self.assertEqual(
+            {'If-None-Match': '"v1"', 'If-Modified-Since': 'Wed, 21 Oct 2015 07:28:00 GMT'},
+            entry.conditional_headers(),
+        )
+
+    def test_unchanged_body_only_updates_the_validators(self):
+        cache = ResponseCache(self.path)
+        cache.store('https://a.example/', '"v1"', None, '<html>a</html>', 'utf-8')
+        statements = []
+        cache._db.set_trace_callback(statements.append)
+        cache.store('https://a.example/', '"v2"', None, '<html>a</html>', 'utf-8')
+
+        self.assertEqual('"v2"', cache.lookup('https://a.example/').etag)
+        self.assertFalse([s for s in statements if s.startswith('INSERT')])
+
+    def test_response_without_validators_replaces_the_entry(self):
+        cache = ResponseCache(self.path)
+        cache.store('https://a.example/', '"v1"', None, 'old', 'utf-8')
+        cache.store('https://a.example/', None, None, 'new', 'utf-8')
+        self.assertIsNone(cache.lookup('https://a.example/'))
+
+    def test_old_entries_are_evicted_unless_revalidated(self):
+        cache = ResponseCache(self.path, max_age=60)
+        cache.store('https://a.example/', '"a"', None, 'a', 'utf-8')
+        cache.store('https://b.example/', '"b"', None, 'b', 'utf-8')
+        with mock.patch('utils.response_cache.time.time', return_value=time.time() + 50):
+            cache.revalidated('https://b.example/')
+        with mock.patch('utils.response_cache.time.time', return_value=time.time() + 70):
+            self.assertIsNone(cache.lookup('https://a.example/'))
+            cache.evict()
+            urls = [row[0] for row in cache._db.execute('SELECT url FROM responses')]
+        self.assertEqual(['https://b.example/'], urls)
+        self.assertEqual(1, cache.hits)
+
+    def test_least_recently_validated_go_first_beyond_max_bytes(self):
+        cache = ResponseCache(self.path, max_bytes=25)
+        now = time.time()
+        for i, url in enumerate(['https://a.example/', 'https://b.example/', 'https://c.example/']):
+            with mock.patch('utils.response_cache.time.time', return_value=now + i):
+                cache.store(url, '"x"', None, 'x' * 10, 'utf-8')
+        cache.evict()
+        self.assertIsNone(cache.lookup('https://a.example/'))
+        self.assertIsNotNone(cache.lookup('https://c.example/'))
+
+    def test_unreadable_file_is_recreated(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a database' * 100)
+
+        cache = ResponseCache(self.path)
+        cache.store('https://a.example/', '"v1"', None, 'a', 'utf-8')
+        self.assertEqual('a', cache.lookup('https://a.example/').text)
+
+
+if __name__ == '__main__':
+    unittest.main()
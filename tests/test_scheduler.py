@@ -0,0 +1,114 @@
+import asyncio
+import unittest
+
+from utils.scheduler import BoundedScheduler
+
+
+class BoundedSchedulerTests(unittest.TestCase):
+    def collect(self, scheduler, func, items):
+        async def run():
+            return [pair async for pair in scheduler.map(func, items)]
+        return asyncio.run(run())
+
+    def test_yields_results_in_input_order(self):
+        async def work(delay):
+            await asyncio.sleep(delay)
+            return delay * 10
+
+        result = self.collect(BoundedScheduler(3), work, [0.03, 0.01, 0.02, 0.0])
+
+        self.assertEqual(result, [(0.03, 0.3), (0.01, 0.1), (0.02, 0.2), (0.0, 0.0)])
+
+    def test_limits_items_in_flight(self):
+        state = {'running': 0, 'peak': 0}
+
+        async def work(item):
+            state['running'] += 1
+            state['peak'] = max(state['peak'], state['running'])
+            await asyncio.sleep(0.01)
+            state['running'] -= 1
+            return item
+
+        self.collect(BoundedScheduler(2), work, range(7))
+
+        self.assertEqual(state['peak'], 2)
+
+    def test_yields_exceptions_as_results(self):
+        async def work(item):
+            if item == 1:
+                raise ValueError('boom')
+            return item
+
+        result = self.collect(BoundedScheduler(2), work, [0, 1, 2])
+
+        self.assertEqual(result[0], (0, 0))
+        self.assertIsInstance(result[1][1], ValueError)
+        self.assertEqual(result[2], (2, 2))
+
+
+    def test_async_source_is_read_only_as_slots_free_up(self):
+        state = {'read': 0}
+
+        async def source():
+            for i in range(10):
+                state['read'] += 1
+                yield i
+
+        async def work(item):
+            await asyncio.sleep(0.01)
+            return item
+
+        async def run():
+            scheduler = BoundedScheduler(2)
+            async for item, result in scheduler.map(work, source()):
+                # two in flight plus at most two waiting for a slot
+                self.assertLessEqual(state['read'] - item, 5)
+            return scheduler.stats
+
+        stats = asyncio.run(run())
+        self.assertEqual((10, 0, 0, 2), (stats.completed, stats.in_flight, stats.queued, stats.peak_in_flight))
+
+    def test_unordered_yields_as_items_finish(self):
+        async def work(delay):
+            await asyncio.sleep(delay)
+            return delay
+
+        async def run():
+            return [item async for item, _ in BoundedScheduler(3).map(work, [0.05, 0.0, 0.02], ordered=False)]
+
+        self.assertEqual([0.0, 0.02, 0.05], asyncio.run(run()))
+
+    def test_slow_item_does_not_hold_back_the_others(self):
+        async def work(delay):
+            await asyncio.sleep(delay)
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            async for _ in BoundedScheduler(2).map(work, [0.1] + [0.01] * 8, ordered=False):
+                pass
+            return loop.time() - start
+
+        # batches of two would take 0.1 + 4 * 0.01
+        self.assertLess(asyncio.run(run()), 0.13)
+
+    def test_source_error_is_raised_after_read_items(self):
+        async def source():
+            yield 1
+            raise RuntimeError('list failed')
+
+        async def work(item):
+            return item
+
+        async def run():
+            seen = []
+            async for pair in BoundedScheduler(2).map(work, source()):
+                seen.append(pair)
+            return seen
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+import re
+from typing import Any, Awaitable, Callable, Dict, List
+from urllib.parse import urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a service URL, so the same page is recognised however it was written.
+
+    Scheme and host are lowercased, https is assumed when no scheme is given, default ports,
+    user info, fragments and a trailing dot of the host are dropped and an empty path becomes "/".
+    """
+    url = url.strip()
+    if "://" not in url:
+        url = "https://" + url
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    if not host:
+        raise ValueError(f"URL without host: {url!r}")
+    if ":" in host:
+        host = f"[{host}]"
+    port = parts.port
+    netloc = host if port is None or DEFAULT_PORTS.get(scheme) == port else f"{host}:{port}"
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+
+def split_endpoints(value: str) -> List[str]:
+    """Normalised, de-duplicated URLs of an endpoint value holding one or more URLs (newline, space or comma separated)."""
+    urls: Dict[str, None] = {}
+    for part in re.split(r"[\s,]+", value or ""):
+        if not part:
+            continue
+        try:
+            urls[normalize_url(part)] = None
+        except ValueError as e:
+            logger.warning("Ignoring invalid endpoint %r: %s", part, e)
+    return list(urls)
+
+
+class SharedChecks:
+    """Runs one check per normalised URL and hands its result to every caller asking for that URL.
+
+    With keep_results=False a URL is only shared while its check is running, so a later request
+    checks it again (used when services are checked continuously).
+    """
+
+    def __init__(self, keep_results: bool = True):
+        self.keep_results = keep_results
+        self.requested = 0
+        self.started = 0
+        self._tasks: Dict[str, asyncio.Future] = {}
+
+    async def run(self, url: str, check: Callable[[str], Awaitable[Any]]) -> Any:
+        self.requested += 1
+        task = self._tasks.get(url)
+        if task is None:
+            self.started += 1
+            task = asyncio.ensure_future(check(url))
+            self._tasks[url] = task
+            if not self.keep_results:
+                task.add_done_callback(lambda _: self._tasks.pop(url, None))
+        # a caller being cancelled must not cancel the check the other callers wait for
+        return await asyncio.shield(task)
+
+    @property
+    def saved(self) -> int:
+        return self.requested - self.started
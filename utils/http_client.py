@@ -1,16 +1,86 @@
 import asyncio
+import codecs
 import logging
+import random
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
 from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
 from enum import Enum
-from typing import Dict, Any, Optional
+from typing import Callable, Deque, Dict, Any, Optional, Tuple
 
 import aiohttp
 
 from utils.rate_limiter import RateLimiter
+from utils.response_cache import ResponseCache
 
 logger = logging.getLogger(__name__)
 
 
+# longest server-requested Retry-After that is honoured
+MAX_RETRY_AFTER = 120.0
+
+# bytes read from the connection at a time
+CHUNK_SIZE = 64 * 1024
+
+# how far into the body a <meta> charset declaration is looked for, as in the HTML prescan
+SNIFF_BYTES = 1024
+
+_META_CHARSET_RE = re.compile(rb"<meta[^>]*?charset\s*=\s*[\"']?\s*([a-z0-9_.:-]+)", re.IGNORECASE)
+
+
+def _codec_name(label) -> Optional[str]:
+    if not label:
+        return None
+    if isinstance(label, bytes):
+        label = label.decode("ascii", errors="ignore")
+    try:
+        return codecs.lookup(label.strip()).name
+    except LookupError:
+        return None
+
+
+def body_encoding(header_charset: Optional[str], head: bytes) -> str:
+    """Encoding of a body: the Content-Type charset, else a <meta> charset in its first bytes, else UTF-8.
+
+    No statistical detection is done; the checks only look for ASCII markers, which
+    decode the same in any ASCII-compatible encoding.
+    """
+    encoding = _codec_name(header_charset)
+    if encoding:
+        return encoding
+    match = _META_CHARSET_RE.search(head[:SNIFF_BYTES])
+    encoding = _codec_name(match.group(1)) if match else None
+    if encoding and not encoding.startswith("utf-16"):
+        return encoding
+    # a page that declares UTF-16 in ASCII-readable markup is not UTF-16
+    return "utf-8"
+
+
+def backoff_seconds(attempt: int, base: float = 1.0) -> float:
+    """Exponential backoff with jitter: between half and all of base * 2**attempt."""
+    delay = base * 2 ** attempt
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def retry_after_seconds(value: Optional[str], default: float) -> float:
+    """Seconds to wait according to a Retry-After header given as seconds or as an HTTP-date."""
+    if not value:
+        return default
+    value = value.strip()
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError, IndexError):
+            logger.debug(f"Ignoring unparsable Retry-After {value!r}")
+            return default
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
 class CircuitState(Enum):
     CLOSED = "closed"
     OPEN = "open"
@@ -49,6 +119,84 @@ class CircuitBreaker:
         return True
 
 
+class HostSlots:
+    """Global concurrency cap handed out round-robin between hosts, each host with its own cap.
+
+    When a slot frees up, the next host in turn that has a waiting request and is below its
+    own limit gets it, so one host with many queued requests cannot starve the others.
+    """
+
+    def __init__(self, max_concurrent: int = 5, per_host: int = 2):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.per_host = max(1, int(per_host))
+        self.active = 0
+        self.host_active: Dict[str, int] = {}
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {}
+        # hosts with waiting requests in turn order
+        self._ring: Deque[str] = deque()
+
+    def _can_start(self, host: str) -> bool:
+        return self.active < self.max_concurrent and self.host_active.get(host, 0) < self.per_host
+
+    def _start(self, host: str):
+        self.active += 1
+        self.host_active[host] = self.host_active.get(host, 0) + 1
+
+    async def acquire(self, host: str):
+        if host not in self._waiters and self._can_start(host):
+            self._start(host)
+            return
+        future = asyncio.get_running_loop().create_future()
+        if host not in self._waiters:
+            self._waiters[host] = deque()
+            self._ring.append(host)
+        self._waiters[host].append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was granted just before the cancellation
+                self.release(host)
+            raise
+
+    def release(self, host: str):
+        self.active -= 1
+        self.host_active[host] -= 1
+        if not self.host_active[host]:
+            del self.host_active[host]
+        self._dispatch()
+
+    def _dispatch(self):
+        skipped = 0
+        while self._ring and skipped < len(self._ring) and self.active < self.max_concurrent:
+            host = self._ring.popleft()
+            waiters = self._waiters[host]
+            while waiters and waiters[0].cancelled():
+                waiters.popleft()
+            if not waiters:
+                del self._waiters[host]
+                continue
+            if not self._can_start(host):
+                self._ring.append(host)
+                skipped += 1
+                continue
+            self._start(host)
+            waiters.popleft().set_result(None)
+            skipped = 0
+            if waiters:
+                self._ring.append(host)
+            else:
+                del self._waiters[host]
+
+    @asynccontextmanager
+    async def slot(self, host: str):
+        await self.acquire(host)
+        try:
+            yield
+        finally:
+            self.release(host)
+
+
 class ResilientHttpClient:
     def __init__(
         self,
@@ -56,12 +204,23 @@ class ResilientHttpClient:
         max_concurrent: int = 5,
         timeout_seconds: int = 15,
         max_retries: int = 2,
+        per_host_max_concurrent: int = 2,
+        per_host_requests_per_second: float = 1.0,
+        max_body_bytes: int = 2 * 1024 * 1024,
+        cache_path: Optional[str] = None,
+        cache_max_age_seconds: float = 7 * 24 * 3600,
+        cache_max_bytes: int = 100 * 1024 * 1024,
     ):
         self.rate_limiter = RateLimiter(requests_per_second=requests_per_second)
-        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.slots = HostSlots(max_concurrent, per_host_max_concurrent)
+        self.per_host_requests_per_second = per_host_requests_per_second
         self.timeout = aiohttp.ClientTimeout(total=timeout_seconds)
         self.max_retries = max_retries
+        self.max_body_bytes = max_body_bytes
+        # validators and bodies of earlier runs, for conditional requests
+        self.cache = ResponseCache(cache_path, cache_max_age_seconds, cache_max_bytes) if cache_path else None
         self._circuit_breakers: Dict[str, CircuitBreaker] = {}
+        self._host_limiters: Dict[str, RateLimiter] = {}
         self._session: Optional[aiohttp.ClientSession] = None
 
     def _get_circuit_breaker(self, host: str) -> CircuitBreaker:
@@ -69,6 +228,17 @@ class ResilientHttpClient:
             self._circuit_breakers[host] = CircuitBreaker()
         return self._circuit_breakers[host]
 
+    def _get_host_limiter(self, host: str) -> RateLimiter:
+        if host not in self._host_limiters:
+            self._host_limiters[host] = RateLimiter(requests_per_second=self.per_host_requests_per_second, burst=1)
+        return self._host_limiters[host]
+
+    async def _throttle(self, host: str):
+        # the host's own budget first, so waiting on a busy host does not use up global tokens
+        if self.per_host_requests_per_second > 0:
+            await self._get_host_limiter(host).acquire()
+        await self.rate_limiter.acquire()
+
     async def __aenter__(self):
         # Note: 'max_redirects' is not supported in this aiohttp version,
         # so we rely on aiohttp's default redirect behavior.
@@ -81,64 +251,147 @@ class ResilientHttpClient:
     async def __aexit__(self, *args):
         if self._session:
             await self._session.close()
+        if self.cache:
+            self.cache.close()
+
+    async def _read_body(self, resp, until: Optional[Callable[[str], bool]] = None) -> Tuple[str, bool, str]:
+        """Read and decode the body chunk by chunk, up to max_body_bytes (0 = no limit).
 
-    async def get(self, url: str) -> Dict[str, Any]:
+        `until` is called with every decoded chunk; once it returns True the rest of the body
+        is not downloaded. Returns the text, whether the body was cut short and its encoding.
+        """
+        encoding = None
+        decoder = None
+        head = b""
+        parts = []
+        size = 0
+        truncated = False
+        async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+            if self.max_body_bytes and size + len(chunk) > self.max_body_bytes:
+                chunk = chunk[:self.max_body_bytes - size]
+                truncated = True
+            size += len(chunk)
+            if decoder is None:
+                # the decoder is picked once the first bytes, which may declare the charset, are in
+                head += chunk
+                if len(head) < SNIFF_BYTES and not truncated:
+                    continue
+                encoding = body_encoding(resp.charset, head)
+                decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+                chunk, head = head, b""
+            text = decoder.decode(chunk)
+            parts.append(text)
+            if truncated:
+                logger.info(f"Body of {resp.url} truncated at {size} bytes")
+                break
+            if until is not None and until(text):
+                truncated = not resp.content.at_eof()
+                break
+        if decoder is None:
+            encoding = body_encoding(resp.charset, head)
+            decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        parts.append(decoder.decode(head, final=True))
+        return "".join(parts), truncated, encoding
+
+    async def _attempt(
+        self, url: str, cb: CircuitBreaker, attempt: int, until: Optional[Callable[[str], bool]] = None,
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[float]]:
+        """One request; returns (result, None) when done or (None, seconds to wait) to retry."""
+        retry = attempt < self.max_retries
+        cached = self.cache.lookup(url) if self.cache else None
+        try:
+            headers = cached.conditional_headers() if cached else None
+            async with self._session.get(url, ssl=False, headers=headers) as resp:
+                if resp.status == 304 and cached is not None:
+                    cb.record_success()
+                    self.cache.revalidated(url)
+                    # status is that of the cached 200 response; not_modified tells it was revalidated
+                    return {
+                        "status": 200,
+                        "text": cached.text,
+                        "error": None,
+                        "skipped": False,
+                        "truncated": False,
+                        "encoding": cached.encoding,
+                        "cached": True,
+                        "not_modified": True,
+                    }, None
+                if resp.status >= 400:
+                    cb.record_failure()
+                    if resp.status in (429, 500, 502, 503, 504) and retry:
+                        wait = retry_after_seconds(resp.headers.get("Retry-After"), backoff_seconds(attempt))
+                        logger.warning(
+                            f"Transient HTTP {resp.status} for {url}, retrying after {wait:.1f}s"
+                        )
+                        return None, wait
+                    text, truncated, encoding = await self._read_body(resp, until)
+                    return {
+                        "status": resp.status,
+                        "text": text,
+                        "error": f"HTTP {resp.status}",
+                        "skipped": False,
+                        "truncated": truncated,
+                        "encoding": encoding,
+                        "cached": False,
+                        "not_modified": False,
+                    }, None
+
+                text, truncated, encoding = await self._read_body(resp, until)
+                cb.record_success()
+                if self.cache and resp.status == 200 and not truncated:
+                    self.cache.store(url, resp.headers.get("ETag"), resp.headers.get("Last-Modified"), text, encoding)
+                return {
+                    "status": resp.status,
+                    "text": text,
+                    "error": None,
+                    "skipped": False,
+                    "truncated": truncated,
+                    "encoding": encoding,
+                    "cached": False,
+                    "not_modified": False,
+                }, None
+        except asyncio.TimeoutError:
+            logger.warning(f"Timeout for {url} (attempt {attempt + 1})")
+            cb.record_failure()
+        except aiohttp.ClientError as e:
+            logger.warning(f"Client error for {url}: {e} (attempt {attempt + 1})")
+            cb.record_failure()
+        except Exception as e:
+            logger.error(f"Unexpected error for {url}: {e}")
+            cb.record_failure()
+            retry = False
+
+        return None, backoff_seconds(attempt) if retry else None
+
+    async def get(self, url: str, until: Optional[Callable[[str], bool]] = None) -> Dict[str, Any]:
+        """Fetch a URL; `until` can end the body download early, see _read_body."""
         from urllib.parse import urlparse
-        host = urlparse(url).hostname or url
+        host = (urlparse(url).hostname or url).lower()
 
         cb = self._get_circuit_breaker(host)
 
         if not cb.can_proceed():
             logger.info(f"Circuit breaker OPEN for {host}, skipping {url}")
-            return {"status": 0, "text": "", "error": "circuit_breaker_open", "skipped": True}
-
-        async with self.semaphore:
-            for attempt in range(self.max_retries + 1):
-                await self.rate_limiter.acquire()
-                try:
-                    async with self._session.get(url, ssl=False) as resp:
-                        text = await resp.text(errors='replace')
-                        # Ensure text is properly decoded as UTF-8
-                        if isinstance(text, bytes):
-                            text = text.decode('utf-8', errors='replace')
-                        if resp.status >= 400:
-                            if resp.status in (429, 500, 502, 503, 504) and attempt < self.max_retries:
-                                wait = int(resp.headers.get("Retry-After", 2 ** attempt))
-                                logger.warning(
-                                    f"Transient HTTP {resp.status} for {url}, retrying after {wait}s"
-                                )
-                                cb.record_failure()
-                                await asyncio.sleep(wait)
-                                continue
-
-                            cb.record_failure()
-                            return {
-                                "status": resp.status,
-                                "text": text,
-                                "error": f"HTTP {resp.status}",
-                                "skipped": False,
-                            }
-
-                        cb.record_success()
-                        return {
-                            "status": resp.status,
-                            "text": text,
-                            "error": None,
-                            "skipped": False,
-                        }
-                except asyncio.TimeoutError:
-                    logger.warning(f"Timeout for {url} (attempt {attempt + 1})")
-                    cb.record_failure()
-                except aiohttp.ClientError as e:
-                    logger.warning(f"Client error for {url}: {e} (attempt {attempt + 1})")
-                    cb.record_failure()
-                except Exception as e:
-                    logger.error(f"Unexpected error for {url}: {e}")
-                    cb.record_failure()
-                    break
+            return {
+                "status": 0, "text": "", "error": "circuit_breaker_open", "skipped": True,
+                "truncated": False, "encoding": None, "cached": False, "not_modified": False,
+            }
 
-                if attempt < self.max_retries:
-                    wait = 2 ** attempt
-                    await asyncio.sleep(wait)
+        for attempt in range(self.max_retries + 1):
+            # a slot is only held while the request runs, so hosts backing off don't block the others;
+            #   every request, including imprint follow-ups, counts against its host's slots and rate
+            async with self.slots.slot(host):
+                # tokens are taken with the slot held, so requests queued for a slot cannot
+                #   collect tokens while waiting and then fire all at once
+                await self._throttle(host)
+                result, wait = await self._attempt(url, cb, attempt, until)
+            if result is not None:
+                return result
+            if wait is None:
+                break
+            await asyncio.sleep(wait)
 
-        return {"status": 0, "text": "", "error": "max_retries_exceeded", "skipped": False}
+        return {
+            "status": 0, "text": "", "error": "max_retries_exceeded", "skipped": False,
+            "truncated": False, "encoding": None, "cached": False, "not_modified": False,
+        }
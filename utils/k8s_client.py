@@ -1,65 +1,513 @@
 import asyncio
+import json
 import logging
-from typing import Any, Dict, List, Optional
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
 
-from kubernetes import client, config
+from kubernetes import client, config, watch
 from kubernetes.client.rest import ApiException
 
+from utils.rate_limiter import RateLimiter
+
 logger = logging.getLogger(__name__)
 
+_WATCH_DONE = object()
+
+# seconds to connect for a watch, and how long past its server-side timeout a read may block
+WATCH_CONNECT_TIMEOUT = 10
+WATCH_READ_GRACE = 30
+
+
+class _SnapshotResponse:
+    """Stands in for a REST response for clients whose ApiClient.deserialize takes a response object."""
+
+    def __init__(self, data):
+        self.data = json.dumps(data)
+
+
+def _deserialize(api_client: client.ApiClient, data: Any, response_type: str) -> Any:
+    try:
+        return api_client.deserialize(json.dumps(data), response_type, "application/json")
+    except TypeError:
+        # kubernetes clients before the (response_text, response_type, content_type) signature
+        return api_client.deserialize(_SnapshotResponse(data), response_type)
+
+
+class SlimObjectMeta:
+    __slots__ = ("namespace", "name", "annotations", "resource_version")
+
+    def __init__(self, namespace: str, name: str, annotations: Dict[str, str], resource_version: Optional[str]):
+        self.namespace = namespace
+        self.name = name
+        self.annotations = annotations
+        self.resource_version = resource_version
+
+
+class SlimIngressRule:
+    __slots__ = ("host",)
+
+    def __init__(self, host: Optional[str]):
+        self.host = host
+
+
+class SlimIngressSpec:
+    __slots__ = ("rules",)
+
+    def __init__(self, rules: List[SlimIngressRule]):
+        self.rules = rules
+
+
+class SlimIngress:
+    """The part of an ingress the runner reads, with the attribute layout of V1Ingress."""
+    __slots__ = ("metadata", "spec")
+
+    def __init__(self, metadata: SlimObjectMeta, spec: SlimIngressSpec):
+        self.metadata = metadata
+        self.spec = spec
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SlimIngress":
+        """Build from an ingress as returned in the API's JSON."""
+        metadata = data.get("metadata") or {}
+        rules = (data.get("spec") or {}).get("rules") or []
+        return cls(
+            SlimObjectMeta(
+                metadata.get("namespace"),
+                metadata.get("name"),
+                metadata.get("annotations") or {},
+                metadata.get("resourceVersion"),
+            ),
+            SlimIngressSpec([SlimIngressRule(rule.get("host")) for rule in rules]),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "metadata": {
+                "namespace": self.metadata.namespace,
+                "name": self.metadata.name,
+                "annotations": self.metadata.annotations,
+                "resourceVersion": self.metadata.resource_version,
+            },
+            "spec": {"rules": [{"host": rule.host} for rule in self.spec.rules]},
+        }
+
+
+# slim record types that can be stored in and restored from a snapshot
+SLIM_TYPES = {SlimIngress.__name__: SlimIngress}
+
+
+class _RawPage:
+    """List response parsed straight from the JSON body into slim records."""
+
+    def __init__(self, data: Dict[str, Any], record_type):
+        metadata = data.get("metadata") or {}
+        self.metadata = SimpleNamespace(
+            _continue=metadata.get("continue"),
+            resource_version=metadata.get("resourceVersion"),
+        )
+        self.items = [record_type.from_dict(item) for item in data.get("items") or []]
+
+
+def _name(item: Any) -> Tuple[str, Any, Any]:
+    metadata = getattr(item, "metadata", None)
+    return type(item).__name__, getattr(metadata, "namespace", None), getattr(metadata, "name", None)
+
+
+def _identity(item: Any) -> Tuple[Any, Any, Any]:
+    metadata = getattr(item, "metadata", None)
+    return (
+        getattr(metadata, "namespace", None),
+        getattr(metadata, "name", None),
+        getattr(metadata, "resource_version", None),
+    )
+
+
+_OPT_OUT_VALUES = ("true", "yes", "1", "skip")
+
+
+@dataclass
+class DiscoveryFilter:
+    """Which resources discovery returns.
+
+    Namespaces and labels are sent to the API server as selectors; the annotation opt-out (and
+    whatever a selector cannot express) is applied to the items while they are streamed.
+    """
+    include_namespaces: List[str] = field(default_factory=list)
+    exclude_namespaces: List[str] = field(default_factory=list)
+    label_selector: str = ""
+    opt_out_annotation: str = ""
+
+    def namespaces(self) -> Optional[List[str]]:
+        """Namespaces to list one by one, or None to list across all namespaces."""
+        if not self.include_namespaces:
+            return None
+        return [ns for ns in self.include_namespaces if ns not in self.exclude_namespaces]
+
+    def field_selector(self) -> str:
+        """Namespace restriction as a field selector for cluster-wide list and watch calls."""
+        namespaces = self.namespaces()
+        if namespaces is None:
+            return ",".join(f"metadata.namespace!={ns}" for ns in self.exclude_namespaces)
+        if len(namespaces) == 1:
+            return f"metadata.namespace={namespaces[0]}"
+        # a field selector cannot express "one of several namespaces"
+        return ""
+
+    def selectors(self) -> Dict[str, str]:
+        kwargs = {}
+        if self.label_selector:
+            kwargs["label_selector"] = self.label_selector
+        field_selector = self.field_selector()
+        if field_selector:
+            kwargs["field_selector"] = field_selector
+        return kwargs
+
+    def accepts(self, obj: Any) -> bool:
+        metadata = getattr(obj, "metadata", None)
+        namespace = getattr(metadata, "namespace", None)
+        namespaces = self.namespaces()
+        if namespace in self.exclude_namespaces or (namespaces is not None and namespace not in namespaces):
+            return False
+        if self.opt_out_annotation:
+            annotations = getattr(metadata, "annotations", None) or {}
+            if str(annotations.get(self.opt_out_annotation, "")).strip().lower() in _OPT_OUT_VALUES:
+                return False
+        return True
+
 
 class ThrottledK8sClient:
-    def __init__(self, requests_per_second: float = 5.0):
-        try:
-            config.load_incluster_config()
-        except config.ConfigException:
-            config.load_kube_config()
-
-        self.core_v1 = client.CoreV1Api()
-        self.apps_v1 = client.AppsV1Api()
-        self.networking_v1 = client.NetworkingV1Api()
-        self._cache: Dict[str, Any] = {}
+    def __init__(
+        self,
+        requests_per_second: float = 5.0,
+        cache_ttl_seconds: float = 300,
+        snapshot_path: Optional[str] = None,
+        page_size: int = 100,
+        discovery_filter: Optional[DiscoveryFilter] = None,
+        context: Optional[str] = None,
+        kubeconfig: Optional[str] = None,
+        cluster_name: str = "",
+    ):
+        if context or kubeconfig:
+            # a dedicated ApiClient so several clusters can be used side by side
+            api_client = config.new_client_from_config(config_file=kubeconfig, context=context)
+        else:
+            try:
+                config.load_incluster_config()
+            except config.ConfigException:
+                config.load_kube_config()
+            api_client = None
+
+        self.cluster_name = cluster_name or context or ""
+        self.core_v1 = client.CoreV1Api(api_client)
+        self.apps_v1 = client.AppsV1Api(api_client)
+        self.networking_v1 = client.NetworkingV1Api(api_client)
+        # cache key => (time listed, items); entries loaded from a snapshot keep their original time
+        self._cache: Dict[str, Tuple[float, List[Any]]] = {}
+        self._cache_ttl = cache_ttl_seconds
+        self._snapshot_path = snapshot_path
         self._rps = requests_per_second
-        self._min_interval = 1.0 / requests_per_second
-        self._last_call = 0.0
+        # one bucket shared by every list, page and watch request of this client
+        self._rate_limiter = RateLimiter(requests_per_second=requests_per_second, burst=1)
+        self._page_size = page_size
+        self._filter = discovery_filter or DiscoveryFilter()
+        # (type, namespace, name) of items served from an expired cache entry that its refresh no longer lists
+        self._removed: Set[Tuple[str, Any, Any]] = set()
+        if snapshot_path:
+            self.load_snapshot()
 
     async def _throttle(self):
-        import time
-        now = time.monotonic()
-        elapsed = now - self._last_call
-        if elapsed < self._min_interval:
-            await asyncio.sleep(self._min_interval - elapsed)
-        self._last_call = time.monotonic()
+        await self._rate_limiter.acquire()
 
     async def _call_api(self, func, **kwargs):
         return await asyncio.to_thread(func, **kwargs)
 
-    async def _stream_resources(self, api_call, **kwargs):
-        _continue = None
+    async def _call_api_raw(self, func, record_type, **kwargs) -> _RawPage:
+        """Call a list endpoint without model deserialization; JSON parsing also runs in the worker thread."""
+        def call():
+            resp = func(_preload_content=False, **kwargs)
+            try:
+                if not 200 <= resp.status <= 299:
+                    error = ApiException(status=resp.status, reason=resp.reason)
+                    error.headers = resp.headers
+                    error.body = resp.data
+                    raise error
+                return _RawPage(json.loads(resp.data), record_type)
+            finally:
+                resp.release_conn()
+        return await asyncio.to_thread(call)
+
+    async def _fetch_page(self, api_call, _continue, record_type=None, **kwargs):
         backoff = 5
         while True:
             await self._throttle()
             try:
-                resp = await self._call_api(api_call, limit=100, _continue=_continue, **kwargs)
-                for item in getattr(resp, "items", []):
-                    yield item
-                _continue = getattr(resp.metadata, "_continue", None)
-                if not _continue:
-                    break
-                backoff = 5
+                if record_type is not None:
+                    return await self._call_api_raw(api_call, record_type, limit=self._page_size, _continue=_continue, **kwargs)
+                return await self._call_api(api_call, limit=self._page_size, _continue=_continue, **kwargs)
             except ApiException as e:
                 if e.status == 429:
-                    retry_after = int(e.headers.get("Retry-After", backoff))
+                    retry_after = int((e.headers or {}).get("Retry-After", backoff))
                     logger.warning(f"K8s API throttled, waiting {retry_after}s")
                     await asyncio.sleep(retry_after)
                     backoff = min(backoff * 2, 60)
                     continue
                 raise
 
-    async def list_ingresses(self):
-        async for ingress in self._stream_resources(self.networking_v1.list_ingress_for_all_namespaces):
+    async def _list_pages(self, api_call, record_type=None, **kwargs):
+        """Yield list pages; with a record_type the pages hold slim records parsed from raw JSON."""
+        page = asyncio.create_task(self._fetch_page(api_call, None, record_type, **kwargs))
+        try:
+            while page is not None:
+                resp = await page
+                _continue = getattr(resp.metadata, "_continue", None)
+                # request the next page before the consumer works through this one
+                page = asyncio.create_task(self._fetch_page(api_call, _continue, record_type, **kwargs)) if _continue else None
+                yield resp
+        finally:
+            if page is not None:
+                page.cancel()
+
+    async def _list_items(self, api_call, record_type=None, **kwargs):
+        async for resp in self._list_pages(api_call, record_type, **kwargs):
+            for item in getattr(resp, "items", []) or []:
+                yield item
+
+    async def _list_all(self, api_call, record_type=None, **kwargs) -> List[Any]:
+        return [item async for item in self._list_items(api_call, record_type, **kwargs)]
+
+    @staticmethod
+    def _cache_key(api_call, record_type=None, **kwargs) -> str:
+        name = getattr(api_call, "__name__", str(api_call))
+        if record_type is not None:
+            name += ":" + record_type.__name__
+        return json.dumps([name, kwargs], sort_keys=True, default=str)
+
+    def _store(self, key: str, items: List[Any]):
+        self._cache[key] = (time.time(), items)
+        if self._snapshot_path:
+            self.save_snapshot()
+
+    async def _stream_resources(self, api_call, record_type=None, **kwargs):
+        """List resources through the TTL cache.
+
+        A fresh entry is served without API calls. An expired entry (e.g. one restored from a
+        snapshot) is yielded right away while a new list runs in the background; afterwards only
+        items that are new or changed in that list are yielded. Cached items the new list no
+        longer contains are skipped once it is in, and those already yielded are reported by
+        is_removed().
+        """
+        if self._cache_ttl <= 0 and not self._snapshot_path:
+            async for item in self._list_items(api_call, record_type, **kwargs):
+                yield item
+            return
+
+        key = self._cache_key(api_call, record_type, **kwargs)
+        cached = self._cache.get(key)
+        if cached is not None and time.time() - cached[0] <= self._cache_ttl:
+            for item in cached[1]:
+                yield item
+            return
+
+        if cached is None:
+            items = []
+            async for item in self._list_items(api_call, record_type, **kwargs):
+                items.append(item)
+                yield item
+            self._store(key, items)
+            return
+
+        refresh = asyncio.create_task(self._list_all(api_call, record_type, **kwargs))
+        current = None
+        try:
+            for item in cached[1]:
+                if current is None and refresh.done() and refresh.exception() is None:
+                    current = {_name(fresh) for fresh in refresh.result()}
+                if current is not None and _name(item) not in current:
+                    continue
+                yield item
+            try:
+                items = await refresh
+            except Exception as e:
+                logger.warning("Refreshing cached %s failed, keeping the previous list: %s", key, e)
+                return
+            self._store(key, items)
+            current = {_name(fresh) for fresh in items}
+            removed = {_name(item) for item in cached[1]} - current
+            if removed:
+                logger.info("%s cached items of %s no longer exist", len(removed), key)
+                self._removed.update(removed)
+            known = {_identity(item) for item in cached[1]}
+            for item in items:
+                if _identity(item) not in known:
+                    yield item
+        finally:
+            refresh.cancel()
+
+    def is_removed(self, item: Any) -> bool:
+        """Whether `item` came from an expired cache entry and is missing from the list that refreshed it."""
+        return _name(item) in self._removed
+
+    def save_snapshot(self):
+        """Write the cached lists to the snapshot file as compact JSON."""
+        api_client = client.ApiClient()
+        entries = {}
+        for key, (listed, items) in self._cache.items():
+            item_type = type(items[0]).__name__ if items else None
+            entries[key] = {
+                "time": listed,
+                "type": item_type,
+                "items": [item.to_dict() for item in items] if item_type in SLIM_TYPES else api_client.sanitize_for_serialization(items),
+            }
+        directory = os.path.dirname(os.path.abspath(self._snapshot_path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".k8s-snapshot-")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entries, f, separators=(",", ":"))
+            os.replace(tmp_path, self._snapshot_path)
+        except OSError as e:
+            logger.warning("Unable to write K8s snapshot %s: %s", self._snapshot_path, e)
+
+    def load_snapshot(self):
+        """Fill the cache from the snapshot file, keeping the time each list was taken."""
+        try:
+            with open(self._snapshot_path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable K8s snapshot %s: %s", self._snapshot_path, e)
+            return
+
+        api_client = client.ApiClient()
+        for key, entry in entries.items():
+            try:
+                items = entry["items"]
+                if entry.get("type") in SLIM_TYPES:
+                    items = [SLIM_TYPES[entry["type"]].from_dict(item) for item in items]
+                elif entry.get("type"):
+                    items = [_deserialize(api_client, item, entry["type"]) for item in items]
+                self._cache[key] = (entry["time"], items)
+            except Exception as e:
+                logger.warning("Ignoring K8s snapshot entry %s: %s", key, e)
+        logger.info("Loaded %s cached K8s lists from %s", len(self._cache), self._snapshot_path)
+
+    async def _discover(self, list_all, list_namespaced, record_type=None):
+        """Stream the resources the discovery filter selects.
+
+        Several included namespaces are listed one by one, otherwise a single cluster-wide list
+        with the filter's selectors is made.
+        """
+        selectors = self._filter.selectors()
+        namespaces = self._filter.namespaces()
+        if namespaces is None or "field_selector" in selectors:
+            calls = [(list_all, selectors)]
+        else:
+            calls = [(list_namespaced, dict(selectors, namespace=ns)) for ns in namespaces]
+        skipped = 0
+        for api_call, kwargs in calls:
+            async for item in self._stream_resources(api_call, record_type, **kwargs):
+                if self._filter.accepts(item):
+                    yield item
+                else:
+                    skipped += 1
+        if skipped:
+            logger.info("Discovery filter skipped %s resources", skipped)
+
+    async def list_ingresses(self, slim: bool = False):
+        """Yield all ingresses; slim=True skips model deserialization and yields SlimIngress records."""
+        record_type = SlimIngress if slim else None
+        async for ingress in self._discover(
+            self.networking_v1.list_ingress_for_all_namespaces,
+            self.networking_v1.list_namespaced_ingress,
+            record_type,
+        ):
             yield ingress
 
+    async def snapshot_ingresses(self, slim: bool = False) -> Tuple[List[Any], Optional[str]]:
+        """All ingresses plus the list resourceVersion a watch can start from."""
+        ingresses: List[Any] = []
+        resource_version = None
+        record_type = SlimIngress if slim else None
+        # a single cluster-wide list, so there is one resourceVersion to resume watching from
+        async for resp in self._list_pages(self.networking_v1.list_ingress_for_all_namespaces, record_type, **self._filter.selectors()):
+            if resource_version is None:
+                resource_version = getattr(resp.metadata, "resource_version", None)
+            ingresses.extend(item for item in getattr(resp, "items", []) or [] if self._filter.accepts(item))
+        return ingresses, resource_version
+
+    async def watch_ingresses(
+        self,
+        resource_version: Optional[str],
+        timeout_seconds: int = 300,
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """Yield (event type, ingress) pairs after resource_version until the server ends the watch.
+
+        An ingress the discovery filter rejects (e.g. one that was annotated to opt out) is
+        reported as DELETED. Raises ApiException with status 410 once resource_version is too
+        old to resume from.
+        """
+        await self._throttle()
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        w = watch.Watch()
+        stopped = threading.Event()
+
+        def put(item):
+            if stopped.is_set():
+                return
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                # the event loop is already closed
+                pass
+
+        def run():
+            try:
+                for event in w.stream(
+                    self.networking_v1.list_ingress_for_all_namespaces,
+                    resource_version=resource_version,
+                    timeout_seconds=timeout_seconds,
+                    allow_watch_bookmarks=True,
+                    # a read that outlives the server-side timeout means the connection is dead
+                    _request_timeout=(WATCH_CONNECT_TIMEOUT, timeout_seconds + WATCH_READ_GRACE),
+                    **self._filter.selectors(),
+                ):
+                    put((event["type"], event["object"]))
+                put(_WATCH_DONE)
+            except Exception as e:
+                put(e)
+
+        # the blocking watch runs in its own daemon thread and hands events over to the loop;
+        #   it is not taken from the default executor, which asyncio.run() waits for on exit
+        threading.Thread(target=run, name="k8s-ingress-watch", daemon=True).start()
+        try:
+            while True:
+                item = await queue.get()
+                if item is _WATCH_DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                event_type, ingress = item
+                if event_type in ("ADDED", "MODIFIED") and not self._filter.accepts(ingress):
+                    event_type = "DELETED"
+                yield event_type, ingress
+        finally:
+            stopped.set()
+            w.stop()
+            # stop() is only seen between events; closing the response ends a blocked read now
+            resp = getattr(w, "_resp", None)
+            if resp is not None:
+                try:
+                    resp.close()
+                except Exception as e:
+                    logger.debug("Closing the ingress watch response failed: %s", e)
+
     async def get_all_ingresses(self) -> List[Any]:
         ingresses = []
         async for ingress in self.list_ingresses():
@@ -67,7 +515,10 @@ class ThrottledK8sClient:
         return ingresses
 
     async def list_deployments(self):
-        async for deployment in self._stream_resources(self.apps_v1.list_deployment_for_all_namespaces):
+        async for deployment in self._discover(
+            self.apps_v1.list_deployment_for_all_namespaces,
+            self.apps_v1.list_namespaced_deployment,
+        ):
             yield deployment
 
     async def get_all_deployments(self) -> List[Any]:
@@ -76,5 +527,26 @@ class ThrottledK8sClient:
             deployments.append(deployment)
         return deployments
 
+    async def list_stateful_sets(self):
+        async for stateful_set in self._discover(
+            self.apps_v1.list_stateful_set_for_all_namespaces,
+            self.apps_v1.list_namespaced_stateful_set,
+        ):
+            yield stateful_set
+
+    async def list_daemon_sets(self):
+        async for daemon_set in self._discover(
+            self.apps_v1.list_daemon_set_for_all_namespaces,
+            self.apps_v1.list_namespaced_daemon_set,
+        ):
+            yield daemon_set
+
+    async def list_services(self):
+        async for service in self._discover(
+            self.core_v1.list_service_for_all_namespaces,
+            self.core_v1.list_namespaced_service,
+        ):
+            yield service
+
     def clear_cache(self):
         self._cache.clear()
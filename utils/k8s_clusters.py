@@ -0,0 +1,67 @@
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_STREAM_DONE = object()
+
+
+@dataclass
+class ClusterSpec:
+    """A cluster to discover: a kubeconfig context and/or file; both empty means in-cluster/default."""
+    name: str
+    context: Optional[str] = None
+    kubeconfig: Optional[str] = None
+
+
+def parse_clusters(entries: List[Any]) -> List[ClusterSpec]:
+    """Cluster specs from config entries, each a context name or a mapping with name/context/kubeconfig."""
+    clusters = []
+    for entry in entries or []:
+        if isinstance(entry, str):
+            clusters.append(ClusterSpec(name=entry, context=entry))
+            continue
+        context = entry.get("context") or None
+        kubeconfig = entry.get("kubeconfig") or None
+        name = entry.get("name") or context or (os.path.basename(kubeconfig) if kubeconfig else "")
+        if not name:
+            raise ValueError(f"Cluster entry needs a name, context or kubeconfig: {entry!r}")
+        clusters.append(ClusterSpec(name=name, context=context, kubeconfig=kubeconfig))
+    names = [cluster.name for cluster in clusters]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate cluster names: {', '.join(duplicates)}")
+    return clusters
+
+
+async def merge_streams(streams: Dict[str, AsyncIterator[Any]], max_buffered: int = 100) -> AsyncIterator[Tuple[str, Any]]:
+    """Yield (key, item) pairs from all streams as they arrive, consuming the streams concurrently.
+
+    A stream that fails is logged and dropped; the others keep going.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffered)
+
+    async def pump(key: str, stream: AsyncIterator[Any]):
+        try:
+            async for item in stream:
+                await queue.put((key, item))
+        except Exception as e:
+            logger.error("Discovery in %s failed: %s", key, e)
+        await queue.put(_STREAM_DONE)
+
+    tasks = [asyncio.create_task(pump(key, stream)) for key, stream in streams.items()]
+    running = len(tasks)
+    try:
+        while running:
+            item = await queue.get()
+            if item is _STREAM_DONE:
+                running -= 1
+                continue
+            yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+from kubernetes.client.rest import ApiException
+
+from utils.k8s_client import ThrottledK8sClient
+
+logger = logging.getLogger(__name__)
+
+ADDED = "added"
+MODIFIED = "modified"
+REMOVED = "removed"
+
+
+@dataclass
+class InventoryEvent:
+    """Change of a single ingress; `previous` is the version before a modification or removal."""
+    type: str
+    key: str
+    ingress: Any
+    previous: Any = None
+
+
+def ingress_key(ingress: Any) -> str:
+    return f"{ingress.metadata.namespace}/{ingress.metadata.name}"
+
+
+def ingress_hosts(ingress: Any) -> Set[str]:
+    if ingress is None:
+        return set()
+    rules = getattr(ingress.spec, "rules", []) or []
+    return {rule.host for rule in rules if getattr(rule, "host", None)}
+
+
+def _resource_version(obj: Any) -> Optional[str]:
+    return getattr(obj.metadata, "resource_version", None)
+
+
+class IngressInventory:
+    """In-memory ingress inventory kept current with a list followed by resourceVersion watches.
+
+    events() yields an ADDED event per ingress for the initial list and afterwards one event per
+    change. When the watch can no longer resume (410 Gone) the inventory is relisted and the
+    differences to the known state are emitted, so consumers never miss a change.
+    """
+
+    def __init__(
+        self,
+        k8s: ThrottledK8sClient,
+        watch_timeout_seconds: int = 300,
+        retry_delay: float = 5.0,
+    ):
+        self.k8s = k8s
+        self.watch_timeout_seconds = watch_timeout_seconds
+        self.retry_delay = retry_delay
+        self.items: Dict[str, Any] = {}
+        self.resource_version: Optional[str] = None
+
+    async def relist(self) -> List[InventoryEvent]:
+        """Replace the inventory with a fresh list and return what changed."""
+        ingresses, resource_version = await self.k8s.snapshot_ingresses(slim=True)
+        current = {ingress_key(ingress): ingress for ingress in ingresses}
+        events = []
+        for key, ingress in current.items():
+            previous = self.items.get(key)
+            if previous is None:
+                events.append(InventoryEvent(ADDED, key, ingress))
+            elif _resource_version(previous) != _resource_version(ingress):
+                events.append(InventoryEvent(MODIFIED, key, ingress, previous))
+        for key, previous in self.items.items():
+            if key not in current:
+                events.append(InventoryEvent(REMOVED, key, previous, previous))
+        self.items = current
+        self.resource_version = resource_version
+        logger.info("Ingress inventory listed: %s ingresses, %s changes", len(current), len(events))
+        return events
+
+    def apply(self, event_type: str, ingress: Any) -> Optional[InventoryEvent]:
+        """Apply a watch event to the inventory; returns None for bookmarks and no-op events."""
+        version = _resource_version(ingress)
+        if version:
+            self.resource_version = version
+        if event_type == "BOOKMARK":
+            return None
+        key = ingress_key(ingress)
+        previous = self.items.get(key)
+        if event_type == "DELETED":
+            if previous is None:
+                return None
+            del self.items[key]
+            return InventoryEvent(REMOVED, key, ingress, previous)
+        self.items[key] = ingress
+        if previous is None:
+            return InventoryEvent(ADDED, key, ingress)
+        if _resource_version(previous) == version:
+            return None
+        return InventoryEvent(MODIFIED, key, ingress, previous)
+
+    async def events(self) -> AsyncIterator[InventoryEvent]:
+        """Yield inventory changes forever, starting with the initial list."""
+        for event in await self.relist():
+            yield event
+        while True:
+            try:
+                async for event_type, ingress in self.k8s.watch_ingresses(
+                    self.resource_version,
+                    timeout_seconds=self.watch_timeout_seconds,
+                ):
+                    event = self.apply(event_type, ingress)
+                    if event is not None:
+                        yield event
+                # the server closed the watch after its timeout; resume from the last resourceVersion
+            except ApiException as e:
+                if e.status == 410:
+                    logger.info("Ingress watch expired at resourceVersion %s, relisting", self.resource_version)
+                    for event in await self.relist():
+                        yield event
+                    continue
+                logger.warning("Ingress watch failed (%s), reconnecting in %ss", e.status, self.retry_delay)
+                await asyncio.sleep(self.retry_delay)
+            except Exception as e:
+                logger.warning("Ingress watch failed (%s), reconnecting in %ss", e, self.retry_delay)
+                await asyncio.sleep(self.retry_delay)
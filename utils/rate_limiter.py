@@ -1,30 +1,124 @@
 import asyncio
+import heapq
 import time
 from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+
+@dataclass
+class RateLimiterStats:
+    granted: int = 0
+    waited: int = 0  # acquisitions that had to queue
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    timer_wakeups: int = 0
+
+    @property
+    def average_wait(self) -> float:
+        return self.total_wait / self.waited if self.waited else 0.0
 
 
 @dataclass
 class RateLimiter:
-    """Token bucket rate limiter."""
+    """Token bucket rate limiter.
+
+    Callers that cannot be served right away wait in a queue ordered by priority (lower first)
+    and arrival; a single timer wakes up when the head of the queue can be served, so every
+    waiter is woken exactly once, when its tokens are granted. A rate of 0 or less disables
+    the limit.
+    """
     requests_per_second: float = 2.0
     burst: int = 5
     _tokens: float = field(init=False)
     _last_refill: float = field(init=False)
+    stats: RateLimiterStats = field(init=False)
 
     def __post_init__(self):
         self._tokens = float(self.burst)
         self._last_refill = time.monotonic()
+        self.stats = RateLimiterStats()
+        # heap of (priority, arrival, tokens, enqueue time, future)
+        self._waiters: List[Tuple[int, int, float, float, asyncio.Future]] = []
+        self._arrivals = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def queue_length(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter[4].done())
+
+    def _refill(self, cap: bool = True):
+        now = time.monotonic()
+        self._tokens += (now - self._last_refill) * self.requests_per_second
+        if cap:
+            self._tokens = min(self.burst, self._tokens)
+        self._last_refill = now
+
+    def _grant(self, tokens: float, waited: Optional[float] = None):
+        self._tokens -= tokens
+        self.stats.granted += 1
+        if waited is not None:
+            self.stats.waited += 1
+            self.stats.total_wait += waited
+            self.stats.max_wait = max(self.stats.max_wait, waited)
+
+    async def acquire(self, n: float = 1, priority: int = 0):
+        """Take n tokens, waiting behind earlier callers of the same or a lower priority value."""
+        if self.requests_per_second <= 0:
+            return
+        if n > self.burst:
+            raise ValueError(f"Cannot acquire {n} tokens from a bucket holding at most {self.burst}")
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # waiters and the timer of a previous event loop can never be served
+            self._waiters = []
+            self._timer = None
+            self._loop = loop
+
+        # while callers are queued the tokens accrued for them must not be cut at the burst size
+        self._refill(cap=not self._waiters)
+        if not self._waiters and self._tokens >= n:
+            self._grant(n)
+            return
+
+        future = loop.create_future()
+        self._arrivals += 1
+        heapq.heappush(self._waiters, (priority, self._arrivals, n, time.monotonic(), future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # granted just before the cancellation; hand the tokens to the next waiter
+                self._tokens += n
+            self._dispatch()
+            raise
 
-    async def acquire(self):
-        while True:
-            now = time.monotonic()
-            elapsed = now - self._last_refill
-            self._tokens = min(self.burst, self._tokens + elapsed * self.requests_per_second)
-            self._last_refill = now
+    def _on_timer(self):
+        self._timer = None
+        self.stats.timer_wakeups += 1
+        self._dispatch()
 
-            if self._tokens >= 1.0:
-                self._tokens -= 1.0
-                return
+    def _dispatch(self):
+        """Serve waiters from the head of the queue and set the timer for the next one."""
+        # tokens accrued while callers were queued belong to them even beyond the burst size,
+        #   otherwise every late timer wakeup would lower the rate
+        self._refill(cap=False)
+        while self._waiters:
+            priority, arrival, tokens, enqueued, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self._tokens < tokens:
+                break
+            heapq.heappop(self._waiters)
+            self._grant(tokens, time.monotonic() - enqueued)
+            future.set_result(None)
+        self._tokens = min(self.burst, self._tokens)
 
-            wait = (1.0 - self._tokens) / self.requests_per_second
-            await asyncio.sleep(wait)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._waiters:
+            wait = (self._waiters[0][2] - self._tokens) / self.requests_per_second
+            self._timer = self._loop.call_later(max(wait, 0.0), self._on_timer)
@@ -0,0 +1,141 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    body_hash TEXT NOT NULL,
+    body TEXT NOT NULL,
+    encoding TEXT,
+    size INTEGER NOT NULL,
+    validated REAL NOT NULL
+)
+"""
+
+
+def body_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8", errors="replace")).hexdigest()
+
+
+@dataclass
+class CachedResponse:
+    url: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    body_hash: str
+    text: str
+    encoding: Optional[str]
+    validated: float
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """SQLite file keeping validators (ETag, Last-Modified) and bodies of fetched pages between runs.
+
+    An entry that has not been stored or revalidated for max_age seconds is dropped, and the
+    least recently validated entries go first once the bodies exceed max_bytes. The database
+    is small and local, so it is used directly from the event loop; writes are committed
+    in batches and on close.
+    """
+
+    def __init__(self, path: str, max_age: float = 7 * 24 * 3600, max_bytes: int = 100 * 1024 * 1024, commit_every: int = 50):
+        self.path = path
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.commit_every = commit_every
+        self.hits = 0
+        self._pending = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        try:
+            self._db = self._open()
+        except sqlite3.DatabaseError as e:
+            logger.warning("Recreating unreadable HTTP cache %s: %s", path, e)
+            os.remove(path)
+            self._db = self._open()
+        self.evict()
+
+    def _open(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path)
+        db.execute(_SCHEMA)
+        return db
+
+    def lookup(self, url: str) -> Optional[CachedResponse]:
+        row = self._db.execute(
+            "SELECT url, etag, last_modified, body_hash, body, encoding, validated FROM responses WHERE url = ?",
+            (url,),
+        ).fetchone()
+        if row is None or time.time() - row[6] > self.max_age:
+            return None
+        return CachedResponse(*row)
+
+    def store(self, url: str, etag: Optional[str], last_modified: Optional[str], text: str, encoding: Optional[str]):
+        """Keep a complete 200 response; only responses with a validator can be revalidated later.
+
+        A body equal to the stored one (same hash) is not written again, only its validators are.
+        """
+        if not etag and not last_modified:
+            self._db.execute("DELETE FROM responses WHERE url = ?", (url,))
+            self._written()
+            return
+        digest = body_hash(text)
+        row = self._db.execute("SELECT body_hash FROM responses WHERE url = ?", (url,)).fetchone()
+        if row is not None and row[0] == digest:
+            self._db.execute(
+                "UPDATE responses SET etag = ?, last_modified = ?, encoding = ?, validated = ? WHERE url = ?",
+                (etag, last_modified, encoding, time.time(), url),
+            )
+        else:
+            size = len(text.encode("utf-8", errors="replace"))
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, digest, text, encoding, size, time.time()),
+            )
+        self._written()
+
+    def revalidated(self, url: str):
+        """The server answered 304 for `url`: the entry is fresh again."""
+        self.hits += 1
+        self._db.execute("UPDATE responses SET validated = ? WHERE url = ?", (time.time(), url))
+        self._written()
+
+    def _written(self):
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self._db.commit()
+            self._pending = 0
+
+    def evict(self):
+        """Drop entries older than max_age, then the least recently validated ones beyond max_bytes."""
+        self._db.execute("DELETE FROM responses WHERE validated < ?", (time.time() - self.max_age,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.max_bytes:
+            drop = []
+            for url, size in self._db.execute("SELECT url, size FROM responses ORDER BY validated"):
+                if total <= self.max_bytes:
+                    break
+                drop.append((url,))
+                total -= size
+            self._db.executemany("DELETE FROM responses WHERE url = ?", drop)
+        self._db.commit()
+        self._pending = 0
+
+    def close(self):
+        self.evict()
+        self._db.close()
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+@dataclass
+class SchedulerStats:
+    queued: int = 0  # items taken from the source that wait for a free slot
+    in_flight: int = 0
+    completed: int = 0
+    failed: int = 0
+    peak_in_flight: int = 0
+
+
+class BoundedScheduler:
+    """Worker pool running a coroutine function over items with a bounded number in flight.
+
+    A new item starts as soon as a slot frees up; there are no batch barriers. Items can come
+    from a plain or an async iterable, the latter is consumed only as fast as slots free up.
+    With report_interval > 0 the queue depth and in-flight count are logged periodically.
+    """
+
+    def __init__(self, max_in_flight: int = 10, report_interval: float = 0):
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.report_interval = report_interval
+        self.stats = SchedulerStats()
+
+    async def map(
+        self,
+        func: Callable[[Any], Awaitable[Any]],
+        items: Union[Iterable[Any], AsyncIterable[Any]],
+        ordered: bool = True,
+    ) -> AsyncIterator[Tuple[Any, Any]]:
+        """Yield (item, result) pairs; an exception raised by func is yielded as the result.
+
+        Pairs come in input order, or with ordered=False as soon as each item finishes.
+        An exception raised by the source itself is re-raised after the items read before it.
+        """
+        stats = self.stats = SchedulerStats()
+        loop = asyncio.get_running_loop()
+        # up to max_in_flight items wait for a worker, so the source is read ahead only that far
+        pending: asyncio.Queue = asyncio.Queue(self.max_in_flight)
+        # (item, future) pairs in input order (ordered) or completion order, then _END
+        results: asyncio.Queue = asyncio.Queue()
+        source_error = None
+
+        async def put(item):
+            future = loop.create_future()
+            if ordered:
+                results.put_nowait((item, future))
+            stats.queued += 1
+            await pending.put((item, future))
+
+        async def worker():
+            while True:
+                entry = await pending.get()
+                if entry is _END:
+                    return
+                item, future = entry
+                stats.queued -= 1
+                stats.in_flight += 1
+                stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+                try:
+                    future.set_result(await func(item))
+                except Exception as e:
+                    stats.failed += 1
+                    future.set_result(e)
+                finally:
+                    stats.in_flight -= 1
+                    stats.completed += 1
+                if not ordered:
+                    results.put_nowait((item, future))
+
+        async def feed():
+            nonlocal source_error
+            try:
+                if hasattr(items, "__aiter__"):
+                    async for item in items:
+                        await put(item)
+                else:
+                    for item in items:
+                        await put(item)
+            except Exception as e:
+                source_error = e
+            for _ in workers:
+                await pending.put(_END)
+            await asyncio.gather(*workers)
+            results.put_nowait(_END)
+
+        async def report():
+            while True:
+                await asyncio.sleep(self.report_interval)
+                logger.info(
+                    "Scheduler: %s queued, %s in flight, %s completed (%s failed)",
+                    stats.queued, stats.in_flight, stats.completed, stats.failed,
+                )
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.max_in_flight)]
+        tasks = workers + [asyncio.create_task(feed())]
+        if self.report_interval > 0:
+            tasks.append(asyncio.create_task(report()))
+        try:
+            while True:
+                entry = await results.get()
+                if entry is _END:
+                    break
+                item, future = entry
+                yield item, await future
+            if source_error is not None:
+                raise source_error
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)